@@ -0,0 +1,444 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+# Os módulos do pipeline (revisor, classificacao, conexao_banco) leem a configuração no import:
+# eles só são importados depois que o ambiente aponta para os stand-ins locais.
+
+# -----------------------------------------------------------
+# I. PERFIS DOS STAND-INS (Latência e taxa de erro por serviço)
+# -----------------------------------------------------------
+
+SERVICOS = ("astra", "chat", "embeddings", "gemini")
+
+
+@dataclass
+class PerfilServico:
+    """
+    Comportamento de um stand-in: latência log-normal (mediana + dispersão) e fração
+    de respostas com erro. Para o chat em streaming, a latência vale até o primeiro
+    trecho; os seguintes chegam a cada `intervalo_trechos_s`.
+    """
+    mediana_s: float
+    sigma: float = 0.5
+    taxa_erro: float = 0.0
+    status_erro: int = 503
+    intervalo_trechos_s: float = 0.0
+
+    def amostrar_latencia(self) -> float:
+        return random.lognormvariate(0.0, self.sigma) * self.mediana_s if self.mediana_s > 0 else 0.0
+
+    def sortear_erro(self) -> bool:
+        return random.random() < self.taxa_erro
+
+
+PERFIS_PADRAO = {
+    "astra": PerfilServico(mediana_s=0.08, sigma=0.4),
+    "chat": PerfilServico(mediana_s=0.6, sigma=0.5, intervalo_trechos_s=0.01),
+    "embeddings": PerfilServico(mediana_s=0.12, sigma=0.4),
+    "gemini": PerfilServico(mediana_s=0.25, sigma=0.5),
+}
+
+DIMENSAO_EMBEDDING = 1536
+
+RESPOSTA_REVISAO = (
+    "O manejo integrado de pragas na soja combina monitoramento semanal, controle biológico "
+    "e aplicação de defensivos apenas quando o nível de dano econômico é atingido.\n\n"
+    "🛠️ Ajustes Técnicos e Correções\n"
+    "- Termo 'veneno' substituído por 'defensivo agrícola'.\n"
+    "- Incluída a referência ao nível de dano econômico."
+)
+
+
+def _vetor_deterministico(texto: str, dimensao: int) -> List[float]:
+    """Vetor pseudoaleatório estável para o texto (o mesmo texto sempre gera o mesmo vetor)."""
+    semente = int.from_bytes(hashlib.sha256(texto.encode("utf-8")).digest()[:8], "big")
+    gerador = random.Random(semente)
+    return [gerador.uniform(-1.0, 1.0) for _ in range(dimensao)]
+
+
+def _dimensao_consulta(sort: Dict) -> Optional[int]:
+    """Dimensão do $vector do 'find' (lista JSON ou {"$binary": float32 big-endian}); None se malformado."""
+    vetor = sort.get("$vector")
+    if isinstance(vetor, dict) and "$binary" in vetor:
+        dados = base64.b64decode(vetor["$binary"])
+        if len(dados) % 4:
+            return None
+        struct.unpack(f">{len(dados) // 4}f", dados)
+        return len(dados) // 4
+    if isinstance(vetor, list) and all(isinstance(v, (int, float)) for v in vetor):
+        return len(vetor)
+    return None
+
+
+# -----------------------------------------------------------
+# II. SERVIDOR HTTP LOCAL (Astra find, OpenAI chat/embeddings, Gemini)
+# -----------------------------------------------------------
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive, como nos serviços reais
+    perfis: Dict[str, PerfilServico] = PERFIS_PADRAO
+
+    def log_message(self, *args) -> None:
+        pass # Sem uma linha de log por requisição
+
+    def _ler_corpo(self) -> Dict:
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(tamanho) or b"{}")
+
+    def _responder(self, status: int, corpo: Dict) -> None:
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _simular(self, servico: str) -> bool:
+        """Aplica a latência do perfil; retorna False (já respondendo com erro) se o sorteio indicar falha."""
+        perfil = self.perfis[servico]
+        time.sleep(perfil.amostrar_latencia())
+        if perfil.sortear_erro():
+            self._responder(perfil.status_erro, {"error": {"message": f"Erro simulado ({servico})", "code": perfil.status_erro}})
+            return False
+        return True
+
+    def do_GET(self) -> None:
+        # OpenAI: models.retrieve (verificação da chave)
+        if self.path.startswith("/v1/models/"):
+            self._responder(200, {"id": self.path.rsplit("/", 1)[-1], "object": "model", "created": 0, "owned_by": "stand-in"})
+        else:
+            self._responder(404, {"error": {"message": f"Rota desconhecida: {self.path}"}})
+
+    def do_POST(self) -> None:
+        corpo = self._ler_corpo()
+        if self.path.startswith("/api/json/v1/"):
+            self._astra_find(corpo)
+        elif self.path == "/v1/embeddings":
+            self._openai_embeddings(corpo)
+        elif self.path == "/v1/chat/completions":
+            self._openai_chat(corpo)
+        elif ":generateContent" in self.path:
+            self._gemini_generate(corpo)
+        else:
+            self._responder(404, {"error": {"message": f"Rota desconhecida: {self.path}"}})
+
+    def _astra_find(self, corpo: Dict) -> None:
+        if not self._simular("astra"):
+            return
+        opcoes = corpo.get("find", {}).get("options", {})
+        colecao = self.path.rsplit("/", 1)[-1]
+        if "sort" in corpo.get("find", {}) and not _dimensao_consulta(corpo["find"]["sort"]):
+            self._responder(400, {"errors": [{"message": "$vector inválido no sort", "errorCode": "SHRED_BAD_VECTOR_VALUE"}]})
+            return
+        documentos = [
+            {
+                "_id": f"{colecao}-{i}",
+                "content": f"Documento de referência {i} da coleção {colecao}. " * 20,
+                "$similarity": round(0.95 - i * 0.02, 4),
+            }
+            for i in range(opcoes.get("limit", 6))
+        ]
+        self._responder(200, {"data": {"documents": documentos, "nextPageState": None}})
+
+    def _openai_embeddings(self, corpo: Dict) -> None:
+        if not self._simular("embeddings"):
+            return
+        entradas = corpo["input"] if isinstance(corpo["input"], list) else [corpo["input"]]
+        dimensao = corpo.get("dimensions", DIMENSAO_EMBEDDING)
+        tokens = sum(len(t) // 4 + 1 for t in entradas)
+        self._responder(200, {
+            "object": "list",
+            "model": corpo.get("model"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": _vetor_deterministico(t, dimensao)}
+                for i, t in enumerate(entradas)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _openai_chat(self, corpo: Dict) -> None:
+        if not self._simular("chat"):
+            return
+        tokens_prompt = sum(len(m.get("content", "")) // 4 + 1 for m in corpo.get("messages", []))
+        tokens_resposta = len(RESPOSTA_REVISAO) // 4 + 1
+        uso = {"prompt_tokens": tokens_prompt, "completion_tokens": tokens_resposta, "total_tokens": tokens_prompt + tokens_resposta}
+        base = {"id": "chatcmpl-standin", "created": int(time.time()), "model": corpo.get("model")}
+
+        if not corpo.get("stream"):
+            self._responder(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": RESPOSTA_REVISAO}, "finish_reason": "stop"}],
+                "usage": uso,
+            })
+            return
+
+        # Streaming (SSE): sem Content-Length, a conexão é fechada ao final
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        intervalo = self.perfis["chat"].intervalo_trechos_s
+        palavras = RESPOSTA_REVISAO.split(" ")
+        for i, palavra in enumerate(palavras):
+            trecho = palavra if i == len(palavras) - 1 else palavra + " "
+            evento = {**base, "object": "chat.completion.chunk",
+                      "choices": [{"index": 0, "delta": {"content": trecho}, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            if intervalo:
+                time.sleep(intervalo)
+        if corpo.get("stream_options", {}).get("include_usage"):
+            evento = {**base, "object": "chat.completion.chunk", "choices": [], "usage": uso}
+            self.wfile.write(f"data: {json.dumps(evento)}\n\n".encode("utf-8"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _gemini_generate(self, corpo: Dict) -> None:
+        if not self._simular("gemini"):
+            return
+        texto = json.dumps(corpo, ensure_ascii=False).lower()
+        categoria = "PRODUTO" if "orondis" in texto.split("texto para classificar")[-1] else "CULTURA"
+        self._responder(200, {
+            "candidates": [{"content": {"parts": [{"text": categoria}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": len(texto) // 4, "candidatesTokenCount": 1, "totalTokenCount": len(texto) // 4 + 1},
+        })
+
+
+class StandIns:
+    """Sobe os stand-ins em uma porta local livre (thread em segundo plano)."""
+    def __init__(self, perfis: Optional[Dict[str, PerfilServico]] = None, porta: int = 0):
+        handler = type("StandInHandler", (_StandInHandler,), {"perfis": perfis or PERFIS_PADRAO})
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+        self.servidor.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.servidor.server_address[1]}"
+        self._thread = threading.Thread(target=self.servidor.serve_forever, daemon=True)
+
+    def __enter__(self) -> "StandIns":
+        self._thread.start()
+        print(f"✅ Stand-ins locais em: {self.url}")
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+def configurar_ambiente(url: str) -> None:
+    """Aponta o pipeline para os stand-ins (precisa rodar antes de importar o revisor)."""
+    diretorio = tempfile.mkdtemp(prefix="revisor-benchmark-")
+    os.environ.update({
+        "OPENAI_API_KEY": "sk-standin",
+        "OPENAI_BASE_URL": f"{url}/v1",
+        "GEMINI_API_KEY": "standin",
+        "GEMINI_API_ENDPOINT": url,
+        "ASTRA_DB_API_ENDPOINT": url,
+        "ASTRA_DB_APPLICATION_TOKEN": "standin",
+        "ASTRA_DB_NAMESPACE": "benchmark",
+        "VECTOR_BACKEND": "astra",
+        # Caches e índice léxico isolados e vazios: cada rodada mede o caminho completo
+        "REVISOR_CACHE_DIR": diretorio,
+        "INDICE_LEXICO_DIR": os.path.join(diretorio, "indice_lexico"),
+        "GENERATION_CACHE_ENABLED": "0",
+    })
+
+
+# -----------------------------------------------------------
+# III. CARGA (Concorrência crescente sobre o pipeline real)
+# -----------------------------------------------------------
+
+TEXTO_BASE = (
+    "Texto {n}: o produto ORONDIS® deve ser aplicado na soja quando aparecerem os primeiros sintomas, "
+    "sempre respeitando a dose indicada na bula e o intervalo de segurança antes da colheita."
+)
+INSTRUCAO_AJUSTE = "Mude o tom para formal."
+
+
+@dataclass
+class ResultadoNivel:
+    operacao: str
+    concorrencia: int
+    requisicoes: int
+    erros: int
+    duracao_s: float
+    latencias: List[float] = field(default_factory=list, repr=False)
+    etapas: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+    def resumo(self) -> Dict:
+        from lote import percentil
+        return {
+            "operacao": self.operacao,
+            "concorrencia": self.concorrencia,
+            "requisicoes": self.requisicoes,
+            "erros": self.erros,
+            "throughput_rps": self.requisicoes / self.duracao_s if self.duracao_s > 0 else 0.0,
+            "p50_s": percentil(self.latencias, 50),
+            "p95_s": percentil(self.latencias, 95),
+            "p99_s": percentil(self.latencias, 99),
+            "etapas": self.etapas,
+        }
+
+
+def _operacoes() -> Dict[str, Callable[[int], str]]:
+    from revisor import reescrever_revisor, ajuste_incremental
+    return {
+        # Textos distintos a cada chamada: nenhum cache (classificação, embedding) mascara a medição
+        "revisao": lambda n: reescrever_revisor(TEXTO_BASE.format(n=n), usar_cache=False),
+        "ajuste": lambda n: ajuste_incremental(TEXTO_BASE.format(n=n), INSTRUCAO_AJUSTE),
+    }
+
+
+def _resumo_etapas() -> Dict[str, Dict[str, float]]:
+    """p50/p95 por etapa e, se houver, o pico médio de memória por chamada da etapa."""
+    from metricas import metricas
+    snapshot = metricas.snapshot()
+    etapas: Dict[str, Dict[str, float]] = {}
+    for h in snapshot["histogramas"]:
+        if h["nome"] == "revisor_etapa_duracao_segundos":
+            etapas[h["rotulos"]["etapa"]] = {"chamadas": h["contagem"], "p50_s": h["p50"], "p95_s": h["p95"]}
+    for c in snapshot["contadores"]:
+        etapa = etapas.get(c["rotulos"].get("etapa"))
+        if c["nome"] == "revisor_memoria_pico_bytes_total" and etapa:
+            etapa["memoria_pico_media_bytes"] = c["valor"] / etapa["chamadas"]
+    return etapas
+
+
+def rodar_nivel(operacao: str, concorrencia: int, requisicoes: int, inicio_n: int = 0) -> ResultadoNivel:
+    """Dispara `requisicoes` chamadas com `concorrencia` simultâneas e mede cada uma."""
+    from revisor import PREFIXOS_ERRO
+    from metricas import metricas
+
+    executar = _operacoes()[operacao]
+    metricas.limpar()
+
+    def medir(n: int):
+        inicio = time.perf_counter()
+        try:
+            resultado = executar(n)
+            erro = resultado.startswith(PREFIXOS_ERRO)
+        except Exception:
+            erro = True
+        return time.perf_counter() - inicio, erro
+
+    inicio_nivel = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        medicoes = list(executor.map(medir, range(inicio_n, inicio_n + requisicoes)))
+    duracao = time.perf_counter() - inicio_nivel
+
+    return ResultadoNivel(
+        operacao=operacao,
+        concorrencia=concorrencia,
+        requisicoes=requisicoes,
+        erros=sum(1 for _, erro in medicoes if erro),
+        duracao_s=duracao,
+        latencias=[latencia for latencia, _ in medicoes],
+        etapas=_resumo_etapas(),
+    )
+
+
+def medir_alocacoes(operacao: str, requisicoes: int, inicio_n: int) -> Dict[str, Dict[str, float]]:
+    """Rodada sequencial com tracemalloc ativo: pico de memória por etapa sem mistura entre threads."""
+    tracemalloc.start()
+    try:
+        return rodar_nivel(operacao, 1, requisicoes, inicio_n).etapas
+    finally:
+        tracemalloc.stop()
+
+
+def rodar_benchmark(
+    niveis: List[int],
+    requisicoes: int,
+    operacoes: List[str],
+    perfis: Optional[Dict[str, PerfilServico]] = None,
+    alocacoes: bool = True
+) -> Dict:
+    """Sobe os stand-ins, aquece o pipeline e mede cada operação em cada nível de concorrência."""
+    with StandIns(perfis) as stand_ins:
+        configurar_ambiente(stand_ins.url)
+        _operacoes()["revisao"](-1) # Aquecimento: imports dos SDKs e criação dos clientes
+
+        relatorio = {"niveis": [], "alocacoes": {}}
+        n = 0
+        for operacao in operacoes:
+            for concorrencia in niveis:
+                resultado = rodar_nivel(operacao, concorrencia, requisicoes, inicio_n=n)
+                n += requisicoes
+                relatorio["niveis"].append(resultado.resumo())
+                _imprimir_nivel(relatorio["niveis"][-1])
+            if alocacoes:
+                relatorio["alocacoes"][operacao] = medir_alocacoes(operacao, min(requisicoes, 5), inicio_n=n)
+                n += requisicoes
+        return relatorio
+
+
+# -----------------------------------------------------------
+# IV. RELATÓRIO E LINHA DE COMANDO (main)
+# -----------------------------------------------------------
+
+def _imprimir_nivel(r: Dict) -> None:
+    print(
+        f"[{r['operacao']:>7}] concorrência {r['concorrencia']:>3} | {r['throughput_rps']:6.2f} req/s | "
+        f"p50 {r['p50_s']:.3f}s | p95 {r['p95_s']:.3f}s | p99 {r['p99_s']:.3f}s | erros {r['erros']}/{r['requisicoes']}"
+    )
+    for etapa, e in sorted(r["etapas"].items()):
+        print(f"            {etapa:<20} p50 {e['p50_s']:.3f}s | p95 {e['p95_s']:.3f}s ({e['chamadas']} chamadas)")
+
+
+def _imprimir_alocacoes(alocacoes: Dict[str, Dict[str, Dict[str, float]]]) -> None:
+    for operacao, etapas in alocacoes.items():
+        print(f"\n📦 Pico de memória por etapa ({operacao}, uma chamada por vez):")
+        for etapa, e in sorted(etapas.items()):
+            if "memoria_pico_media_bytes" in e:
+                print(f"   {etapa:<20} {e['memoria_pico_media_bytes'] / 1024:10.1f} KiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de revisão contra stand-ins locais (sem rede).")
+    parser.add_argument("--niveis", default="1,2,4,8,16", help="Níveis de concorrência, separados por vírgula")
+    parser.add_argument("--requisicoes", type=int, default=32, help="Chamadas por nível")
+    parser.add_argument("--operacao", choices=["revisao", "ajuste", "ambas"], default="ambas")
+    parser.add_argument("--sem-alocacoes", action="store_true", help="Pula a rodada com tracemalloc")
+    parser.add_argument("--json", help="Grava o relatório completo neste arquivo")
+    for servico in SERVICOS:
+        padrao = PERFIS_PADRAO[servico]
+        parser.add_argument(f"--latencia-{servico}", type=float, default=padrao.mediana_s, help=f"Latência mediana do {servico} (s)")
+        parser.add_argument(f"--sigma-{servico}", type=float, default=padrao.sigma, help=f"Dispersão log-normal da latência do {servico}")
+        parser.add_argument(f"--erro-{servico}", type=float, default=padrao.taxa_erro, help=f"Fração de respostas com erro do {servico}")
+    args = parser.parse_args()
+
+    perfis = {
+        servico: PerfilServico(
+            mediana_s=getattr(args, f"latencia_{servico}"),
+            sigma=getattr(args, f"sigma_{servico}"),
+            taxa_erro=getattr(args, f"erro_{servico}"),
+            intervalo_trechos_s=PERFIS_PADRAO[servico].intervalo_trechos_s,
+        )
+        for servico in SERVICOS
+    }
+    operacoes = ["revisao", "ajuste"] if args.operacao == "ambas" else [args.operacao]
+    niveis = [int(n) for n in args.niveis.split(",") if n.strip()]
+
+    relatorio = rodar_benchmark(niveis, args.requisicoes, operacoes, perfis, alocacoes=not args.sem_alocacoes)
+    _imprimir_alocacoes(relatorio["alocacoes"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Relatório gravado em: {args.json}")
+
+if __name__ == "__main__":
+    main()
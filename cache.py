@@ -0,0 +1,201 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO CACHE
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+CACHE_DIR = os.getenv("REVISOR_CACHE_DIR", ".cache")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "2000"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+# -----------------------------------------------------------
+# II. CLASSE SQLiteLRUCache (Armazenamento em disco com eviction LRU)
+# -----------------------------------------------------------
+
+class SQLiteLRUCache:
+    """
+    Cache chave/valor (bytes) persistido em SQLite, limitado por número de entradas.
+    Ao ultrapassar o limite, remove as entradas acessadas há mais tempo (LRU).
+    Com `ttl` (segundos), entradas mais antigas que isso são tratadas como ausentes.
+    """
+    def __init__(self, path: str, max_entries: int, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Uma única conexão compartilhada entre threads (protegida pelo lock)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " chave TEXT PRIMARY KEY,"
+            " valor BLOB NOT NULL,"
+            " ultimo_acesso REAL NOT NULL,"
+            " criado_em REAL NOT NULL DEFAULT 0)"
+        )
+        colunas = [row[1] for row in self._conn.execute("PRAGMA table_info(cache)")]
+        if "criado_em" not in colunas:
+            # Arquivos criados antes do suporte a TTL
+            self._conn.execute("ALTER TABLE cache ADD COLUMN criado_em REAL NOT NULL DEFAULT 0")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ultimo_acesso ON cache (ultimo_acesso)")
+
+    def get(self, chave: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT valor, criado_em FROM cache WHERE chave = ?", (chave,)).fetchone()
+            if row is None:
+                return None
+            agora = time.time()
+            if self.ttl is not None and agora - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+                return None
+            self._conn.execute("UPDATE cache SET ultimo_acesso = ? WHERE chave = ?", (agora, chave))
+            return row[0]
+
+    def set(self, chave: str, valor: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (chave, valor, ultimo_acesso, criado_em) VALUES (?, ?, ?, ?)",
+                (chave, sqlite3.Binary(valor), time.time(), time.time())
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM cache WHERE criado_em < ?", (time.time() - self.ttl,))
+        total = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excesso = total - self.max_entries
+        if excesso > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE chave IN ("
+                " SELECT chave FROM cache ORDER BY ultimo_acesso ASC LIMIT ?)",
+                (excesso,)
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+# -----------------------------------------------------------
+# III. CLASSE EmbeddingCache (Embeddings endereçados por conteúdo)
+# -----------------------------------------------------------
+
+class EmbeddingCache:
+    """
+    Cache de embeddings endereçado por conteúdo: a chave é o hash do modelo + texto.
+    Os vetores são guardados como float32 compacto (4 bytes por dimensão).
+    """
+    def __init__(self, path: Optional[str] = None, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.store = SQLiteLRUCache(path or os.path.join(CACHE_DIR, "embeddings.sqlite3"), max_entries)
+
+    @staticmethod
+    def chave(text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        valor = self.store.get(self.chave(text, model))
+        if valor is None:
+            return None
+        vetor = array("f")
+        vetor.frombytes(valor)
+        return vetor.tolist()
+
+    def set(self, text: str, model: str, embedding: List[float]) -> None:
+        self.store.set(self.chave(text, model), array("f", embedding).tobytes())
+
+
+# -----------------------------------------------------------
+# IV. CLASSE GenerationCache (Saída final do LLM)
+# -----------------------------------------------------------
+
+class GenerationCache:
+    """
+    Cache da geração final do LLM. A chave combina tudo que influencia a resposta:
+    hash do conteúdo, coleção, IDs dos documentos recuperados (em ordem), modelo e versão do prompt.
+    """
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_entries: int = GENERATION_CACHE_MAX_ENTRIES,
+        ttl: Optional[float] = GENERATION_CACHE_TTL
+    ):
+        self.store = SQLiteLRUCache(path or os.path.join(CACHE_DIR, "geracoes.sqlite3"), max_entries, ttl=ttl)
+
+    @staticmethod
+    def chave(content: str, colecao: str, doc_ids: List[str], model: str, versao_prompt: str) -> str:
+        partes = [
+            hashlib.sha256(content.encode("utf-8")).hexdigest(),
+            colecao,
+            "\x1f".join(doc_ids),
+            model,
+            versao_prompt,
+        ]
+        return hashlib.sha256("\x00".join(partes).encode("utf-8")).hexdigest()
+
+    def get(self, chave: str) -> Optional[str]:
+        valor = self.store.get(chave)
+        return valor.decode("utf-8") if valor is not None else None
+
+    def set(self, chave: str, texto: str) -> None:
+        self.store.set(chave, texto.encode("utf-8"))
+
+
+# -----------------------------------------------------------
+# V. CLASSE TTLResultCache (Memoização em memória com cache negativo)
+# -----------------------------------------------------------
+
+class TTLResultCache:
+    """
+    Memoização em memória com TTL e limite de entradas.
+    Falhas são guardadas à parte com um TTL curto (cache negativo), para que uma
+    indisponibilidade do provedor não vire uma tempestade de novas tentativas.
+    """
+    def __init__(self, ttl: float, max_entries: int, ttl_negativo: float):
+        self._positivos = TTLCache(maxsize=max_entries, ttl=ttl)
+        self._negativos = TTLCache(maxsize=max_entries, ttl=ttl_negativo)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, chave: str) -> Tuple[bool, Any]:
+        """Retorna (encontrado, valor)."""
+        with self._lock:
+            if chave in self._positivos:
+                self.hits += 1
+                return True, self._positivos[chave]
+            if chave in self._negativos:
+                self.negative_hits += 1
+                return True, self._negativos[chave]
+            self.misses += 1
+            return False, None
+
+    def set(self, chave: str, valor: Any, negativo: bool = False) -> None:
+        with self._lock:
+            if negativo:
+                self._negativos[chave] = valor
+            else:
+                self._negativos.pop(chave, None)
+                self._positivos[chave] = valor
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "entradas": len(self._positivos),
+                "entradas_negativas": len(self._negativos),
+            }
@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+import os
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from metricas import metricas
+from prazos import PrazoEsgotado, restante
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÃO
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+# Chamadas idênticas em andamento ao mesmo tempo compartilham uma única chamada ao provedor
+COALESCENCIA_ATIVA = os.getenv("COALESCENCIA_ATIVA", "1") not in ("0", "false", "False")
+
+
+def chave_coalescencia(*partes: str) -> str:
+    """Hash das entradas que identificam a chamada (modelo, prompt, texto, corpo da busca...)."""
+    return hashlib.sha256("\x00".join(partes).encode("utf-8")).hexdigest()
+
+
+# -----------------------------------------------------------
+# II. CLASSE Coalescedor (Single-flight para threads e corrotinas)
+# -----------------------------------------------------------
+
+class _Chamada:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado: Any = None
+        self.erro: Optional[BaseException] = None
+
+
+class Coalescedor:
+    """
+    Single-flight: enquanto uma chamada com a mesma (etapa, chave) estiver em andamento,
+    quem chega espera por ela e recebe o mesmo resultado (ou a mesma exceção) em vez de
+    repetir a chamada paga. Nada fica guardado depois que a chamada termina (isso é papel dos caches).
+    Threads e corrotinas são coalescidas separadamente (uma thread não espera por um event loop).
+    Quem espera respeita o próprio prazo; se a chamada compartilhada esgotou o prazo de quem a
+    iniciou, quem ainda tem tempo repete a chamada por conta própria.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chamadas: Dict[Tuple[str, str], _Chamada] = {}
+        self._tarefas: Dict[Tuple[int, str, str], asyncio.Future] = {}
+
+    def executar(self, etapa: str, chave: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        if not COALESCENCIA_ATIVA:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            chamada = self._chamadas.get((etapa, chave))
+            lider = chamada is None
+            if lider:
+                chamada = self._chamadas[(etapa, chave)] = _Chamada()
+
+        if not lider:
+            metricas.incrementar("revisor_chamadas_coalescidas_total", etapa=etapa)
+            if not chamada.evento.wait(restante()):
+                raise PrazoEsgotado(f"prazo da revisão esgotado esperando a etapa '{etapa}'")
+            if isinstance(chamada.erro, PrazoEsgotado) and restante() != 0.0:
+                return self.executar(etapa, chave, fn, *args, **kwargs)
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.resultado
+
+        try:
+            chamada.resultado = fn(*args, **kwargs)
+            return chamada.resultado
+        except BaseException as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                del self._chamadas[(etapa, chave)]
+            chamada.evento.set()
+
+    async def aexecutar(self, etapa: str, chave: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        if not COALESCENCIA_ATIVA:
+            return await fn(*args, **kwargs)
+
+        indice = (id(asyncio.get_running_loop()), etapa, chave)
+        tarefa = self._tarefas.get(indice)
+        if tarefa is None:
+            tarefa = asyncio.ensure_future(fn(*args, **kwargs))
+            self._tarefas[indice] = tarefa
+            tarefa.add_done_callback(lambda t: self._tarefas.pop(indice) if self._tarefas.get(indice) is t else None)
+        else:
+            metricas.incrementar("revisor_chamadas_coalescidas_total", etapa=etapa)
+        # shield: quem desiste (cancelamento, timeout) não cancela a chamada dos demais
+        try:
+            return await asyncio.wait_for(asyncio.shield(tarefa), timeout=restante())
+        except PrazoEsgotado:
+            # A tarefa leva o prazo de quem a criou: quem ainda tem tempo repete a chamada
+            if restante() == 0.0:
+                raise
+            return await self.aexecutar(etapa, chave, fn, *args, **kwargs)
+        except asyncio.TimeoutError:
+            raise PrazoEsgotado(f"prazo da revisão esgotado esperando a etapa '{etapa}'")
+
+
+_coalescedor = Coalescedor()
+
+
+def coalescer(etapa: str, chave: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Executa fn(*args, **kwargs), ou espera a chamada idêntica já em andamento em outra thread."""
+    return _coalescedor.executar(etapa, chave, fn, *args, **kwargs)
+
+
+async def acoalescer(etapa: str, chave: str, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+    """Variante para corrotinas: fn é uma função async; chamadas idênticas no mesmo event loop são compartilhadas."""
+    return await _coalescedor.aexecutar(etapa, chave, fn, *args, **kwargs)
@@ -1,16 +1,22 @@
+import asyncio
+import base64
+import random
+import sys
 import requests
 import json
-from typing import List, Dict
+import weakref
+from array import array
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator, List, Dict, Optional
 import os
 from dotenv import load_dotenv
-
-# 🚨 IMPORTANTE: Importa a função do arquivo classificacao.py
-try:
-    from classificacao import classificar_texto
-    print("✅ Módulo 'classificacao.py' importado com sucesso.")
-except ImportError:
-    print("❌ ERRO: O arquivo 'classificacao.py' deve estar no mesmo diretório para ser importado.")
-    exit()
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from coalescencia import coalescer, acoalescer, chave_coalescencia
+from limites import chamar, achamar
+from prazos import com_hedge, acom_hedge, limitar_timeout, restante, verificar_prazo
+from metricas import span
 
 # -----------------------------------------------------------
 # I. CHAVES E CONFIGURAÇÕES DO ASTRA DB
@@ -26,60 +32,511 @@ load_dotenv() # Carrega as variáveis do arquivo .env localmente
 ASTRA_DB_APPLICATION_TOKEN = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
 ASTRA_DB_API_ENDPOINT = os.getenv("ASTRA_DB_API_ENDPOINT")
 ASTRA_DB_NAMESPACE = os.getenv("ASTRA_DB_NAMESPACE")
+
+# Pool de conexões HTTP e política de novas tentativas
+ASTRA_DB_POOL_SIZE = int(os.getenv("ASTRA_DB_POOL_SIZE", "10"))
+ASTRA_DB_MAX_RETRIES = int(os.getenv("ASTRA_DB_MAX_RETRIES", "3"))
+ASTRA_DB_BACKOFF = float(os.getenv("ASTRA_DB_BACKOFF", "0.5"))
+ASTRA_DB_BACKOFF_JITTER = float(os.getenv("ASTRA_DB_BACKOFF_JITTER", "0.5"))
+ASTRA_DB_CONNECT_TIMEOUT = float(os.getenv("ASTRA_DB_CONNECT_TIMEOUT", "5"))
+ASTRA_DB_READ_TIMEOUT = float(os.getenv("ASTRA_DB_READ_TIMEOUT", "30"))
+
+# Por padrão o $vector (1536 floats, ~30 KB de JSON por documento) não volta na busca
+DEFAULT_PROJECTION = {"$vector": 0}
+
+# Vetor da consulta em binário ({"$binary": base64 de float32 big-endian}): ~8 KB em vez de ~30 KB
+# de texto decimal para 1536 dimensões, e o Data API não precisa interpretar os números
+ASTRA_DB_VETOR_BINARIO = os.getenv("ASTRA_DB_VETOR_BINARIO", "1") not in ("0", "false", "False")
+
+
+def _ler_dimensoes(valor: str) -> Dict[str, int]:
+    """'PRODUTO_512:512,CULTURA:1536' -> {'PRODUTO_512': 512, 'CULTURA': 1536}"""
+    dimensoes = {}
+    for item in valor.split(","):
+        if ":" in item:
+            colecao, dimensao = item.rsplit(":", 1)
+            dimensoes[colecao.strip()] = int(dimensao)
+    return dimensoes
+
+
+# Dimensão esperada dos vetores por coleção; as coleções fora da lista não são verificadas aqui
+ASTRA_DB_DIMENSOES = _ler_dimensoes(os.getenv("ASTRA_DB_DIMENSOES", ""))
+
+# Campos de texto mais comuns nas coleções (em ordem de preferência)
+CAMPOS_TEXTO = ("content", "text", "page_content", "conteudo", "texto")
+
+def dimensao_colecao(collection: str) -> Optional[int]:
+    """Dimensão configurada para a coleção (ASTRA_DB_DIMENSOES), ou None se não houver."""
+    return ASTRA_DB_DIMENSOES.get(collection)
+
+
+def codificar_vetor(vector: List[float]) -> Dict[str, str]:
+    """Vetor no formato binário do Data API: float32 big-endian em base64."""
+    dados = array("f", vector)
+    if sys.byteorder == "little":
+        dados.byteswap()
+    return {"$binary": base64.b64encode(dados.tobytes()).decode("ascii")}
+
+
+def decodificar_vetor(valor: Any) -> List[float]:
+    """Inverso de codificar_vetor; listas (o formato JSON comum) passam direto."""
+    if isinstance(valor, dict) and "$binary" in valor:
+        dados = array("f")
+        dados.frombytes(base64.b64decode(valor["$binary"]))
+        if sys.byteorder == "little":
+            dados.byteswap()
+        return dados.tolist()
+    return valor
+
+
+def corpo_busca_vetorial(
+    collection: str,
+    vector: List[float],
+    limit: int,
+    projection: Optional[Dict[str, int]],
+    include_similarity: bool
+) -> Optional[str]:
+    """Corpo JSON do 'find' por similaridade (None se o vetor não tiver a dimensão da coleção)."""
+    esperada = dimensao_colecao(collection)
+    if esperada is not None and len(vector) != esperada:
+        print(f"❌ Busca vetorial abortada: vetor com {len(vector)} dimensões, a coleção '{collection}' espera {esperada}.")
+        return None
+    payload = {
+        "find": {
+            "sort": {"$vector": codificar_vetor(vector) if ASTRA_DB_VETOR_BINARIO else vector},
+            "projection": projection if projection is not None else DEFAULT_PROJECTION,
+            "options": {"limit": limit, "includeSimilarity": include_similarity}
+        }
+    }
+    # Serializa uma única vez (para medir os bytes enviados e identificar buscas idênticas)
+    return json.dumps(payload)
+
+
 # -----------------------------------------------------------
-# II. CLASSE AstraDBClient (Do seu código anexo)
+# II. CLASSE SearchHit (Resultado tipado da busca vetorial)
 # -----------------------------------------------------------
 
+@dataclass
+class SearchHit:
+    """Documento retornado pela busca vetorial: id, campos (sem $vector) e score de similaridade."""
+    id: str
+    campos: Dict[str, Any] = field(default_factory=dict)
+    score: Optional[float] = None
+
+    @classmethod
+    def from_document(cls, doc: Dict) -> "SearchHit":
+        campos = {k: v for k, v in doc.items() if k != "_id" and not k.startswith("$")}
+        return cls(id=str(doc.get("_id", "")), campos=campos, score=doc.get("$similarity"))
+
+    @property
+    def texto(self) -> str:
+        """Texto do documento: o primeiro campo de texto conhecido ou, na falta dele, todos os campos string."""
+        for nome in CAMPOS_TEXTO:
+            valor = self.campos.get(nome)
+            if isinstance(valor, str) and valor.strip():
+                return valor
+        return "\n".join(f"{k}: {v}" for k, v in self.campos.items() if isinstance(v, str))
+
+
+# -----------------------------------------------------------
+# III. CLASSE AstraDBClient (Do seu código anexo)
+# -----------------------------------------------------------
+
+class RetryNoPrazo(Retry):
+    """Retry do urllib3 que não espera além do prazo da revisão nem tenta de novo depois dele."""
+    def get_backoff_time(self) -> float:
+        tempo = restante()
+        espera = super().get_backoff_time()
+        return espera if tempo is None else min(espera, tempo)
+
+    def is_exhausted(self) -> bool:
+        return super().is_exhausted() or restante() == 0.0
+
+
 class AstraDBClient:
-    """Classe wrapper para a conexão e busca no Astra DB."""
-    def __init__(self):
+    """
+    Classe wrapper para a conexão e busca no Astra DB.
+    Mantém uma sessão HTTP com pool de conexões (keep-alive) e novas tentativas
+    com backoff exponencial + jitter para 5xx. O 429 é tratado pela camada de limites
+    (limites.chamar), que respeita o Retry-After e reduz a concorrência.
+    """
+    def __init__(
+        self,
+        pool_size: int = ASTRA_DB_POOL_SIZE,
+        max_retries: int = ASTRA_DB_MAX_RETRIES,
+        connect_timeout: float = ASTRA_DB_CONNECT_TIMEOUT,
+        read_timeout: float = ASTRA_DB_READ_TIMEOUT
+    ):
         self.base_url = f"{ASTRA_DB_API_ENDPOINT}/api/json/v1/{ASTRA_DB_NAMESPACE}"
         self.headers = {
             "Content-Type": "application/json",
             "x-cassandra-token": ASTRA_DB_APPLICATION_TOKEN,
             "Accept": "application/json"
         }
-        print("✅ AstraDBClient inicializado.")
-        
-    def vector_search(self, collection: str, vector: List[float], limit: int = 6) -> List[Dict]:
-        """Realiza busca por similaridade vetorial na coleção especificada."""
+        self.timeout = (connect_timeout, read_timeout)
+
+        retry = RetryNoPrazo(
+            total=max_retries,
+            backoff_factor=ASTRA_DB_BACKOFF,
+            backoff_jitter=ASTRA_DB_BACKOFF_JITTER,
+            # O 429 fica com a camada de limites (limites.chamar): ela reduz a concorrência e reenfileira o pedido
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["POST"], # O 'find' do Data API é uma leitura idempotente
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        print(f"✅ AstraDBClient inicializado (pool de {pool_size} conexões).")
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Estatísticas de reuso de conexões do pool (requisições x conexões abertas)."""
+        requisicoes = 0
+        conexoes = 0
+        pools = self.adapter.poolmanager.pools
+        for chave in pools.keys():
+            pool = pools.get(chave)
+            if pool is None:
+                continue
+            requisicoes += pool.num_requests
+            conexoes += pool.num_connections
+        return {
+            "requisicoes": requisicoes,
+            "conexoes_abertas": conexoes,
+            "conexoes_reutilizadas": max(requisicoes - conexoes, 0)
+        }
+
+
+    def _enviar(self, url: str, **kwargs) -> requests.Response:
+        """POST na sessão; um 429 vira exceção para a camada de limites tentar de novo."""
+        verificar_prazo("astra")
+        # O timeout nunca passa do que resta do prazo da revisão
+        response = self.session.post(url, timeout=limitar_timeout(self.timeout), **kwargs)
+        if response.status_code == 429:
+            response.raise_for_status()
+        return response
+
+    def vector_search(
+        self,
+        collection: str,
+        vector: List[float],
+        limit: int = 6,
+        projection: Optional[Dict[str, int]] = None,
+        include_similarity: bool = True
+    ) -> List[SearchHit]:
+        """
+        Realiza busca por similaridade vetorial na coleção especificada.
+        A projeção padrão exclui o $vector; com include_similarity o score ($similarity) vem em cada hit.
+        """
         if not collection or collection == "ERRO":
             print("❌ Busca vetorial abortada: Coleção inválida ou erro na classificação.")
             return []
             
-        url = f"{self.base_url}/{collection}" 
-        payload = {
-            "find": {
-                "sort": {"$vector": vector},
-                "options": {"limit": limit}
-            }
-        }
-        
+        corpo = corpo_busca_vetorial(collection, vector, limit, projection, include_similarity)
+        if corpo is None:
+            return []
+        url = f"{self.base_url}/{collection}"
+        # Buscas idênticas em andamento (mesma coleção e mesmo corpo) viram uma só requisição
+        return list(coalescer("busca_vetorial", chave_coalescencia(url, corpo), self._buscar_vetorial, url, corpo, collection))
+
+    def _buscar_vetorial(self, url: str, corpo: str, collection: str) -> List[SearchHit]:
         print(f"\n--- Chamando Astra DB na Coleção: {collection} ---")
-        try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=30)
-            response.raise_for_status() 
-            data = response.json()
-            
-            documents = data.get("data", {}).get("documents", [])
-            print(f"✅ Busca realizada. Documentos retornados: {len(documents)}")
-            return documents
+        with span("busca_vetorial", colecao=collection) as atributos:
+            try:
+                atributos["bytes_enviados"] = len(corpo)
+                # A busca é idempotente: passando do p95, uma cópia é disparada e vale a primeira resposta
+                response = com_hedge("busca_vetorial", chamar, "astra", lambda: self._enviar(url, data=corpo))
+                atributos["bytes_recebidos"] = len(response.content)
+                response.raise_for_status() 
+                data = response.json()
+                
+                documents = data.get("data", {}).get("documents", [])
+                atributos["documentos"] = len(documents)
+                print(f"✅ Busca realizada. Documentos retornados: {len(documents)}")
+                return [SearchHit.from_document(doc) for doc in documents]
+
+            except requests.exceptions.HTTPError as e:
+                print(f"❌ ERRO HTTP na busca Astra DB (Status: {e.response.status_code}): {e}")
+                atributos["erros_http"] = 1
+                return []
+            except Exception as e:
+                print(f"❌ ERRO Geral na busca Astra DB: {str(e)}")
+                atributos["erros_http"] = 1
+                return []
+
+    def buscar_por_ids(
+        self,
+        collection: str,
+        ids: List[str],
+        projection: Optional[Dict[str, int]] = None
+    ) -> List[SearchHit]:
+        """
+        Busca documentos pelo _id (filtro $in, em lotes de 100), na ordem dos IDs pedidos.
+        Como a busca vetorial, erros são registrados e resultam em lista vazia.
+        """
+        if not ids:
+            return []
+        print(f"\n--- Buscando {len(ids)} documentos por ID na Coleção: {collection} ---")
+        with span("busca_por_ids", colecao=collection) as atributos:
+            try:
+                documentos = []
+                for i in range(0, len(ids), 100):
+                    documentos.extend(self.iterar_documentos(
+                        collection,
+                        filtro={"_id": {"$in": ids[i:i + 100]}},
+                        projection=projection if projection is not None else DEFAULT_PROJECTION
+                    ))
+            except Exception as e:
+                print(f"❌ ERRO na busca por ID no Astra DB: {str(e)}")
+                atributos["erros_http"] = 1
+                return []
+            atributos["documentos"] = len(documentos)
+
+        por_id = {str(doc.get("_id")): SearchHit.from_document(doc) for doc in documentos}
+        return [por_id[doc_id] for doc_id in ids if doc_id in por_id]
+
+    def iterar_documentos(
+        self,
+        collection: str,
+        filtro: Optional[Dict] = None,
+        projection: Optional[Dict[str, int]] = None
+    ) -> Iterator[Dict]:
+        """
+        Percorre todos os documentos da coleção (paginando via nextPageState).
+        Diferente da busca, erros são propagados: um snapshot parcial não deve passar por completo.
+        """
+        url = f"{self.base_url}/{collection}"
+        page_state = None
+        while True:
+            find: Dict[str, Any] = {}
+            if filtro:
+                find["filter"] = filtro
+            if projection is not None:
+                find["projection"] = projection
+            if page_state:
+                find["options"] = {"pageState": page_state}
+
+            response = chamar("astra", lambda: self._enviar(url, json={"find": find}))
+            response.raise_for_status()
+            data = response.json().get("data", {})
+
+            yield from data.get("documents", [])
+
+            page_state = data.get("nextPageState")
+            if not page_state:
+                break
+
+@lru_cache(maxsize=None)
+def get_astra_client() -> AstraDBClient:
+    """Cliente Astra DB compartilhado pelo processo, criado na primeira chamada."""
+    return AstraDBClient()
+
+
+# -----------------------------------------------------------
+# IV. CLASSE AsyncAstraDBClient (Mesma API, para corrotinas)
+# -----------------------------------------------------------
+
+# Status que merecem nova tentativa aqui (os mesmos da política do cliente síncrono; o 429 fica com limites.achamar)
+STATUS_RETENTAVEIS = (500, 502, 503, 504)
+
+
+class AsyncAstraDBClient:
+    """
+    Contraparte assíncrona do AstraDBClient (httpx.AsyncClient): mesmos métodos, spans e
+    tratamento de erros, com as novas tentativas para 5xx (backoff exponencial + jitter)
+    feitas aqui, já que o httpx não tem a política de retry do urllib3.
+    """
+    def __init__(
+        self,
+        pool_size: int = ASTRA_DB_POOL_SIZE,
+        max_retries: int = ASTRA_DB_MAX_RETRIES,
+        connect_timeout: float = ASTRA_DB_CONNECT_TIMEOUT,
+        read_timeout: float = ASTRA_DB_READ_TIMEOUT
+    ):
+        # O httpx só é importado aqui: quem usa apenas o cliente síncrono não depende dele
+        import httpx
+        self.base_url = f"{ASTRA_DB_API_ENDPOINT}/api/json/v1/{ASTRA_DB_NAMESPACE}"
+        self.max_retries = max_retries
+        self.timeout = (connect_timeout, read_timeout)
+        self.client = httpx.AsyncClient(
+            headers={
+                "Content-Type": "application/json",
+                "x-cassandra-token": ASTRA_DB_APPLICATION_TOKEN or "",
+                "Accept": "application/json"
+            },
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        print(f"✅ AsyncAstraDBClient inicializado (pool de {pool_size} conexões).")
 
-        except requests.exceptions.HTTPError as e:
-            print(f"❌ ERRO HTTP na busca Astra DB (Status: {response.status_code}): {e}")
+    async def _post(self, url: str, corpo: str):
+        """POST com novas tentativas para 5xx e falhas de conexão; a última resposta é devolvida."""
+        import httpx
+        for tentativa in range(self.max_retries + 1):
+            ultima = tentativa == self.max_retries
+            try:
+                response = await achamar("astra", lambda: self._enviar(url, corpo))
+            except httpx.TransportError:
+                if ultima:
+                    raise
+                await asyncio.sleep(self._espera_no_prazo(tentativa))
+                continue
+            if response.status_code not in STATUS_RETENTAVEIS or ultima:
+                return response
+            await asyncio.sleep(self._espera_no_prazo(tentativa, response.headers.get("Retry-After")))
+        return response
+
+    async def _enviar(self, url: str, corpo: str):
+        import httpx
+        verificar_prazo("astra")
+        connect, read = limitar_timeout(self.timeout)
+        response = await self.client.post(url, content=corpo, timeout=httpx.Timeout(read, connect=connect))
+        if response.status_code == 429:
+            response.raise_for_status()
+        return response
+
+    @staticmethod
+    def _espera(tentativa: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                pass
+        return ASTRA_DB_BACKOFF * (2 ** tentativa) + random.uniform(0, ASTRA_DB_BACKOFF_JITTER)
+
+    @classmethod
+    def _espera_no_prazo(cls, tentativa: int, retry_after: Optional[str] = None) -> float:
+        """A espera até a próxima tentativa, sem passar do prazo (aí o _enviar levanta PrazoEsgotado)."""
+        espera = cls._espera(tentativa, retry_after)
+        tempo = restante()
+        return espera if tempo is None else min(espera, tempo)
+
+    async def vector_search(
+        self,
+        collection: str,
+        vector: List[float],
+        limit: int = 6,
+        projection: Optional[Dict[str, int]] = None,
+        include_similarity: bool = True
+    ) -> List[SearchHit]:
+        """Mesma busca de AstraDBClient.vector_search, sem bloquear o event loop."""
+        if not collection or collection == "ERRO":
+            print("❌ Busca vetorial abortada: Coleção inválida ou erro na classificação.")
+            return []
+
+        corpo = corpo_busca_vetorial(collection, vector, limit, projection, include_similarity)
+        if corpo is None:
             return []
-        except Exception as e:
-            print(f"❌ ERRO Geral na busca Astra DB: {str(e)}")
+        url = f"{self.base_url}/{collection}"
+        return list(await acoalescer("busca_vetorial", chave_coalescencia(url, corpo), self._buscar_vetorial, url, corpo, collection))
+
+    async def _buscar_vetorial(self, url: str, corpo: str, collection: str) -> List[SearchHit]:
+        print(f"\n--- Chamando Astra DB na Coleção: {collection} (async) ---")
+        with span("busca_vetorial", colecao=collection) as atributos:
+            try:
+                atributos["bytes_enviados"] = len(corpo)
+                response = await acom_hedge("busca_vetorial", self._post, url, corpo)
+                atributos["bytes_recebidos"] = len(response.content)
+                response.raise_for_status()
+                documents = response.json().get("data", {}).get("documents", [])
+                atributos["documentos"] = len(documents)
+                print(f"✅ Busca realizada. Documentos retornados: {len(documents)}")
+                return [SearchHit.from_document(doc) for doc in documents]
+            except Exception as e:
+                print(f"❌ ERRO na busca Astra DB (async): {str(e)}")
+                atributos["erros_http"] = 1
+                return []
+
+    async def buscar_por_ids(
+        self,
+        collection: str,
+        ids: List[str],
+        projection: Optional[Dict[str, int]] = None
+    ) -> List[SearchHit]:
+        """Mesma busca de AstraDBClient.buscar_por_ids (lotes de 100, na ordem dos IDs pedidos)."""
+        if not ids:
             return []
+        print(f"\n--- Buscando {len(ids)} documentos por ID na Coleção: {collection} (async) ---")
+        with span("busca_por_ids", colecao=collection) as atributos:
+            try:
+                documentos = []
+                for i in range(0, len(ids), 100):
+                    async for doc in self.iterar_documentos(
+                        collection,
+                        filtro={"_id": {"$in": ids[i:i + 100]}},
+                        projection=projection if projection is not None else DEFAULT_PROJECTION
+                    ):
+                        documentos.append(doc)
+            except Exception as e:
+                print(f"❌ ERRO na busca por ID no Astra DB: {str(e)}")
+                atributos["erros_http"] = 1
+                return []
+            atributos["documentos"] = len(documentos)
+
+        por_id = {str(doc.get("_id")): SearchHit.from_document(doc) for doc in documentos}
+        return [por_id[doc_id] for doc_id in ids if doc_id in por_id]
+
+    async def iterar_documentos(
+        self,
+        collection: str,
+        filtro: Optional[Dict] = None,
+        projection: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[Dict]:
+        """Percorre a coleção paginando via nextPageState (erros são propagados, como no cliente síncrono)."""
+        url = f"{self.base_url}/{collection}"
+        page_state = None
+        while True:
+            find: Dict[str, Any] = {}
+            if filtro:
+                find["filter"] = filtro
+            if projection is not None:
+                find["projection"] = projection
+            if page_state:
+                find["options"] = {"pageState": page_state}
+
+            response = await self._post(url, json.dumps({"find": find}))
+            response.raise_for_status()
+            data = response.json().get("data", {})
+
+            for doc in data.get("documents", []):
+                yield doc
+
+            page_state = data.get("nextPageState")
+            if not page_state:
+                break
+
+    async def fechar(self) -> None:
+        await self.client.aclose()
+
+
+# O pool de conexões do httpx pertence ao event loop em que foi criado: um cliente por loop
+_clientes_async: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncAstraDBClient]" = weakref.WeakKeyDictionary()
+
 
-astra_client = AstraDBClient()
+async def aget_async_astra_client() -> AsyncAstraDBClient:
+    """
+    Cliente Astra DB assíncrono do event loop atual (criado na primeira chamada dentro dele).
+    Criá-lo (import do httpx, contexto SSL) bloqueia: a criação roda em uma thread.
+    """
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_async.get(loop)
+    if cliente is None:
+        novo = await asyncio.to_thread(AsyncAstraDBClient)
+        # Outra corrotina pode ter criado o cliente enquanto esta esperava a thread
+        cliente = _clientes_async.setdefault(loop, novo)
+    return cliente
 
 # -----------------------------------------------------------
-# III. TESTE PRINCIPAL (main)
+# V. TESTE PRINCIPAL (main)
 # -----------------------------------------------------------
 
 def main():
     """Função principal para testar a busca após a classificação."""
+    # 🚨 IMPORTANTE: Importa a função do arquivo classificacao.py (só o teste depende dela)
+    from classificacao import classificar_texto, CATEGORIAS_VALIDAS
 
     print("\n" + "=" * 70)
     print("--- Teste de Fluxo: Classificação (Gemini) -> Busca Astra DB ---")
@@ -98,7 +555,7 @@ def main():
     
     print(f"\n✅ COLEÇÃO IDENTIFICADA: {colecao_identificada}")
     
-    if colecao_identificada in ["PRODUTO", "CULTURA", "OUTROS"]:
+    if colecao_identificada in CATEGORIAS_VALIDAS:
         print(f"Iniciando busca na coleção: {colecao_identificada}")
     else:
         print(f"❌ Não foi possível identificar uma coleção válida. Abortando busca.")
@@ -110,7 +567,7 @@ def main():
     simulated_vector[0] = 0.01 
     
     # 4. Busca Vetorial Usando o Resultado da Classificação
-    documentos_encontrados = astra_client.vector_search(
+    documentos_encontrados = get_astra_client().vector_search(
         collection=colecao_identificada, 
         vector=simulated_vector, 
         limit=2
@@ -122,9 +579,8 @@ def main():
         print(f"Documentos encontrados: {len(documentos_encontrados)}")
         print("\n--- Conteúdo do 1º Documento (Vetor Omitido) ---")
         
-        doc_display = documentos_encontrados[0].copy()
-        if '$vector' in doc_display:
-            doc_display['$vector'] = "[Vetor Omitido]"
+        hit = documentos_encontrados[0]
+        doc_display = {"_id": hit.id, "$similarity": hit.score, **hit.campos}
             
         print(json.dumps(doc_display, indent=2, ensure_ascii=False))
         print("=" * 70)
@@ -0,0 +1,155 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Set
+from dotenv import load_dotenv
+
+from conexao_banco import SearchHit, get_astra_client
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO ÍNDICE LÉXICO
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+INDICE_LEXICO_DIR = os.getenv("INDICE_LEXICO_DIR", os.path.join(".cache", "indice_lexico"))
+COLECAO_PRODUTOS = "PRODUTO"
+
+# Nomes comerciais citados no prompt de classificação; outros podem vir de PRODUTOS_CONHECIDOS (separados por vírgula)
+PRODUTOS_CONHECIDOS = ["ORONDIS", "POLYTRIN", "Miravis Pro", "Yieldon", "Seeker", "Curyom"] + [
+    nome.strip() for nome in os.getenv("PRODUTOS_CONHECIDOS", "").split(",") if nome.strip()
+]
+
+# Campos com o nome comercial do produto: o valor inteiro é o nome. O corpo do documento não é indexado
+# (citar a marca de um concorrente não faz do documento a ficha daquele nome)
+CAMPOS_NOME = ("produto", "nome", "nome_comercial", "marca")
+# Campos próprios do ingrediente ativo (valor inteiro ou lista): 'oxatiapiprolina' acha a ficha do ORONDIS®
+CAMPOS_INGREDIENTE = ("ingrediente_ativo", "ingredientes_ativos", "principio_ativo", "principios_ativos")
+# Títulos ('Argumentário de vendas ORONDIS®'): deles entram só as marcas registradas e os PRODUTOS_CONHECIDOS
+CAMPOS_TITULO = ("titulo", "title")
+
+# Marca registrada no texto: 'ORONDIS®' e, com o complemento em maiúscula, 'Miravis® Pro'
+_MARCA = re.compile(r"(\w[\w\-]*)\s*[®™](?:[ \t]+([A-Z][\w\-]*))?")
+
+TAMANHO_MINIMO_NOME = 3
+
+
+def normalizar_nome(texto: str) -> str:
+    """Caixa, acentos, símbolos de marca e espaços normalizados: 'Miravis® Pro' -> 'miravis pro'."""
+    sem_acentos = unicodedata.normalize("NFKD", texto)
+    sem_acentos = "".join(c for c in sem_acentos if not unicodedata.combining(c))
+    sem_marcas = re.sub(r"[®™©]", " ", sem_acentos)
+    return " ".join(sem_marcas.casefold().split())
+
+
+def extrair_nomes(hit: SearchHit) -> Set[str]:
+    """Nomes (normalizados) dos produtos de que o documento trata: campos de nome, de ingrediente ativo e título."""
+    nomes: Set[str] = set()
+    for campo in CAMPOS_NOME + CAMPOS_INGREDIENTE:
+        valor = hit.campos.get(campo)
+        valores = valor if isinstance(valor, list) else [valor]
+        nomes.update(normalizar_nome(v) for v in valores if isinstance(v, str))
+
+    for campo in CAMPOS_TITULO:
+        titulo = hit.campos.get(campo)
+        if not isinstance(titulo, str):
+            continue
+        for marca in _MARCA.finditer(titulo):
+            nomes.add(normalizar_nome(marca.group(1)))
+            if marca.group(2):
+                nomes.add(normalizar_nome(f"{marca.group(1)} {marca.group(2)}"))
+        titulo_normalizado = f" {normalizar_nome(titulo)} "
+        nomes.update(
+            normalizar_nome(nome) for nome in PRODUTOS_CONHECIDOS
+            if f" {normalizar_nome(nome)} " in titulo_normalizado
+        )
+    return {nome for nome in nomes if len(nome) >= TAMANHO_MINIMO_NOME}
+
+
+# -----------------------------------------------------------
+# II. CLASSE IndiceLexico (Nome do produto -> IDs dos documentos)
+# -----------------------------------------------------------
+
+class IndiceLexico:
+    """
+    Índice invertido dos nomes de produtos e ingredientes ativos da coleção PRODUTO (campos próprios e título),
+    gravado em <diretorio>/<COLECAO>.json. Permite achar os documentos de um produto
+    citado pelo nome exato no texto.
+    """
+    def __init__(self, diretorio: str = INDICE_LEXICO_DIR, colecao: str = COLECAO_PRODUTOS):
+        self.diretorio = diretorio
+        self.colecao = colecao
+        self._nomes: Optional[Dict[str, List[str]]] = None
+        self._padrao: Optional[Pattern] = None
+        self._lock = threading.Lock()
+
+    @property
+    def caminho(self) -> str:
+        return os.path.join(self.diretorio, f"{self.colecao}.json")
+
+    def construir(self) -> Dict[str, int]:
+        """Percorre a coleção no Astra DB (sem $vector) e regrava o índice."""
+        print(f"\n--- Construindo índice léxico da Coleção: {self.colecao} ---")
+        nomes: Dict[str, List[str]] = {}
+        documentos = 0
+        for doc in get_astra_client().iterar_documentos(self.colecao, projection={"$vector": 0}):
+            hit = SearchHit.from_document(doc)
+            documentos += 1
+            for nome in extrair_nomes(hit):
+                nomes.setdefault(nome, []).append(hit.id)
+
+        os.makedirs(self.diretorio, exist_ok=True)
+        with open(self.caminho + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(nomes, f, ensure_ascii=False)
+        os.replace(self.caminho + ".tmp", self.caminho)
+
+        with self._lock:
+            self._nomes, self._padrao = None, None
+        print(f"✅ Índice léxico gravado. Documentos: {documentos} | Nomes: {len(nomes)}")
+        return {"documentos": documentos, "nomes": len(nomes)}
+
+    def _carregar(self) -> Dict[str, List[str]]:
+        with self._lock:
+            if self._nomes is None:
+                if os.path.exists(self.caminho):
+                    with open(self.caminho, encoding="utf-8") as f:
+                        self._nomes = json.load(f)
+                else:
+                    self._nomes = {}
+                # Uma única regex com todos os nomes (os mais longos primeiro: 'miravis pro' antes de 'miravis')
+                alternativas = sorted(self._nomes, key=len, reverse=True)
+                self._padrao = re.compile(
+                    r"(?<!\w)(" + "|".join(re.escape(n) for n in alternativas) + r")(?!\w)"
+                ) if alternativas else None
+            return self._nomes
+
+    def encontrar(self, texto: str) -> Dict[str, List[str]]:
+        """Produtos do índice citados no texto, com os IDs dos documentos de cada um."""
+        nomes = self._carregar()
+        if self._padrao is None:
+            return {}
+        citados = {m.group(1) for m in self._padrao.finditer(normalizar_nome(texto))}
+        return {nome: nomes[nome] for nome in sorted(citados)}
+
+
+@lru_cache(maxsize=None)
+def get_indice_lexico() -> IndiceLexico:
+    """Índice léxico da coleção PRODUTO compartilhado pelo processo (carregado do disco na primeira busca)."""
+    return IndiceLexico()
+
+
+# -----------------------------------------------------------
+# III. CONSTRUÇÃO DO ÍNDICE (main)
+# -----------------------------------------------------------
+
+def main():
+    """Reconstrói o índice léxico da coleção PRODUTO a partir do Astra DB."""
+    try:
+        get_indice_lexico().construir()
+    except Exception as e:
+        print(f"❌ ERRO ao construir o índice léxico: {str(e)}")
+
+if __name__ == "__main__":
+    main()
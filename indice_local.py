@@ -0,0 +1,246 @@
+import json
+import os
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+
+from classificacao import CATEGORIAS_VALIDAS
+from conexao_banco import AstraDBClient, SearchHit, decodificar_vetor, get_astra_client
+from metricas import span
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO ÍNDICE LOCAL
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+INDICE_LOCAL_DIR = os.getenv("INDICE_LOCAL_DIR", os.path.join(".cache", "indice_local"))
+
+# O Data API aceita no máximo 100 valores em um filtro $in
+LOTE_IDS = 100
+
+
+# -----------------------------------------------------------
+# II. SNAPSHOT DE UMA COLEÇÃO (matriz float32 + metadados)
+# -----------------------------------------------------------
+
+@dataclass
+class _Snapshot:
+    ids: List[str]
+    campos: List[Dict[str, Any]]
+    matriz: np.ndarray # (N, D) float32, linhas normalizadas (norma 1)
+
+
+def _normalizar(matriz: np.ndarray) -> np.ndarray:
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    normas[normas == 0] = 1.0
+    return (matriz / normas).astype(np.float32)
+
+
+# -----------------------------------------------------------
+# III. CLASSE LocalVectorIndex (Mesma interface do AstraDBClient)
+# -----------------------------------------------------------
+
+class LocalVectorIndex:
+    """
+    Índice vetorial em processo que espelha as coleções do Astra DB.
+    Cada coleção vira uma matriz float32 mapeada em memória (<COLECAO>.f32) e um
+    arquivo de metadados (<COLECAO>.meta.json); a busca é um produto escalar NumPy.
+    """
+    def __init__(self, diretorio: str = INDICE_LOCAL_DIR, remoto: Optional[AstraDBClient] = None):
+        self.diretorio = diretorio
+        self._remoto = remoto
+        self._snapshots: Dict[str, _Snapshot] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.diretorio, exist_ok=True)
+        print(f"✅ LocalVectorIndex inicializado em: {self.diretorio}")
+
+    @property
+    def remoto(self) -> AstraDBClient:
+        # Só precisa do Astra para atualizar; a busca funciona totalmente offline
+        return self._remoto or get_astra_client()
+
+    def _caminhos(self, collection: str):
+        base = os.path.join(self.diretorio, collection)
+        return f"{base}.f32", f"{base}.meta.json"
+
+    def _carregar(self, collection: str) -> Optional[_Snapshot]:
+        with self._lock:
+            if collection in self._snapshots:
+                return self._snapshots[collection]
+
+            caminho_matriz, caminho_meta = self._caminhos(collection)
+            if not os.path.exists(caminho_meta):
+                return None
+            with open(caminho_meta, encoding="utf-8") as f:
+                meta = json.load(f)
+
+            n, dim = len(meta["ids"]), meta["dim"]
+            if n:
+                matriz = np.memmap(caminho_matriz, dtype=np.float32, mode="r", shape=(n, dim))
+            else:
+                matriz = np.zeros((0, dim), dtype=np.float32)
+            snapshot = _Snapshot(ids=meta["ids"], campos=meta["campos"], matriz=matriz)
+            self._snapshots[collection] = snapshot
+            return snapshot
+
+    def _salvar(self, collection: str, ids: List[str], campos: List[Dict], matriz: np.ndarray) -> None:
+        caminho_matriz, caminho_meta = self._caminhos(collection)
+        # Grava em arquivos temporários e troca de forma atômica
+        np.ascontiguousarray(matriz, dtype=np.float32).tofile(caminho_matriz + ".tmp")
+        with open(caminho_meta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"dim": int(matriz.shape[1]), "ids": ids, "campos": campos}, f, ensure_ascii=False)
+
+        with self._lock:
+            self._snapshots.pop(collection, None)
+            os.replace(caminho_matriz + ".tmp", caminho_matriz)
+            os.replace(caminho_meta + ".tmp", caminho_meta)
+
+    def atualizar(self, collection: str) -> Dict[str, int]:
+        """
+        Atualiza o snapshot de forma incremental: lista os IDs remotos, baixa apenas
+        os documentos novos (com $vector) e descarta os que sumiram da coleção.
+        """
+        print(f"\n--- Atualizando índice local da Coleção: {collection} ---")
+        atual = self._carregar(collection)
+        ids_remotos = [str(doc["_id"]) for doc in self.remoto.iterar_documentos(collection, projection={"_id": 1})]
+
+        posicoes = {doc_id: i for i, doc_id in enumerate(atual.ids)} if atual else {}
+        mantidos = [posicoes[doc_id] for doc_id in ids_remotos if doc_id in posicoes]
+        novos_ids = [doc_id for doc_id in ids_remotos if doc_id not in posicoes]
+        removidos = len(posicoes) - len(mantidos)
+
+        if not novos_ids and not removidos and atual is not None:
+            print("✅ Índice local já está atualizado.")
+            return {"novos": 0, "removidos": 0, "total": len(ids_remotos)}
+
+        novos_docs = []
+        for i in range(0, len(novos_ids), LOTE_IDS):
+            lote = novos_ids[i:i + LOTE_IDS]
+            novos_docs.extend(self.remoto.iterar_documentos(
+                collection, filtro={"_id": {"$in": lote}}, projection={"*": 1}
+            ))
+        novos_docs = [doc for doc in novos_docs if doc.get("$vector")]
+
+        ids = [atual.ids[i] for i in mantidos] if atual else []
+        campos = [atual.campos[i] for i in mantidos] if atual else []
+        blocos = [np.asarray(atual.matriz[mantidos])] if atual and mantidos else []
+
+        if novos_docs:
+            hits = [SearchHit.from_document(doc) for doc in novos_docs]
+            ids += [hit.id for hit in hits]
+            campos += [hit.campos for hit in hits]
+            # O $vector pode vir como lista ou no formato binário ({"$binary": ...})
+            vetores = [decodificar_vetor(doc["$vector"]) for doc in novos_docs]
+            blocos.append(_normalizar(np.asarray(vetores, dtype=np.float32)))
+
+        if blocos:
+            matriz = np.vstack(blocos)
+        else:
+            dim = atual.matriz.shape[1] if atual else 0
+            matriz = np.zeros((0, dim), dtype=np.float32)
+
+        self._salvar(collection, ids, campos, matriz)
+        print(f"✅ Índice local atualizado. Novos: {len(novos_docs)} | Removidos: {removidos} | Total: {len(ids)}")
+        return {"novos": len(novos_docs), "removidos": removidos, "total": len(ids)}
+
+    def vector_search(
+        self,
+        collection: str,
+        vector: List[float],
+        limit: int = 6,
+        projection: Optional[Dict[str, int]] = None,
+        include_similarity: bool = True
+    ) -> List[SearchHit]:
+        """
+        Busca top-k por similaridade de cosseno no snapshot local.
+        O score segue a escala do Astra para a métrica cosine: (1 + cos) / 2.
+        A projeção é aceita por compatibilidade; o snapshot já não guarda o $vector nos campos.
+        """
+        if not collection or collection == "ERRO":
+            print("❌ Busca vetorial abortada: Coleção inválida ou erro na classificação.")
+            return []
+
+        snapshot = self._carregar(collection)
+        if snapshot is None or not snapshot.ids:
+            print(f"❌ Índice local vazio para a coleção '{collection}'. Rode 'python indice_local.py'.")
+            return []
+        if len(vector) != snapshot.matriz.shape[1]:
+            print(f"❌ Dimensão do vetor ({len(vector)}) difere do índice local ({snapshot.matriz.shape[1]}).")
+            return []
+
+        with span("busca_vetorial", colecao=collection, backend="local") as atributos:
+            consulta = np.asarray(vector, dtype=np.float32)
+            consulta /= (np.linalg.norm(consulta) or 1.0)
+            scores = snapshot.matriz @ consulta
+
+            k = min(limit, len(scores))
+            topo = np.argpartition(-scores, k - 1)[:k]
+            topo = topo[np.argsort(-scores[topo])]
+            atributos["documentos"] = int(k)
+
+        return [
+            SearchHit(
+                id=snapshot.ids[i],
+                campos=snapshot.campos[i],
+                score=float((1.0 + scores[i]) / 2.0) if include_similarity else None
+            )
+            for i in topo
+        ]
+
+    def buscar_por_ids(
+        self,
+        collection: str,
+        ids: List[str],
+        projection: Optional[Dict[str, int]] = None
+    ) -> List[SearchHit]:
+        """Documentos do snapshot pelo _id, na ordem dos IDs pedidos (mesma interface do AstraDBClient)."""
+        snapshot = self._carregar(collection)
+        if snapshot is None:
+            return []
+        with span("busca_por_ids", colecao=collection, backend="local") as atributos:
+            posicoes = {doc_id: i for i, doc_id in enumerate(snapshot.ids)}
+            hits = [
+                SearchHit(id=doc_id, campos=snapshot.campos[posicoes[doc_id]])
+                for doc_id in ids if doc_id in posicoes
+            ]
+            atributos["documentos"] = len(hits)
+        return hits
+
+
+# -----------------------------------------------------------
+# IV. ATUALIZAÇÃO DOS SNAPSHOTS (main)
+# -----------------------------------------------------------
+
+def main():
+    """
+    Atualiza (de forma incremental) os snapshots locais das coleções PRODUTO, CULTURA e OUTROS.
+    Com EMBEDDING_DIMENSOES reduzido, os snapshots são das coleções-sombra (as que a busca consulta).
+    Termina com erro se alguma coleção falhar ou não tiver a dimensão dos embeddings configurada.
+    """
+    # Importado aqui: o revisor importa este módulo (no backend local) e é pesado para quem só usa o índice
+    from revisor import EMBEDDING_DIMENSOES, colecao_vetorial
+
+    indice = LocalVectorIndex()
+    falhas = []
+    for colecao in map(colecao_vetorial, CATEGORIAS_VALIDAS):
+        try:
+            indice.atualizar(colecao)
+        except Exception as e:
+            print(f"❌ ERRO ao atualizar a coleção '{colecao}': {str(e)}")
+            falhas.append(colecao)
+            continue
+        snapshot = indice._carregar(colecao)
+        if snapshot is not None and snapshot.ids and snapshot.matriz.shape[1] != EMBEDDING_DIMENSOES:
+            print(
+                f"❌ A coleção '{colecao}' tem vetores de {snapshot.matriz.shape[1]} dimensões, "
+                f"mas EMBEDDING_DIMENSOES={EMBEDDING_DIMENSOES}: a busca local não usaria esse snapshot."
+            )
+            falhas.append(colecao)
+
+    if falhas:
+        raise SystemExit(f"❌ Snapshots com problema: {', '.join(falhas)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+from dotenv import load_dotenv
+
+from metricas import metricas
+from prazos import PrazoEsgotado, restante
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DOS LIMITES POR PROVEDOR
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+PROVEDORES = ("openai", "gemini", "astra")
+
+# Máximo de chamadas simultâneas por provedor (compartilhado por todas as threads do processo)
+LIMITES_PADRAO = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCORRENCIA", "16")),
+    "gemini": int(os.getenv("GEMINI_MAX_CONCORRENCIA", "16")),
+    "astra": int(os.getenv("ASTRA_MAX_CONCORRENCIA", "16")),
+}
+
+# Cotas por minuto de cada provedor (0 = sem limite): requisições (RPM) e tokens (TPM)
+COTAS_PADRAO = {
+    "openai": (float(os.getenv("OPENAI_RPM", "0")), float(os.getenv("OPENAI_TPM", "0"))),
+    "gemini": (float(os.getenv("GEMINI_RPM", "0")), float(os.getenv("GEMINI_TPM", "0"))),
+    "astra": (float(os.getenv("ASTRA_RPM", "0")), 0.0),
+}
+# Rajada permitida pelos baldes: o equivalente a quantos segundos de cota
+LIMITES_RAJADA_S = float(os.getenv("LIMITES_RAJADA_S", "10"))
+
+# Concorrência adaptativa (AIMD): um 429 reduz o máximo pela metade (no máximo uma vez por intervalo);
+# cada chamada bem-sucedida o aumenta de 1/máximo, até o teto configurado
+LIMITES_MINIMO = int(os.getenv("LIMITES_MINIMO", "1"))
+LIMITES_INTERVALO_REDUCAO_S = float(os.getenv("LIMITES_INTERVALO_REDUCAO_S", "2"))
+# Um pedido recusado com 429 volta para a fila até este número de vezes antes de virar erro
+LIMITES_TENTATIVAS_429 = int(os.getenv("LIMITES_TENTATIVAS_429", "6"))
+LIMITES_BACKOFF_S = float(os.getenv("LIMITES_BACKOFF_S", "1"))
+LIMITES_BACKOFF_MAX_S = float(os.getenv("LIMITES_BACKOFF_MAX_S", "30"))
+
+
+# -----------------------------------------------------------
+# II. CLASSE LimiteConcorrencia (Semáforo com limite ajustável e AIMD)
+# -----------------------------------------------------------
+
+def _prazo_esgotado_na_fila() -> None:
+    metricas.incrementar("revisor_prazos_esgotados_total", etapa="fila_concorrencia")
+    raise PrazoEsgotado("o prazo da revisão acabou na espera por uma vaga de concorrência")
+
+
+class LimiteConcorrencia:
+    """
+    Semáforo cujo limite pode ser alterado em tempo de execução e se adapta às
+    recusas do provedor (AIMD, entre `minimo` e o `teto` configurado).
+    Uso: `with limite("openai"): ...` em volta de cada chamada ao provedor
+    (nas corrotinas, `async with limite("openai"): ...`, que espera sem bloquear o event loop).
+    """
+    def __init__(self, maximo: int, minimo: int = LIMITES_MINIMO):
+        self.teto = max(1, maximo)
+        self.minimo = max(1, min(minimo, self.teto))
+        self.maximo = self.teto
+        self.em_uso = 0
+        self._fracao = 0.0
+        self._ultima_reducao = 0.0
+        self._cond = threading.Condition()
+
+    def adquirir(self) -> None:
+        """Espera uma vaga; com um prazo ativo, no máximo até ele (depois, PrazoEsgotado)."""
+        with self._cond:
+            while self.em_uso >= self.maximo:
+                tempo = restante()
+                if tempo == 0.0:
+                    _prazo_esgotado_na_fila()
+                self._cond.wait(tempo)
+            self.em_uso += 1
+
+    def tentar_adquirir(self) -> bool:
+        """Ocupa uma vaga se houver uma livre agora (sem esperar)."""
+        with self._cond:
+            if self.em_uso >= self.maximo:
+                return False
+            self.em_uso += 1
+            return True
+
+    async def adquirir_async(self) -> None:
+        """
+        Variante para corrotinas: tenta de novo em intervalos curtos em vez de esperar na
+        Condition (que bloquearia o event loop). Cancelar a espera não deixa vaga ocupada.
+        """
+        espera = 0.005
+        while not self.tentar_adquirir():
+            if restante() == 0.0:
+                _prazo_esgotado_na_fila()
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 0.05)
+
+    def liberar(self) -> None:
+        with self._cond:
+            self.em_uso -= 1
+            self._cond.notify()
+
+    def ajustar(self, maximo: int) -> None:
+        with self._cond:
+            self.teto = self.maximo = max(1, maximo)
+            self.minimo = min(self.minimo, self.teto)
+            self._cond.notify_all()
+
+    def registrar_sucesso(self) -> None:
+        """Aumento aditivo: +1 vaga a cada `maximo` chamadas bem-sucedidas, até o teto."""
+        with self._cond:
+            if self.maximo >= self.teto:
+                return
+            self._fracao += 1 / self.maximo
+            if self._fracao >= 1:
+                self._fracao = 0.0
+                self.maximo += 1
+                self._cond.notify()
+
+    def registrar_sobrecarga(self) -> None:
+        """Redução multiplicativa após um 429 (as recusas de uma mesma rajada contam uma vez só)."""
+        with self._cond:
+            agora = time.monotonic()
+            if agora - self._ultima_reducao < LIMITES_INTERVALO_REDUCAO_S:
+                return
+            self._ultima_reducao = agora
+            self._fracao = 0.0
+            self.maximo = max(self.minimo, self.maximo // 2)
+
+    def __enter__(self) -> "LimiteConcorrencia":
+        self.adquirir()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.liberar()
+
+    async def __aenter__(self) -> "LimiteConcorrencia":
+        await self.adquirir_async()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.liberar()
+
+
+# -----------------------------------------------------------
+# III. CLASSE BaldeTokens (Cota por minuto: requisições ou tokens)
+# -----------------------------------------------------------
+
+class BaldeTokens:
+    """
+    Token bucket com reposição contínua (`por_minuto`/60 por segundo) e rajada de
+    LIMITES_RAJADA_S segundos. O saldo pode ficar negativo: cada reserva sai na hora
+    e devolve quanto esperar, então os pedidos são atendidos em ordem de chegada (fila)
+    em vez de recusados.
+    """
+    def __init__(self, por_minuto: float, rajada_s: float = LIMITES_RAJADA_S):
+        self.taxa = por_minuto / 60
+        self.capacidade = max(1.0, self.taxa * rajada_s)
+        self.saldo = self.capacidade
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self, quantidade: float) -> float:
+        """Desconta a quantidade e retorna a espera (s) até o saldo cobri-la."""
+        with self._lock:
+            agora = time.monotonic()
+            self.saldo = min(self.capacidade, self.saldo + (agora - self._atualizado) * self.taxa)
+            self._atualizado = agora
+            self.saldo -= quantidade
+            return max(0.0, -self.saldo / self.taxa)
+
+
+# -----------------------------------------------------------
+# IV. LIMITES POR PROVEDOR E CHAMADAS LIMITADAS
+# -----------------------------------------------------------
+
+class LimitesProvedor:
+    """Concorrência adaptativa + baldes de requisições/min e tokens/min de um provedor."""
+    def __init__(self, nome: str, maximo: int, rpm: float = 0, tpm: float = 0):
+        self.nome = nome
+        self.concorrencia = LimiteConcorrencia(maximo)
+        self.requisicoes = BaldeTokens(rpm) if rpm > 0 else None
+        self.tokens = BaldeTokens(tpm) if tpm > 0 else None
+
+    def espera_cota(self, tokens: int = 0) -> float:
+        """Reserva uma requisição (e os tokens estimados) e retorna quanto esperar por elas."""
+        espera = self.requisicoes.reservar(1) if self.requisicoes else 0.0
+        if self.tokens and tokens:
+            espera = max(espera, self.tokens.reservar(tokens))
+        if espera > 0:
+            metricas.observar("revisor_limite_espera_segundos", espera, provedor=self.nome)
+        return espera
+
+    def consumir_tokens(self, tokens: int) -> None:
+        """Desconta tokens conhecidos só depois da chamada (ex.: os da resposta)."""
+        if self.tokens and tokens:
+            self.tokens.reservar(tokens)
+
+    def estado(self) -> Dict[str, float]:
+        return {
+            "maximo": self.concorrencia.maximo,
+            "teto": self.concorrencia.teto,
+            "em_uso": self.concorrencia.em_uso,
+        }
+
+
+_provedores: Dict[str, LimitesProvedor] = {
+    nome: LimitesProvedor(nome, LIMITES_PADRAO[nome], *COTAS_PADRAO[nome]) for nome in PROVEDORES
+}
+
+
+def limite(provedor: str) -> LimiteConcorrencia:
+    """Retorna o limitador de concorrência compartilhado do provedor ('openai', 'gemini' ou 'astra')."""
+    return _provedores[provedor].concorrencia
+
+
+def configurar_limite(provedor: str, maximo: int) -> None:
+    """Altera o máximo de chamadas simultâneas de um provedor."""
+    _provedores[provedor].concorrencia.ajustar(maximo)
+
+
+def configurar_cota(provedor: str, rpm: float = 0, tpm: float = 0) -> None:
+    """Altera as cotas por minuto de um provedor (0 = sem limite)."""
+    _provedores[provedor].requisicoes = BaldeTokens(rpm) if rpm > 0 else None
+    _provedores[provedor].tokens = BaldeTokens(tpm) if tpm > 0 else None
+
+
+def consumir_tokens(provedor: str, tokens: int) -> None:
+    _provedores[provedor].consumir_tokens(tokens)
+
+
+def estado_limites() -> Dict[str, Dict[str, float]]:
+    """Concorrência atual (após o AIMD), teto e vagas em uso de cada provedor."""
+    return {nome: p.estado() for nome, p in _provedores.items()}
+
+
+def espera_limite_taxa(erro: BaseException) -> Optional[float]:
+    """
+    None se o erro não for uma recusa por limite de taxa (429); senão, a espera sugerida
+    pelo provedor (Retry-After), ou 0 se ele não sugerir nenhuma.
+    Reconhece os erros do SDK da OpenAI, do Gemini (google.api_core), do requests e do httpx.
+    """
+    response = getattr(erro, "response", None)
+    status = getattr(erro, "status_code", None) or getattr(response, "status_code", None)
+    if status is None and isinstance(getattr(erro, "code", None), int):
+        status = erro.code
+    if status != 429 and type(erro).__name__ not in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return None
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return 0.0
+
+
+def _espera_nova_tentativa(tentativa: int, sugerida: float) -> float:
+    backoff = min(LIMITES_BACKOFF_MAX_S, LIMITES_BACKOFF_S * (2 ** tentativa))
+    return max(sugerida, backoff * random.uniform(0.5, 1.0))
+
+
+def _dentro_do_prazo(provedor: str, espera: float) -> float:
+    """A espera, se couber no prazo da revisão; senão PrazoEsgotado (melhor falhar já do que depois do prazo)."""
+    tempo = restante()
+    if tempo is not None and espera >= tempo:
+        metricas.incrementar("revisor_prazos_esgotados_total", etapa=f"fila_{provedor}")
+        raise PrazoEsgotado(f"a espera pela cota do {provedor} ({espera:.1f}s) passa do prazo da revisão")
+    return espera
+
+
+T = TypeVar("T")
+
+
+def chamar(provedor: str, fn: Callable[[], T], tokens: int = 0, vaga: bool = True) -> T:
+    """
+    Executa fn() dentro dos limites do provedor: espera a cota (RPM/TPM), ocupa uma vaga
+    de concorrência e, se o provedor recusar com 429, reduz a concorrência e põe o pedido
+    de volta na fila (até LIMITES_TENTATIVAS_429 vezes) em vez de devolver o erro.
+    Outros erros são propagados. vaga=False para quem já segura a vaga (ex.: streams).
+    """
+    limites = _provedores[provedor]
+    tentativa = 0
+    while True:
+        espera = limites.espera_cota(tokens)
+        if espera > 0:
+            time.sleep(_dentro_do_prazo(provedor, espera))
+        try:
+            if vaga:
+                with limites.concorrencia:
+                    resultado = fn()
+            else:
+                resultado = fn()
+        except Exception as e:
+            sugerida = espera_limite_taxa(e)
+            if sugerida is None or tentativa >= LIMITES_TENTATIVAS_429:
+                raise
+            limites.concorrencia.registrar_sobrecarga()
+            metricas.incrementar("revisor_limite_recusas_total", provedor=provedor)
+            time.sleep(_dentro_do_prazo(provedor, _espera_nova_tentativa(tentativa, sugerida)))
+            tentativa += 1
+            continue
+        limites.concorrencia.registrar_sucesso()
+        return resultado
+
+
+async def achamar(provedor: str, fn: Callable[[], Awaitable[T]], tokens: int = 0) -> T:
+    """Variante de chamar para corrotinas: fn() devolve o awaitable da chamada."""
+    limites = _provedores[provedor]
+    tentativa = 0
+    while True:
+        espera = limites.espera_cota(tokens)
+        if espera > 0:
+            await asyncio.sleep(_dentro_do_prazo(provedor, espera))
+        try:
+            async with limites.concorrencia:
+                resultado = await fn()
+        except Exception as e:
+            sugerida = espera_limite_taxa(e)
+            if sugerida is None or tentativa >= LIMITES_TENTATIVAS_429:
+                raise
+            limites.concorrencia.registrar_sobrecarga()
+            metricas.incrementar("revisor_limite_recusas_total", provedor=provedor)
+            await asyncio.sleep(_dentro_do_prazo(provedor, _espera_nova_tentativa(tentativa, sugerida)))
+            tentativa += 1
+            continue
+        limites.concorrencia.registrar_sucesso()
+        return resultado
@@ -0,0 +1,169 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Set
+
+from limites import configurar_limite, LIMITES_PADRAO
+from classificacao import CATEGORIAS_VALIDAS
+from revisor import reescrever_revisor, resposta_com_erro, MODOS_BUSCA
+
+# -----------------------------------------------------------
+# I. LEITURA DAS ENTRADAS (Diretório de textos ou JSONL)
+# -----------------------------------------------------------
+
+EXTENSOES_TEXTO = (".txt", ".md")
+
+
+def ler_entradas(caminho: str) -> Iterator[Dict]:
+    """
+    Lê os textos a revisar. Aceita:
+    - um diretório: cada arquivo .txt/.md é um texto (id = caminho relativo);
+    - um arquivo JSONL: uma linha por texto, com 'texto' (ou 'content'), 'id' e 'colecao' opcionais.
+    """
+    if os.path.isdir(caminho):
+        for raiz, _, arquivos in os.walk(caminho):
+            for nome in sorted(arquivos):
+                if nome.lower().endswith(EXTENSOES_TEXTO):
+                    completo = os.path.join(raiz, nome)
+                    with open(completo, encoding="utf-8") as f:
+                        yield {"id": os.path.relpath(completo, caminho), "texto": f.read()}
+        return
+
+    with open(caminho, encoding="utf-8") as f:
+        for numero, linha in enumerate(f, 1):
+            if not linha.strip():
+                continue
+            registro = json.loads(linha)
+            yield {
+                "id": str(registro.get("id", numero)),
+                "texto": registro.get("texto") or registro.get("content") or "",
+                "colecao": registro.get("colecao"),
+            }
+
+
+def ler_checkpoint(caminho_saida: str) -> Set[str]:
+    """IDs já revisados com sucesso em uma execução anterior (o próprio JSONL de saída é o checkpoint)."""
+    concluidos = set()
+    if not os.path.exists(caminho_saida):
+        return concluidos
+    with open(caminho_saida, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                continue # Linha truncada por uma queda no meio da escrita
+            if registro.get("status") == "ok":
+                concluidos.add(registro["id"])
+    return concluidos
+
+
+# -----------------------------------------------------------
+# II. EXECUÇÃO EM LOTE
+# -----------------------------------------------------------
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil pelo método nearest-rank."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+def revisar_lote(
+    entrada: str,
+    saida: str,
+    workers: int = 4,
+    colecao: Optional[str] = None,
+    modo_busca: Optional[str] = None,
+    usar_cache: bool = True
+) -> Dict:
+    """
+    Revisa todos os textos da entrada com `workers` revisões simultâneas, gravando cada
+    resultado no JSONL de saída assim que fica pronto. Textos já concluídos são pulados.
+    """
+    concluidos = ler_checkpoint(saida)
+    pendentes = [e for e in ler_entradas(entrada) if e["id"] not in concluidos and e["texto"].strip()]
+    print(f"📦 {len(pendentes)} textos pendentes ({len(concluidos)} já concluídos em execuções anteriores).")
+
+    lock_saida = threading.Lock()
+    latencias: List[float] = []
+    erros = 0
+
+    def processar(item: Dict) -> Dict:
+        inicio = time.perf_counter()
+        colecao_item = item.get("colecao") or colecao
+        # A coleção vai para o caminho da URL do Astra DB: só as categorias conhecidas (como no servidor)
+        if colecao_item is not None and colecao_item not in CATEGORIAS_VALIDAS:
+            resultado = f"ERRO: colecao inválida '{colecao_item}' (use uma de {', '.join(CATEGORIAS_VALIDAS)})"
+            return {"id": item["id"], "status": "erro", "resultado": resultado, "latencia_s": 0.0}
+        try:
+            resultado = reescrever_revisor(
+                item["texto"], colecao_override=colecao_item, modo_busca=modo_busca, usar_cache=usar_cache
+            )
+            status = "erro" if resposta_com_erro(resultado) else "ok"
+        except Exception as e:
+            resultado, status = f"ERRO inesperado: {str(e)}", "erro"
+        return {"id": item["id"], "status": status, "resultado": resultado, "latencia_s": time.perf_counter() - inicio}
+
+    inicio_lote = time.perf_counter()
+    with open(saida, "a", encoding="utf-8") as arquivo_saida, ThreadPoolExecutor(max_workers=workers) as executor:
+        futuros = [executor.submit(processar, item) for item in pendentes]
+        for n, futuro in enumerate(as_completed(futuros), 1):
+            registro = futuro.result()
+            with lock_saida:
+                arquivo_saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+                arquivo_saida.flush()
+                os.fsync(arquivo_saida.fileno())
+            latencias.append(registro["latencia_s"])
+            if registro["status"] != "ok":
+                erros += 1
+            print(f"[{n}/{len(pendentes)}] {registro['id']}: {registro['status']} ({registro['latencia_s']:.1f}s)")
+    duracao = time.perf_counter() - inicio_lote
+
+    return {
+        "processados": len(latencias),
+        "erros": erros,
+        "duracao_s": duracao,
+        "docs_por_min": len(latencias) / duracao * 60 if duracao > 0 else 0.0,
+        "p50_s": percentil(latencias, 50),
+        "p95_s": percentil(latencias, 95),
+    }
+
+
+# -----------------------------------------------------------
+# III. LINHA DE COMANDO (main)
+# -----------------------------------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Revisão em lote (RAG) com checkpoint e concorrência limitada.")
+    parser.add_argument("entrada", help="Diretório com arquivos .txt/.md ou arquivo .jsonl")
+    parser.add_argument("saida", help="Arquivo .jsonl de resultados (também usado como checkpoint)")
+    parser.add_argument("--workers", type=int, default=4, help="Revisões simultâneas")
+    parser.add_argument("--colecao", choices=CATEGORIAS_VALIDAS, help="Força a coleção em vez da classificação")
+    parser.add_argument("--modo-busca", choices=MODOS_BUSCA, help="Modo de recuperação")
+    parser.add_argument("--sem-cache", action="store_true", help="Ignora o cache da geração final")
+    for provedor, padrao in LIMITES_PADRAO.items():
+        parser.add_argument(f"--max-{provedor}", type=int, default=padrao, help=f"Chamadas simultâneas ao {provedor}")
+    args = parser.parse_args()
+
+    for provedor in LIMITES_PADRAO:
+        configurar_limite(provedor, getattr(args, f"max_{provedor}"))
+
+    relatorio = revisar_lote(
+        args.entrada, args.saida, workers=args.workers, colecao=args.colecao,
+        modo_busca=args.modo_busca, usar_cache=not args.sem_cache
+    )
+
+    print("\n" + "=" * 70)
+    print("✅ LOTE FINALIZADO")
+    print(f"Processados: {relatorio['processados']} | Erros: {relatorio['erros']} | Duração: {relatorio['duracao_s']:.1f}s")
+    print(f"Throughput: {relatorio['docs_por_min']:.1f} docs/min | p50: {relatorio['p50_s']:.2f}s | p95: {relatorio['p95_s']:.2f}s")
+    print("=" * 70)
+
+if __name__ == "__main__":
+    main()
@@ -1,382 +1,17 @@
-import google.generativeai as genai
-import os
-import textwrap
-from typing import Optional
-from dotenv import load_dotenv
-# -----------------------------------------------------------
-# I. CHAVES E CONFIGURAÇÕES (Do seu código anexo)
-# -----------------------------------------------------------
-load_dotenv() # Carrega as variáveis do arquivo .env localmente
-
-# ❌ REMOVA A CHAVE EM TEXTO CLARO AQUI!
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-try:
-    genai.configure(api_key=GEMINI_API_KEY)
-    # Definindo o modelo como no seu notebook
-    model = genai.GenerativeModel('gemini-2.0-flash')
-except Exception as e:
-    print(f"❌ ERRO: Falha ao configurar a API do Gemini. Verifique sua API_KEY. Erro: {e}")
-    model = None
-
-
-# -----------------------------------------------------------
-# II. FUNÇÃO DE CLASSIFICAÇÃO (Adaptada do seu código anexo)
-# -----------------------------------------------------------
-
-def classificar_texto(texto: str) -> Optional[str]:
-    """
-    Classifica textos relacionados ao agronegócio em PRODUTO, CULTURA ou OUTROS,
-    usando a lógica e prompt fornecidos.
-    """
-    if not model:
-        print("❌ MODELO INDISPONÍVEL. Não é possível classificar.")
-        return None
-
-    prompt = f"""Analise o texto/arquivo/diretório abaixo e classifique-o em UMA das categorias:
-
-CATEGORIAS:
-1. PRODUTO: Se refere a qualquer produto/serviço para venda ou uso agrícola.
-   - Nomes comerciais de produtos (ORONDIS®, POLYTRIN, Miravis Pro, Yieldon, Seeker)
-   - Argumentários de vendas, apresentações técnicas de produtos
-   - Folhetos comerciais, fichas técnicas promocionais
-   - Exemplos do que pode surgir: "Argumentário de vendas ORONDIS®", "Apresentação Técnica Curyom"
-
-2. CULTURA: Se foca especificamente em uma cultura agrícola ou plantação.
-   - Soja, milho, arroz, trigo, café, algodão, cana, feijão
-   - Culturas específicas mencionadas no título/conteúdo principal
-   - Exemplos: "Manejo de soja", "Doenças do milho", "Cultivo de trigo"
-
-3. OUTROS: Se for um documento técnico, manual, livro, artigo, guia, publicação científica.
-   - Manuais técnicos, livros acadêmicos
-   - Artigos científicos, publicações de pesquisa
-   - Guias de boas práticas, procedimentos
-   - Materiais educacionais, apresentações acadêmicas
-   - Normas, regulamentos, editais
-   - Exemplos: "Manual de Identificação de Plantas Daninhas", "Fisiologia vegetal",
-     "Livro Manejo de Nematoides", "Manual de boas práticas"
-
-Texto para classificar: "{texto}"
-
-REGRA IMPORTANTE:
-1. Retorne APENAS: "produto", "cultura" ou "outros"
-2. Responda com apenas uma palavra e em capslook: PRODUTO, CULTURA OU OUTROS."""
-
-    try:
-        # Gerar resposta do Gemini
-        response = model.generate_content(prompt)
-
-        # Extrair e limpar a resposta
-        resposta = response.text.strip().upper()
-        print(f"DEBUG: Resposta bruta do LLM: {resposta}")
-        
-        # Sua lógica de validação do notebook (que transforma a saída)
-        if "PRODUTO" in resposta:
-            return "PRODUTO"
-        elif "CULTURA" in resposta:
-            return "CULTURA"
-        elif "OUTROS" in resposta:
-            return "OUTROS"
-        else:
-            return f"CLASSIFICAÇÃO NÃO RECONHECIDA: {resposta}"
-
-    except Exception as e:
-        return f"ERRO ao classificar: {str(e)}"
-    
-
-
-import requests
-import json
-from typing import List, Dict
-import os
-from dotenv import load_dotenv
-
-
-# -----------------------------------------------------------
-# I. CHAVES E CONFIGURAÇÕES DO ASTRA DB
-# -----------------------------------------------------------
-
-# Chaves Astra DB (adaptadas do seu notebook anexo)
-
-
-
-
-load_dotenv() # Carrega as variáveis do arquivo .env localmente
-
-ASTRA_DB_APPLICATION_TOKEN = os.getenv("ASTRA_DB_APPLICATION_TOKEN")
-ASTRA_DB_API_ENDPOINT = os.getenv("ASTRA_DB_API_ENDPOINT")
-ASTRA_DB_NAMESPACE = os.getenv("ASTRA_DB_NAMESPACE")
-# -----------------------------------------------------------
-# II. CLASSE AstraDBClient (Do seu código anexo)
-# -----------------------------------------------------------
-
-class AstraDBClient:
-    """Classe wrapper para a conexão e busca no Astra DB."""
-    def __init__(self):
-        self.base_url = f"{ASTRA_DB_API_ENDPOINT}/api/json/v1/{ASTRA_DB_NAMESPACE}"
-        self.headers = {
-            "Content-Type": "application/json",
-            "x-cassandra-token": ASTRA_DB_APPLICATION_TOKEN,
-            "Accept": "application/json"
-        }
-        print("✅ AstraDBClient inicializado.")
-        
-    def vector_search(self, collection: str, vector: List[float], limit: int = 6) -> List[Dict]:
-        """Realiza busca por similaridade vetorial na coleção especificada."""
-        if not collection or collection == "ERRO":
-            print("❌ Busca vetorial abortada: Coleção inválida ou erro na classificação.")
-            return []
-            
-        url = f"{self.base_url}/{collection}" 
-        payload = {
-            "find": {
-                "sort": {"$vector": vector},
-                "options": {"limit": limit}
-            }
-        }
-        
-        print(f"\n--- Chamando Astra DB na Coleção: {collection} ---")
-        try:
-            response = requests.post(url, json=payload, headers=self.headers, timeout=30)
-            response.raise_for_status() 
-            data = response.json()
-            
-            documents = data.get("data", {}).get("documents", [])
-            print(f"✅ Busca realizada. Documentos retornados: {len(documents)}")
-            return documents
-
-        except requests.exceptions.HTTPError as e:
-            print(f"❌ ERRO HTTP na busca Astra DB (Status: {response.status_code}): {e}")
-            return []
-        except Exception as e:
-            print(f"❌ ERRO Geral na busca Astra DB: {str(e)}")
-            return []
-
-astra_client = AstraDBClient()
-
-
-
-import openai
-import os
-import json
-import hashlib
-from typing import List, Dict, Optional
-from dotenv import load_dotenv
-
-
-
-load_dotenv() # Carrega as variáveis do arquivo .env localmente
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Define a chave de ambiente para o cliente OpenAI
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-if not OPENAI_API_KEY:
-    print("❌ ATENÇÃO: OPENAI_API_KEY não está definida.")
-
-# -----------------------------------------------------------
-# II. CLASSE LLMClient (Para gerar a correção)
-# -----------------------------------------------------------
-
-class LLMClient:
-    """Classe wrapper para o cliente de Chat Completion da OpenAI, simulando 'generate_content'."""
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
-        # Inicializa o cliente OpenAI
-        self.client = openai.OpenAI(api_key=api_key)
-        self.model = model
-        print(f"✅ LLMClient inicializado com modelo: {self.model}")
-
-    def generate_content(self, prompt: str) -> str:
-        """Método que simula a interface generate_content."""
-        print("\n--- Chamando OpenAI Chat Completion ---")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
-        except openai.APIError as e:
-            print(f"❌ ERRO NA GERAÇÃO DO LLM (API Error): {e}")
-            return f"ERRO NA GERAÇÃO DO LLM (API Error): {str(e)}"
-        except Exception as e:
-            print(f"❌ ERRO NA GERAÇÃO DO LLM (Geral): {e}")
-            return f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}"
-
-# Inicializa o cliente
-modelo_texto = LLMClient(api_key=OPENAI_API_KEY)
-
-
-# -----------------------------------------------------------
-# III. FUNÇÃO get_embedding (Para a busca vetorial)
-# -----------------------------------------------------------
-
-def get_embedding(text: str) -> List[float]:
-    """Obtém embedding do texto usando OpenAI com diagnóstico (adaptado do seu doc)."""
-    print("\n--- Chamando OpenAI Embedding ---")
-    try:
-        # Usa o cliente já inicializado para embeddings
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        embedding = response.data[0].embedding
-
-        # --- DIAGNÓSTICO ---
-        print(f"✅ Embedding Gerado. Dimensões: {len(embedding)}. Primeiro valor: {embedding[0]:.6f}")
-        # --- FIM DIAGNÓSTICO ---
-
-        return embedding
-    except Exception as e:
-        print(f"❌ ERRO na API OpenAI para Embedding: {str(e)}. Verifique se a chave está ativa.")
-        # Seu fallback de hash foi removido, pois ele falha na busca RAG e queremos testar a conexão real.
-        return []
-
-
-
-def reescrever_revisor(content: str, colecao_override: Optional[str] = None) -> str:
-    """
-    Função principal que executa o pipeline RAG completo.
-    Atua como um Revisor Técnico, corrigindo imprecisões e enriquecendo o texto.
-    Aceita colecao_override para sobrepor a classificação do Gemini.
-    """
-    
-    colecao = None
-    
-    if colecao_override and colecao_override != "Automática (Classificação Gemini)":
-        # 1a. Usa a coleção fornecida pelo usuário
-        colecao = colecao_override
-        print(f"\n--- 1. COLEÇÃO DEFINIDA PELO USUÁRIO: {colecao} ---")
-    else:
-        # 1b. Executa a classificação normal do Gemini
-        print("\n--- 1. CLASSIFICAÇÃO AUTOMÁTICA (Gemini) ---")
-        colecao = classificar_texto(content)
-        print(f"Coleção Identificada: {colecao}")
-    
-    if colecao in ["ERRO", "CLASSIFICAÇÃO NÃO RECONHECIDA:", None]:
-        # Retorna a mensagem de erro como string, conforme solicitado.
-        return f"Erro na classificação/seleção da coleção. Classificação falhou com: {colecao if colecao else 'ERRO'}. Não foi possível iniciar a busca RAG."
-
-    # 2. EMBEDDING E BUSCA
-    embedding = get_embedding(content[:800])
-    
-    if not embedding or len(embedding) < 1536:
-        return "Erro fatal na geração do Embedding. Verifique sua chave OpenAI ativa. Não foi possível buscar no Astra DB."
-        
-    relevant_docs = astra_client.vector_search(colecao, embedding, limit=10)
-    print(f"2. Busca Vetorial concluída na coleção '{colecao}'. Documentos retornados: {len(relevant_docs)}")
-    
-    # 3. CONSTRÓI CONTEXTO RAG
-    rag_context = ""
-    if relevant_docs:
-        rag_context = "### REFERENCIAL TEÓRICO BUSCADO (RAG) ###\n"
-        for i, doc in enumerate(relevant_docs, 1):
-            doc_content = str(doc)
-            doc_clean = doc_content.replace('{', '').replace('}', '').replace("'", "").replace('"', '')
-            rag_context += f"--- Fonte {i} ---\n{doc_clean[:500]}...\n"
-    else:
-        rag_context = "Referencial teórico não retornou resultados específicos relevantes."
-    
-    # 4. PROMPT DE GERAÇÃO AUMENTADA (Mantendo o prompt anterior, mas removendo a 'instrucao_incremental')
-    final_prompt = f"""
-    Você é um **Revisor Técnico Sênior** com foco na área agrícola, rigoroso, preciso e com a missão de garantir a **veracidade científica absoluta** do texto de entrada.
-    Confira se os valores estão idênticos ao banco de dados.
-
-    Seu objetivo é:
-    1. **CORRIGIR** automaticamente qualquer imprecisão, erro técnico ou erro científico no texto original.
-    2. **ENRICHECER** o texto original, substituindo termos vagos por **terminologia técnica precisa** (ex: troque 'veneno' por 'defensivo agrícola' ou 'fitossanitário').
-    3. **ACRESCENTAR** dados concretos, números e informações específicas, *apenas* quando o **REFERENCIAL TEÓRICO** fornecido for relevante para enriquecer ou corrigir o tópico do texto original.
-    4. **MANTER** a estrutura e o tamanho do texto original (máximo delta de 5%).
-    5. **PROIBIDO** adicionar informações que tangenciem ou desviem do tema central do texto original.
-
-    ---
-    ### TEXTO ORIGINAL A SER REVISADO ###
-    {content}
-    
-    ---
-    {rag_context}
-    ---
-
-    ## ESTRUTURA DE RETORNO OBRIGATÓRIA:
-
-    Retorne o **TEXTO COMPLETAMENTE REVISADO E CORRIGIDO** primeiro.
-    
-    Após, coloque quais dados foram buscados no banco de dados para essa correção.
-
-    Em seguida, adicione uma subseção chamada "🛠️ Ajustes Técnicos e Correções" listando de forma concisa cada alteração significativa feita (correção ou enriquecimento) e qual fonte foi usada.
-    """
-
-    # 5. Geração Final do LLM
-    response_text = modelo_texto.generate_content(final_prompt)
-        
-    return response_text
-
-
-
-
-
-# -----------------------------------------------------------
-# V. FUNÇÃO ajuste_incremental (Para ajustes pós-revisão)
-# -----------------------------------------------------------
-# -----------------------------------------------------------
-# V. FUNÇÃO ajuste_incremental (Para ajustes pós-revisão)
-# -----------------------------------------------------------
-
-def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
-    """
-    Aplica uma instrução incremental ao texto já revisado (saída do reescrever_revisor).
-    Mantém o formato e adiciona as mudanças solicitadas.
-    """
-    if not instrucao_incremental:
-        return texto_revisado # Retorna o texto original se não houver instrução
-
-    print("\n--- INICIANDO AJUSTE INCREMENTAL ---")
-    
-    # 1. TENTA ISOLAR APENAS O TEXTO PRINCIPAL DA SAÍDA RAG
-    # Isso é crucial para evitar que o LLM inclua as seções de metadados (Ajustes Técnicos) na resposta
-    partes = texto_revisado.split("🛠️ Ajustes Técnicos e Correções")
-    texto_principal_rag = partes[0].strip()
-    
-    # PROMPT DE AJUSTE INCREMENTAL REFINADO
-    final_prompt = f"""
-    Você é um **Editor Sênior** com a única missão de aplicar uma mudança incremental de forma fluida.
-    
-    Seu objetivo principal é editar o TEXTO PRINCIPAL A SER AJUSTADO:
-    1. **APENAS** edite o texto para incorporar as informações da INSTRUÇÃO INCREMENTAL de forma natural, **mantendo o tom técnico**.
-    2. Não é para mencionar a instrução incremental na saída.
-    3. **PROIBIDO** manter ou incluir as seções de metadados ("🛠️ Ajustes Técnicos e Correções", "Dados Buscados", etc.) na sua resposta.
-
-    ---
-    ### TEXTO PRINCIPAL A SER AJUSTADO ###
-    {texto_principal_rag}
-    
-    ---
-    ### INSTRUÇÃO INCREMENTAL A SER ACRESCENTADA ###
-    {instrucao_incremental}
-
-    ---
-    
-    Retorne **SOMENTE O TEXTO FINAL RESULTANTE**, completamente editado e pronto.
-    """
-
-    try:
-        # Usa o cliente LLM para gerar o conteúdo
-        response_text = modelo_texto.generate_content(final_prompt)
-        print("✅ Ajuste Incremental concluído.")
-        return response_text
-    except Exception as e:
-        print(f"❌ ERRO na Geração do Ajuste Incremental: {str(e)}")
-        return texto_revisado # Fallback para o texto original se falhar
-    
-
-
-
-
+from contextlib import closing
 import streamlit as st
 
+# 🚨 IMPORTAÇÃO DO PIPELINE RAG (classificacao -> conexao_banco -> revisor)
+from revisor import (
+    verificar_conexao_openai,
+    reescrever_revisor_stream,
+    ajuste_incremental_stream,
+    separar_ajustes,
+    resposta_com_erro,
+)
+from metricas import iniciar_trace, metricas
+from sessao import SessaoRevisao, chave_etapa, TIPO_REVISAO, TIPO_AJUSTE
+
 # --- Configurações da Página ---
 st.set_page_config(
     page_title="Corretor de Texto ",
@@ -390,8 +25,12 @@ st.markdown("**Fluxo de Duas Etapas:** 1. Revisão RAG (Classificação/Busca) 
 st.markdown("---")
 
 # --- Verificação de Status da Chave OpenAI ---
-# Nota: A função get_embedding não é ideal para check, mas mantida para compatibilidade com o revisor.py
-if not get_embedding("teste"):
+# O resultado fica em cache por alguns minutos: a verificação não roda a cada interação com a página.
+@st.cache_data(ttl=300, show_spinner=False)
+def chave_openai_ativa() -> bool:
+    return verificar_conexao_openai()
+
+if not chave_openai_ativa():
     st.error("❌ ERRO CRÍTICO: Chave OpenAI INATIVA. A busca RAG falhará. Por favor, corrija a chave no 'revisor.py'.")
 else:
     st.success("✅ Conexão OpenAI OK. Pronto para rodar o RAG.")
@@ -404,6 +43,20 @@ if 'ajustes_tecnicos' not in st.session_state:
     st.session_state.ajustes_tecnicos = "Nenhum ajuste técnico realizado."
 if 'colecao_usada' not in st.session_state:
     st.session_state.colecao_usada = "N/A"
+if 'ultimo_trace' not in st.session_state:
+    st.session_state.ultimo_trace = []
+# Histórico da sessão: cada revisão RAG e cada ajuste aplicado a ela (permite reaproveitar, desfazer e ramificar)
+if 'sessao' not in st.session_state:
+    st.session_state.sessao = SessaoRevisao()
+sessao = st.session_state.sessao
+
+
+def exibir_no(no) -> None:
+    """Mostra na saída o texto e os detalhes de um nó da sessão."""
+    st.session_state.saida_final = no.texto
+    st.session_state.ajustes_tecnicos = no.ajustes_tecnicos
+    st.session_state.colecao_usada = no.colecao
+    st.session_state.ultimo_trace = no.trace
 
 # --- FUNÇÃO AUXILIAR PARA PARSEAR A SAÍDA DO RAG ---
 # Como reescrever_revisor retorna uma string única, precisamos extrair o texto final e os ajustes.
@@ -416,9 +69,9 @@ def parse_rag_output(full_response: str, colecao: str) -> dict:
         }
 
     # Tenta separar o texto principal dos ajustes técnicos
-    partes = full_response.split("🛠️ Ajustes Técnicos e Correções")
-    texto_final = partes[0].strip() if partes else full_response
-    ajustes_tecnicos = partes[1].strip() if len(partes) > 1 else "Não foi possível extrair a seção de Ajustes Técnicos."
+    texto_final, ajustes_tecnicos = separar_ajustes(full_response)
+    if ajustes_tecnicos is None:
+        ajustes_tecnicos = "Não foi possível extrair a seção de Ajustes Técnicos."
         
     return {
         "texto_final": texto_final,
@@ -459,6 +112,12 @@ with col2:
         height=150,
         placeholder="Ex: 'Mude o tom para formal' ou 'Aumente o segundo parágrafo em 30 palavras'."
     )
+
+    ignorar_cache = st.checkbox(
+        label="Ignorar cache da geração",
+        value=False,
+        help="Força uma nova chamada ao LLM mesmo que este texto já tenha sido revisado com as mesmas referências."
+    )
     
 # --- Lógica de Execução ---
 
@@ -469,45 +128,118 @@ if st.button("Aplicar Correção", type="primary"):
     if not texto_base:
         st.warning("Por favor, insira um Texto Base para revisão.")
     else:
-        # Inicializa o resultado final com o texto base em caso de falha
-        final_text = texto_base
-
-        # ----------------------------------------------------
-        # 🟢 PASSO 1: REVISÃO RAG (reescrever_revisor)
-        # ----------------------------------------------------
-        with st.spinner(f"1/2 Processando RAG na coleção: {colecao_selecionada}..."):
-            # CHAMA A FUNÇÃO CENTRAL DO RAG
-            rag_output_str = reescrever_revisor(texto_base, colecao_override=colecao_selecionada)
-            
-            # PARSEA A SAÍDA PARA SEPARAR O TEXTO FINAL E OS AJUSTES
-            resultado_rag_parse = parse_rag_output(rag_output_str, colecao_selecionada)
-            
-            st.session_state.ajustes_tecnicos = resultado_rag_parse["ajustes_tecnicos"]
-            st.session_state.colecao_usada = resultado_rag_parse["colecao_usada"]
-            final_text = resultado_rag_parse["texto_final"]
-            
-            if "Erro" in final_text:
-                st.error(f"❌ Erro na Etapa RAG: {final_text}")
+        novos_nos = []
+        # Cada etapa do pipeline (classificação, embedding, busca, geração...) vira um span do trace
+        with iniciar_trace("revisao") as trace:
+            # Inicializa o resultado final com o texto base em caso de falha
+            final_text = texto_base
+            no_base = None
+
+            # ----------------------------------------------------
+            # 🟢 PASSO 1: REVISÃO RAG (reescrever_revisor)
+            # ----------------------------------------------------
+            # Áreas atualizadas conforme os trechos chegam do LLM (streaming)
+            st.subheader("✍️ Revisão em andamento")
+            area_texto = st.empty()
+            area_ajustes = st.empty()
+
+            chave_rag = chave_etapa(TIPO_REVISAO, texto_base, colecao_selecionada)
+            no_rag = None if ignorar_cache else sessao.buscar(chave_rag)
+            if no_rag is not None:
+                # Mesmo texto e coleção: a revisão da sessão é reaproveitada. Se a versão atual
+                # descende dela (ajustes, desfazer), a nova instrução parte da versão atual.
+                atual = sessao.no_atual
+                no_base = atual if atual is not None and sessao.raiz(atual.id).id == no_rag.id else no_rag
+                final_text = no_base.texto
+                area_texto.markdown(final_text)
+                st.info(f"♻️ Etapa 1 (RAG) reaproveitada da sessão. Partindo da versão #{no_base.id}.")
             else:
-                st.success(f"✅ Etapa 1 (RAG) Concluída. Coleção utilizada: {st.session_state.colecao_usada}")
-
-        # ----------------------------------------------------
-        # 🟠 PASSO 2: AJUSTE INCREMENTAL (ajuste_incremental)
-        # ----------------------------------------------------
-        if instrucao_incremental and "Erro" not in final_text:
-            with st.spinner("2/2 Aplicando Ajuste Incremental..."):
-                final_text = ajuste_incremental(final_text, instrucao_incremental)
+                with st.spinner(f"1/2 Processando RAG na coleção: {colecao_selecionada}..."):
+                    # CHAMA A FUNÇÃO CENTRAL DO RAG (em streaming)
+                    rag_output_str = ""
+                    trechos_rag = []
+                    # closing: se o script for interrompido (nova interação do usuário), o stream e o slot do provedor são liberados na hora
+                    with closing(reescrever_revisor_stream(texto_base, colecao_override=colecao_selecionada, usar_cache=not ignorar_cache)) as stream_rag:
+                        for trecho in stream_rag:
+                            trechos_rag.append(trecho)
+                            rag_output_str += trecho
+                            # Separa a seção de Ajustes Técnicos assim que ela aparece no stream
+                            texto_parcial, ajustes_parciais = separar_ajustes(rag_output_str)
+                            area_texto.markdown(texto_parcial)
+                            if ajustes_parciais is not None:
+                                area_ajustes.code(ajustes_parciais, language='markdown')
             
-            st.success("✨ Ajuste Incremental Aplicado.")
-            st.session_state.ajustes_tecnicos += "\n\n--- AJUSTE INCREMENTAL ---\nInstrução Adicional Aplicada."
-        elif instrucao_incremental and "Erro" in final_text:
-             st.warning("Instrução incremental ignorada devido a um erro na etapa RAG.")
-
+                    # PARSEA A SAÍDA PARA SEPARAR O TEXTO FINAL E OS AJUSTES
+                    resultado_rag_parse = parse_rag_output(rag_output_str, colecao_selecionada)
+                    final_text = resultado_rag_parse["texto_final"]
+            
+                    if resposta_com_erro(*trechos_rag):
+                        st.error(f"❌ Erro na Etapa RAG: {final_text}")
+                        # Erros não entram no histórico: só são exibidos
+                        st.session_state.saida_final = final_text
+                        st.session_state.ajustes_tecnicos = resultado_rag_parse["ajustes_tecnicos"]
+                        st.session_state.colecao_usada = resultado_rag_parse["colecao_usada"]
+                    else:
+                        no_base = sessao.registrar(
+                            TIPO_REVISAO, chave_rag,
+                            entradas={"texto_base": texto_base, "colecao": colecao_selecionada},
+                            texto=final_text,
+                            ajustes_tecnicos=resultado_rag_parse["ajustes_tecnicos"],
+                            colecao=resultado_rag_parse["colecao_usada"]
+                        )
+                        novos_nos.append(no_base)
+                        st.success(f"✅ Etapa 1 (RAG) Concluída. Coleção utilizada: {no_base.colecao}")
+
+            # ----------------------------------------------------
+            # 🟠 PASSO 2: AJUSTE INCREMENTAL (ajuste_incremental)
+            # ----------------------------------------------------
+            if instrucao_incremental and no_base is not None:
+                chave_ajuste = chave_etapa(TIPO_AJUSTE, instrucao_incremental, pai=no_base.id)
+                no_ajuste = sessao.buscar(chave_ajuste)
+                if no_ajuste is not None:
+                    sessao.ir_para(no_ajuste.id)
+                    area_texto.markdown(no_ajuste.texto)
+                    st.info(f"♻️ Ajuste reaproveitado da sessão (versão #{no_ajuste.id}).")
+                else:
+                    with st.spinner("2/2 Aplicando Ajuste Incremental..."):
+                        texto_ajustado = ""
+                        trechos_ajuste = []
+                        with closing(ajuste_incremental_stream(no_base.texto, instrucao_incremental)) as stream_ajuste:
+                            for trecho in stream_ajuste:
+                                trechos_ajuste.append(trecho)
+                                texto_ajustado += trecho
+                                area_texto.markdown(texto_ajustado)
+
+                    # Só ajustes bem-sucedidos entram no histórico: uma falha não é reaproveitada ao repetir a instrução
+                    if resposta_com_erro(*trechos_ajuste):
+                        st.error(f"❌ Erro no Ajuste Incremental: {texto_ajustado}")
+                        sessao.ir_para(no_base.id)
+                    elif texto_ajustado.strip() == no_base.texto.strip():
+                        st.warning("⚠️ O ajuste não alterou o texto. Nada foi registrado no histórico.")
+                        sessao.ir_para(no_base.id)
+                    else:
+                        novos_nos.append(sessao.registrar(
+                            TIPO_AJUSTE, chave_ajuste,
+                            entradas={"instrucao": instrucao_incremental},
+                            texto=texto_ajustado,
+                            ajustes_tecnicos=no_base.ajustes_tecnicos + f"\n\n--- AJUSTE INCREMENTAL ---\nInstrução Adicional Aplicada: {instrucao_incremental}",
+                            colecao=no_base.colecao,
+                            pai=no_base.id
+                        ))
+                        st.success("✨ Ajuste Incremental Aplicado.")
+            elif instrucao_incremental and no_base is None:
+                 st.warning("Instrução incremental ignorada devido a um erro na etapa RAG.")
+            elif no_base is not None:
+                sessao.ir_para(no_base.id)
 
         # ----------------------------------------------------
         # 🏁 ATUALIZAÇÃO FINAL
         # ----------------------------------------------------
-        st.session_state.saida_final = final_text
+        for no in novos_nos:
+            no.trace = trace.para_lista()
+        if no_base is not None:
+            exibir_no(sessao.no_atual)
+        st.session_state.ultimo_trace = trace.para_lista()
 
 st.markdown("---")
 
@@ -528,3 +260,37 @@ st.code(
     f"Coleção RAG Utilizada: {st.session_state.colecao_usada}\n\n" + st.session_state.ajustes_tecnicos,
     language='markdown'
 )
+
+# --- 3. Histórico da Sessão (desfazer e ramificar sem refazer a revisão RAG) ---
+if sessao.nos:
+    st.subheader("🕘 Histórico da Sessão")
+    nos_arvore = sessao.arvore()
+    ids_arvore = [no.id for no in nos_arvore]
+    escolhido = st.selectbox(
+        label="Versões (os ajustes aparecem abaixo da versão a que foram aplicados):",
+        options=ids_arvore,
+        index=ids_arvore.index(sessao.atual) if sessao.atual in ids_arvore else 0,
+        format_func=lambda no_id: "　" * sessao.profundidade(no_id) + sessao.nos[no_id].rotulo
+    )
+    col_desfazer, col_usar = st.columns(2)
+    with col_desfazer:
+        if st.button("↩️ Desfazer último ajuste", disabled=sessao.no_atual is None or sessao.no_atual.pai is None):
+            exibir_no(sessao.desfazer())
+            st.rerun()
+    with col_usar:
+        if st.button("📌 Usar esta versão", help="O próximo ajuste parte da versão escolhida, criando um novo ramo."):
+            exibir_no(sessao.ir_para(escolhido))
+            st.rerun()
+
+# Tempo e volume de cada etapa da última revisão
+if st.session_state.ultimo_trace:
+    st.dataframe(st.session_state.ultimo_trace, use_container_width=True)
+
+with st.expander("📈 Métricas do processo"):
+    st.caption("Latência por etapa (p50/p95/p99) e contadores acumulados desde o início do processo.")
+    col_json, col_prom = st.columns(2)
+    with col_json:
+        st.download_button("Baixar JSON", metricas.exportar_json(), file_name="metricas.json", mime="application/json")
+    with col_prom:
+        st.download_button("Baixar Prometheus", metricas.exportar_prometheus(), file_name="metricas.prom", mime="text/plain")
+    st.json(metricas.snapshot())
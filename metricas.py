@@ -0,0 +1,230 @@
+import contextvars
+import json
+import math
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+# -----------------------------------------------------------
+# I. HISTOGRAMA (Janela das últimas amostras + percentis)
+# -----------------------------------------------------------
+
+AMOSTRAS_POR_HISTOGRAMA = 5000
+PERCENTIS = (50, 95, 99)
+
+
+class Histograma:
+    """Guarda as últimas amostras (janela deslizante) e o total acumulado de contagem e soma."""
+    def __init__(self, max_amostras: int = AMOSTRAS_POR_HISTOGRAMA):
+        self.amostras: Deque[float] = deque(maxlen=max_amostras)
+        self.contagem = 0
+        self.soma = 0.0
+
+    def observar(self, valor: float) -> None:
+        self.amostras.append(valor)
+        self.contagem += 1
+        self.soma += valor
+
+    def percentil(self, p: float) -> float:
+        """Percentil pelo método nearest-rank sobre a janela de amostras."""
+        if not self.amostras:
+            return 0.0
+        ordenadas = sorted(self.amostras)
+        return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+    def resumo(self) -> Dict[str, float]:
+        resumo = {"contagem": self.contagem, "soma": self.soma}
+        for p in PERCENTIS:
+            resumo[f"p{p}"] = self.percentil(p)
+        return resumo
+
+
+# -----------------------------------------------------------
+# II. CLASSE RegistroMetricas (Histogramas e contadores do processo)
+# -----------------------------------------------------------
+
+Chave = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _chave(nome: str, rotulos: Dict[str, str]) -> Chave:
+    return nome, tuple(sorted(rotulos.items()))
+
+
+class RegistroMetricas:
+    """Registro de métricas do processo, exportável como JSON ou no formato texto do Prometheus."""
+    def __init__(self):
+        self._histogramas: Dict[Chave, Histograma] = {}
+        self._contadores: Dict[Chave, float] = {}
+        self._lock = threading.Lock()
+
+    def observar(self, nome: str, valor: float, **rotulos: str) -> None:
+        with self._lock:
+            chave = _chave(nome, rotulos)
+            if chave not in self._histogramas:
+                self._histogramas[chave] = Histograma()
+            self._histogramas[chave].observar(valor)
+
+    def incrementar(self, nome: str, valor: float = 1.0, **rotulos: str) -> None:
+        with self._lock:
+            chave = _chave(nome, rotulos)
+            self._contadores[chave] = self._contadores.get(chave, 0.0) + valor
+
+    def percentil(self, nome: str, p: float, **rotulos: str) -> Optional[float]:
+        """Percentil atual de um histograma (None se ainda não houver amostras)."""
+        with self._lock:
+            histograma = self._histogramas.get(_chave(nome, rotulos))
+            if histograma is None or not histograma.amostras:
+                return None
+            return histograma.percentil(p)
+
+    def contagem(self, nome: str, **rotulos: str) -> int:
+        """Total de amostras já observadas em um histograma (0 se ele não existir)."""
+        with self._lock:
+            histograma = self._histogramas.get(_chave(nome, rotulos))
+            return histograma.contagem if histograma is not None else 0
+
+    def limpar(self) -> None:
+        """Descarta todas as amostras e contadores (ex.: entre as rodadas de um benchmark)."""
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    def snapshot(self) -> Dict[str, List[Dict[str, Any]]]:
+        with self._lock:
+            return {
+                "histogramas": [
+                    {"nome": nome, "rotulos": dict(rotulos), **h.resumo()}
+                    for (nome, rotulos), h in sorted(self._histogramas.items())
+                ],
+                "contadores": [
+                    {"nome": nome, "rotulos": dict(rotulos), "valor": valor}
+                    for (nome, rotulos), valor in sorted(self._contadores.items())
+                ],
+            }
+
+    def exportar_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def exportar_prometheus(self) -> str:
+        """Formato texto do Prometheus: histogramas como 'summary' (quantis), contadores como 'counter'."""
+        snapshot = self.snapshot()
+        linhas: List[str] = []
+        tipos_declarados = set()
+
+        def rotulos_str(rotulos: Dict[str, str]) -> str:
+            if not rotulos:
+                return ""
+            pares = ",".join(f'{k}="{str(v)}"' for k, v in sorted(rotulos.items()))
+            return "{" + pares + "}"
+
+        for h in snapshot["histogramas"]:
+            if h["nome"] not in tipos_declarados:
+                linhas.append(f"# TYPE {h['nome']} summary")
+                tipos_declarados.add(h["nome"])
+            for p in PERCENTIS:
+                linhas.append(f"{h['nome']}{rotulos_str({**h['rotulos'], 'quantile': str(p / 100)})} {h[f'p{p}']}")
+            linhas.append(f"{h['nome']}_sum{rotulos_str(h['rotulos'])} {h['soma']}")
+            linhas.append(f"{h['nome']}_count{rotulos_str(h['rotulos'])} {h['contagem']}")
+
+        for c in snapshot["contadores"]:
+            if c["nome"] not in tipos_declarados:
+                linhas.append(f"# TYPE {c['nome']} counter")
+                tipos_declarados.add(c["nome"])
+            linhas.append(f"{c['nome']}{rotulos_str(c['rotulos'])} {c['valor']}")
+
+        return "\n".join(linhas) + "\n"
+
+
+metricas = RegistroMetricas()
+
+
+# -----------------------------------------------------------
+# III. TRACE DE UMA REVISÃO E SPANS POR ETAPA
+# -----------------------------------------------------------
+
+class Trace:
+    """Spans de uma revisão (classificação, embedding, busca, contexto, geração, ajuste)."""
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.inicio = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def adicionar(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def para_lista(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(s) for s in self.spans]
+
+
+_trace_atual: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace_atual", default=None)
+
+
+@contextmanager
+def iniciar_trace(nome: str = "revisao") -> Iterator[Trace]:
+    """Ativa um Trace para o bloco: todos os spans executados dentro dele são registrados nele."""
+    trace = Trace(nome)
+    token = _trace_atual.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace_atual.reset(token)
+
+
+def trace_atual() -> Optional[Trace]:
+    return _trace_atual.get()
+
+
+@contextmanager
+def span(etapa: str, **atributos: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Mede a duração de uma etapa. O bloco pode acrescentar atributos ao dicionário
+    retornado (bytes, documentos, tokens...): atributos inteiros viram contadores
+    '<atributo>_total' por etapa; a duração vai para o histograma de duração da etapa.
+    Com o tracemalloc ativo, registra também o pico de memória alocada na etapa
+    (aproximado: o tracemalloc não separa threads nem etapas aninhadas; meça uma revisão por vez).
+    """
+    memoria_inicio = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+    if memoria_inicio is not None:
+        tracemalloc.reset_peak()
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield atributos
+    except Exception as e:
+        erro = e
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        if memoria_inicio is not None and tracemalloc.is_tracing():
+            atributos["memoria_pico_bytes"] = max(0, tracemalloc.get_traced_memory()[1] - memoria_inicio)
+        metricas.observar("revisor_etapa_duracao_segundos", duracao, etapa=etapa)
+        if erro is not None:
+            metricas.incrementar("revisor_etapa_erros_total", etapa=etapa)
+        for nome, valor in atributos.items():
+            if isinstance(valor, int) and not isinstance(valor, bool):
+                metricas.incrementar(f"revisor_{nome}_total", valor, etapa=etapa)
+
+        trace = _trace_atual.get()
+        if trace is not None:
+            trace.adicionar({
+                "etapa": etapa,
+                "inicio_s": round(inicio - trace.inicio, 4),
+                "duracao_s": round(duracao, 4),
+                "erro": repr(erro) if erro is not None else None,
+                **atributos,
+            })
+
+
+def com_contexto(fn: Callable, *args, **kwargs) -> Callable[[], Any]:
+    """
+    Empacota a chamada para rodar em outra thread preservando o contexto atual
+    (o Trace ativo). Uso: executor.submit(com_contexto(fn, *args)).
+    """
+    contexto = contextvars.copy_context()
+    return lambda: contexto.run(fn, *args, **kwargs)
@@ -0,0 +1,169 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional
+
+# -----------------------------------------------------------
+# I. DIVISÃO DO TEXTO EM PARÁGRAFOS (Preservando os separadores)
+# -----------------------------------------------------------
+
+_SEPARADOR = re.compile(r"(\n[ \t]*\n\s*)")
+
+
+class Documento:
+    """
+    Texto dividido em parágrafos, guardando os separadores originais:
+    juntar() devolve exatamente o texto de entrada, byte a byte.
+    """
+    def __init__(self, texto: str):
+        partes = _SEPARADOR.split(texto)
+        self.paragrafos: List[str] = partes[0::2]
+        self.separadores: List[str] = partes[1::2]
+
+    def __len__(self) -> int:
+        return len(self.paragrafos)
+
+    def juntar(self, substituicoes: Optional[Dict[int, str]] = None) -> str:
+        """Texto completo, trocando os parágrafos indicados (índice -> novo texto)."""
+        substituicoes = substituicoes or {}
+        partes = []
+        for i, paragrafo in enumerate(self.paragrafos):
+            partes.append(substituicoes.get(i, paragrafo))
+            if i < len(self.separadores):
+                partes.append(self.separadores[i])
+        return "".join(partes)
+
+
+# -----------------------------------------------------------
+# II. PARÁGRAFOS CITADOS NA INSTRUÇÃO ("segundo parágrafo", "parágrafos 2 a 4"...)
+# -----------------------------------------------------------
+
+ORDINAIS = {
+    "primeir": 1, "segund": 2, "terceir": 3, "quart": 4, "quint": 5,
+    "sext": 6, "setim": 7, "oitav": 8, "non": 9, "decim": 10,
+}
+
+_UNIDADES = r"(?:primeir|segund|terceir|quart|quint|sext|setim|oitav|non)"
+# 'decimo primeiro' é um ordinal só (11), não 'decimo' + 'primeiro'
+_ORDINAL = rf"(?:\b\d+[oa°](?!\w)|\bdecim[oa](?:\s+{_UNIDADES}[oa])?\b|\b(?:{_UNIDADES}|penultim|ultim)[oa])"
+# Ordinais a partir de 20 por extenso não são interpretados: a instrução vai para o ajuste completo
+_ORDINAL_NAO_SUPORTADO = re.compile(r"\b(?:vigesim|trigesim|quadragesim|quinquagesim|centesim)[oa]")
+# Negação, exclusão ou alcance global: o parágrafo citado não é (ou não é só) o que deve mudar
+# ("não altere o segundo parágrafo", "exceto o primeiro", "use o tom do primeiro parágrafo em todo o texto")
+_ESCOPO_AMPLO = re.compile(
+    r"\b(?:nao|exceto|excetuando|menos|salvo|sem (?:alterar|mudar|mexer|modificar|tocar)"
+    r"|todo o (?:texto|documento)|(?:texto|documento) (?:todo|inteiro)|todos os paragrafos"
+    r"|o resto|restante|demais)\b"
+)
+_LIGACAO = r"\s*(?:,|\be\b|\ba\b|\bao\b|\bate\b|-)\s*(?:(?:d?o|d?a)\s+)?"
+
+# "segundo parágrafo", "2º e 3º parágrafos", "do primeiro ao terceiro parágrafo"
+_ANTES = re.compile(rf"((?:{_ORDINAL})(?:{_LIGACAO}(?:{_ORDINAL}))*)\s+paragrafos?\b")
+# Depois de um número de continuação, só palavras de ligação: "e 3 exemplos" é uma quantidade, não um parágrafo
+_PALAVRAS_LIGACAO = r"(?:e|ou|a|o|as|os|ao|aos|ate|de|do|da|dos|das|no|na|nos|nas|em|para|com|sem|por|pelo|pela|que)"
+_CONTINUACAO = rf"\s*(?:,|\be\b|\ba\b|\bate\b|-)\s*\d+(?!\d)(?!\s+(?!{_PALAVRAS_LIGACAO}\b)[a-z])"
+# "parágrafo 2", "parágrafos 2 a 4", "parágrafos 1, 3 e 5"
+_DEPOIS = re.compile(rf"\bparagrafos?\s+(\d+(?:{_CONTINUACAO})*)\b")
+
+
+def _normalizar(texto: str) -> str:
+    sem_acentos = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in sem_acentos if not unicodedata.combining(c)).casefold()
+
+
+def _numero(token: str, total: int) -> Optional[int]:
+    """Posição (base 1) de um ordinal: '2o', 'segundo', 'ultimo', 'penultimo'."""
+    digitos = re.match(r"\d+", token)
+    if digitos:
+        return int(digitos.group())
+    if token.startswith("penultim"):
+        return total - 1
+    if token.startswith("ultim"):
+        return total
+    if token.startswith("decim"):
+        unidade = token.split()[1:]
+        return 10 + (_numero(unidade[0], total) or 0) if unidade else 10
+    for radical, numero in ORDINAIS.items():
+        if token.startswith(radical):
+            return numero
+    return None
+
+
+def _expandir(trecho: str, total: int) -> List[int]:
+    """Converte 'segundo e quarto' / '2 a 4' em posições (base 1), expandindo intervalos."""
+    tokens = re.findall(rf"{_ORDINAL}|\d+|\bao\b|\ba\b|\bate\b|-", trecho)
+    posicoes: List[int] = []
+    intervalo = False
+    for token in tokens:
+        if token in ("a", "ao", "ate", "-"):
+            intervalo = bool(posicoes)
+            continue
+        numero = _numero(token, total)
+        if numero is None:
+            continue
+        if intervalo:
+            posicoes.extend(range(posicoes[-1] + 1, numero + 1))
+        else:
+            posicoes.append(numero)
+        intervalo = False
+    return posicoes
+
+
+def paragrafos_citados(instrucao: str, total: int) -> Optional[List[int]]:
+    """
+    Índices (base 0, ordenados) dos parágrafos aos quais a instrução se refere, ou None
+    se ela não citar nenhum parágrafo específico (ou citar um que não existe), se o
+    alcance dela for mais amplo que os citados (negação, exclusão, "todo o texto")
+    ou se usar um ordinal que não é interpretado.
+    """
+    texto = _normalizar(instrucao)
+    if _ESCOPO_AMPLO.search(texto) or _ORDINAL_NAO_SUPORTADO.search(texto):
+        return None
+    posicoes: List[int] = []
+    for padrao in (_ANTES, _DEPOIS):
+        for encontrado in padrao.finditer(texto):
+            posicoes.extend(_expandir(encontrado.group(1), total))
+    if not posicoes or any(p < 1 or p > total for p in posicoes):
+        return None
+    return sorted({p - 1 for p in posicoes})
+
+
+# -----------------------------------------------------------
+# III. DIVISÃO DE DOCUMENTOS LONGOS EM SEÇÕES (Títulos e parágrafos)
+# -----------------------------------------------------------
+
+# Linha de título: markdown ('## Manejo'), numerada ('2.1 Aplicação') ou toda em maiúsculas ('MODO DE USO')
+_TITULO = re.compile(
+    r"^(?:#{1,6}\s+\S.*"
+    r"|\d+(?:\.\d+)*[.)]?\s+[A-ZÀ-Ý].{0,100}"
+    r"|[A-ZÀ-Ý0-9][A-ZÀ-Ý0-9 ,;:()/\-]{3,100})$"
+)
+
+
+def eh_titulo(paragrafo: str) -> bool:
+    primeira_linha = paragrafo.strip().split("\n", 1)[0].strip()
+    return bool(_TITULO.match(primeira_linha)) and len(paragrafo.strip().split("\n")) <= 2
+
+
+def dividir_em_secoes(texto: str, max_caracteres: int = 4000, min_caracteres: int = 1000) -> List[str]:
+    """
+    Divide um documento longo em seções: uma nova seção começa em cada título (se a seção
+    atual já tiver corpo e ao menos `min_caracteres`) ou quando ela passaria de `max_caracteres`.
+    Parágrafos nunca são partidos; um parágrafo maior que o limite vira uma seção sozinho.
+    """
+    secoes: List[str] = []
+    atual: List[str] = []
+    tamanho = 0
+    tem_corpo = False
+    for paragrafo in Documento(texto).paragrafos:
+        if not paragrafo.strip():
+            continue
+        titulo = eh_titulo(paragrafo)
+        if atual and ((titulo and tem_corpo and tamanho >= min_caracteres) or tamanho + len(paragrafo) > max_caracteres):
+            secoes.append("\n\n".join(atual))
+            atual, tamanho, tem_corpo = [], 0, False
+        atual.append(paragrafo)
+        tamanho += len(paragrafo)
+        tem_corpo = tem_corpo or not titulo
+    if atual:
+        secoes.append("\n\n".join(atual))
+    return secoes
@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional, Tuple, TypeVar
+from dotenv import load_dotenv
+
+from metricas import metricas, com_contexto
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES (Prazo por revisão e hedging)
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+# Prazo total de uma revisão (ou ajuste), dividido entre as etapas
+REVISAO_PRAZO_S = float(os.getenv("REVISAO_PRAZO_S", "120"))
+
+# Hedging: se uma chamada idempotente passar do p95 das tentativas anteriores, uma cópia é disparada
+HEDGE_ATIVO = os.getenv("HEDGE_ATIVO", "1") not in ("0", "false", "False")
+HEDGE_PERCENTIL = float(os.getenv("HEDGE_PERCENTIL", "95"))
+HEDGE_MIN_AMOSTRAS = int(os.getenv("HEDGE_MIN_AMOSTRAS", "20"))
+HEDGE_ATRASO_MIN_S = float(os.getenv("HEDGE_ATRASO_MIN_S", "0.05"))
+_executor_hedge = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_MAX_WORKERS", "32")), thread_name_prefix="hedge")
+
+
+class PrazoEsgotado(TimeoutError):
+    """O prazo da revisão acabou antes (ou durante) a etapa."""
+
+
+# -----------------------------------------------------------
+# II. PRAZO DA REVISÃO (contextvar, propagado para threads e tarefas)
+# -----------------------------------------------------------
+
+_prazo: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("prazo", default=None)
+
+
+@contextmanager
+def prazo(segundos: float) -> Iterator[float]:
+    """
+    Define o prazo do bloco (instante em time.monotonic). Um prazo já ativo mais curto prevalece.
+    Como o Trace, ele segue para as threads (com_contexto) e para as tarefas asyncio.
+    """
+    limite = time.monotonic() + segundos
+    atual = _prazo.get()
+    if atual is not None:
+        limite = min(limite, atual)
+    token = _prazo.set(limite)
+    try:
+        yield limite
+    finally:
+        _prazo.reset(token)
+
+
+@contextmanager
+def prazo_da_operacao(segundos: float) -> Iterator[float]:
+    """
+    Prazo de uma revisão ou ajuste: o que quem chamou já definiu (ex.: o servidor, com SERVIDOR_TIMEOUT_S)
+    ou, se não houver nenhum ativo, um novo de `segundos` (REVISAO_PRAZO_S).
+    """
+    atual = _prazo.get()
+    if atual is not None:
+        yield atual
+        return
+    with prazo(segundos) as limite:
+        yield limite
+
+
+def restante() -> Optional[float]:
+    """Segundos até o fim do prazo ativo (None se não houver prazo)."""
+    limite = _prazo.get()
+    return None if limite is None else max(0.0, limite - time.monotonic())
+
+
+def timeout_etapa(padrao: float, fracao: float = 1.0) -> float:
+    """Timeout de uma etapa: o padrão dela, limitado à fração indicada do que resta do prazo."""
+    tempo = restante()
+    return padrao if tempo is None else min(padrao, tempo * fracao)
+
+
+def verificar_prazo(etapa: str) -> None:
+    """Levanta PrazoEsgotado se o prazo já acabou (evita começar uma chamada que não tem como terminar)."""
+    if restante() == 0.0:
+        metricas.incrementar("revisor_prazos_esgotados_total", etapa=etapa)
+        raise PrazoEsgotado(f"prazo da revisão esgotado antes da etapa '{etapa}'")
+
+
+def limitar_timeout(timeout: Tuple[float, float]) -> Tuple[float, float]:
+    """(connect, read) do requests limitado ao que resta do prazo."""
+    tempo = restante()
+    if tempo is None:
+        return timeout
+    return min(timeout[0], max(tempo, 0.001)), min(timeout[1], max(tempo, 0.001))
+
+
+# -----------------------------------------------------------
+# III. HEDGING (Cópia da chamada após o p95; vale a primeira resposta)
+# -----------------------------------------------------------
+
+T = TypeVar("T")
+
+
+def _atraso_hedge(etapa: str) -> Optional[float]:
+    """p95 das tentativas da etapa, ou None se o hedging estiver desligado ou houver poucas amostras."""
+    if not HEDGE_ATIVO or metricas.contagem("revisor_tentativa_duracao_segundos", etapa=etapa) < HEDGE_MIN_AMOSTRAS:
+        return None
+    p95 = metricas.percentil("revisor_tentativa_duracao_segundos", HEDGE_PERCENTIL, etapa=etapa)
+    return max(HEDGE_ATRASO_MIN_S, p95 or 0.0)
+
+
+def _medir(etapa: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    inicio = time.perf_counter()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        metricas.observar("revisor_tentativa_duracao_segundos", time.perf_counter() - inicio, etapa=etapa)
+
+
+def com_hedge(etapa: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Executa fn (idempotente) e, se ela passar do p95 das tentativas anteriores da etapa,
+    dispara uma cópia; vale o primeiro resultado (um erro só vale se as duas falharem).
+    A tentativa perdedora não é interrompida: termina em segundo plano e é descartada.
+    """
+    atraso = _atraso_hedge(etapa)
+    if atraso is None or (restante() is not None and restante() <= atraso):
+        return _medir(etapa, fn, *args, **kwargs)
+
+    tentativas = [_executor_hedge.submit(com_contexto(_medir, etapa, fn, *args, **kwargs))]
+    feitas, _ = wait(tentativas, timeout=atraso)
+    if not feitas:
+        metricas.incrementar("revisor_hedges_total", etapa=etapa)
+        tentativas.append(_executor_hedge.submit(com_contexto(_medir, etapa, fn, *args, **kwargs)))
+
+    pendentes = set(tentativas)
+    primeiro_erro = None
+    while pendentes:
+        feitas, pendentes = wait(pendentes, timeout=restante(), return_when=FIRST_COMPLETED)
+        if not feitas:
+            raise PrazoEsgotado(f"prazo da revisão esgotado durante a etapa '{etapa}'")
+        for futuro in feitas:
+            if futuro.exception() is None:
+                if futuro is not tentativas[0]:
+                    metricas.incrementar("revisor_hedges_vencedores_total", etapa=etapa)
+                return futuro.result()
+            primeiro_erro = primeiro_erro or futuro.exception()
+    raise primeiro_erro
+
+
+async def _amedir(etapa: str, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    inicio = time.perf_counter()
+    try:
+        return await fn(*args, **kwargs)
+    finally:
+        metricas.observar("revisor_tentativa_duracao_segundos", time.perf_counter() - inicio, etapa=etapa)
+
+
+async def acom_hedge(etapa: str, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+    """Variante de com_hedge para corrotinas: aqui a tentativa perdedora é cancelada."""
+    atraso = _atraso_hedge(etapa)
+    if atraso is None or (restante() is not None and restante() <= atraso):
+        return await _amedir(etapa, fn, *args, **kwargs)
+
+    tentativas = [asyncio.ensure_future(_amedir(etapa, fn, *args, **kwargs))]
+    feitas, _ = await asyncio.wait(tentativas, timeout=atraso)
+    if not feitas:
+        metricas.incrementar("revisor_hedges_total", etapa=etapa)
+        tentativas.append(asyncio.ensure_future(_amedir(etapa, fn, *args, **kwargs)))
+
+    pendentes = set(tentativas)
+    primeiro_erro = None
+    try:
+        while pendentes:
+            feitas, pendentes = await asyncio.wait(pendentes, timeout=restante(), return_when=asyncio.FIRST_COMPLETED)
+            if not feitas:
+                raise PrazoEsgotado(f"prazo da revisão esgotado durante a etapa '{etapa}'")
+            for tarefa in feitas:
+                if tarefa.exception() is None:
+                    if tarefa is not tentativas[0]:
+                        metricas.incrementar("revisor_hedges_vencedores_total", etapa=etapa)
+                    return tarefa.result()
+                primeiro_erro = primeiro_erro or tarefa.exception()
+        raise primeiro_erro
+    finally:
+        for tarefa in tentativas:
+            tarefa.cancel()
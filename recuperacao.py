@@ -0,0 +1,264 @@
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Set, Tuple
+from conexao_banco import SearchHit
+
+# -----------------------------------------------------------
+# I. DIVISÃO DO TEXTO EM CHUNKS (Para a busca multivetorial)
+# -----------------------------------------------------------
+
+def dividir_em_chunks(texto: str, tamanho: int = 800, sobreposicao: int = 200, max_chunks: int = 16) -> List[str]:
+    """
+    Divide o texto em janelas de até `tamanho` caracteres com `sobreposicao` entre elas,
+    sempre cortando em fronteira de palavra. Limita o total a `max_chunks`.
+    """
+    texto = texto.strip()
+    if len(texto) <= tamanho:
+        return [texto] if texto else []
+
+    chunks = []
+    inicio = 0
+    while inicio < len(texto) and len(chunks) < max_chunks:
+        fim = min(inicio + tamanho, len(texto))
+        if fim < len(texto):
+            # Recua até o último espaço para não cortar palavras
+            corte = texto.rfind(" ", inicio, fim)
+            if corte > inicio:
+                fim = corte
+        chunks.append(texto[inicio:fim].strip())
+        if fim >= len(texto):
+            break
+        proximo = fim - sobreposicao
+        if proximo <= inicio:
+            inicio = fim
+            continue
+        # Avança até o início da próxima palavra dentro da sobreposição
+        espaco = texto.find(" ", proximo, fim)
+        inicio = espaco + 1 if espaco != -1 else proximo
+    return [c for c in chunks if c]
+
+
+# -----------------------------------------------------------
+# II. FUSÃO DAS LISTAS DE RESULTADOS (Reciprocal Rank Fusion)
+# -----------------------------------------------------------
+
+def fundir_rrf(listas: List[List[SearchHit]], limit: int, k: int = 60) -> List[SearchHit]:
+    """
+    Funde várias listas ranqueadas em um único top-k sem duplicatas, por Reciprocal Rank Fusion:
+    score_rrf(doc) = soma de 1 / (k + posição) em cada lista onde o doc aparece.
+    Cada hit mantém o melhor score de similaridade observado.
+    """
+    pontuacao: Dict[str, float] = {}
+    melhores: Dict[str, SearchHit] = {}
+    for lista in listas:
+        for posicao, hit in enumerate(lista, 1):
+            pontuacao[hit.id] = pontuacao.get(hit.id, 0.0) + 1.0 / (k + posicao)
+            atual = melhores.get(hit.id)
+            if atual is None or (hit.score or 0.0) > (atual.score or 0.0):
+                melhores[hit.id] = hit
+
+    ordenados = sorted(pontuacao, key=pontuacao.get, reverse=True)
+    return [melhores[doc_id] for doc_id in ordenados[:limit]]
+
+
+# -----------------------------------------------------------
+# III. CONTEXTO RAG COM ORÇAMENTO DE TOKENS
+# -----------------------------------------------------------
+
+MODELO_TOKENIZADOR = "gpt-3.5-turbo"
+
+
+@lru_cache(maxsize=None)
+def _tokenizador():
+    """Tokenizador do tiktoken para o modelo de geração (None se o pacote ou o arquivo de encoding não estiverem disponíveis)."""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(MODELO_TOKENIZADOR)
+    except Exception as e:
+        print(f"⚠️ tiktoken indisponível ({e}). Tokens serão estimados por caracteres/4.")
+        return None
+
+
+def contar_tokens(texto: str) -> int:
+    """Número de tokens do texto para o modelo de geração (estimativa de 4 caracteres por token sem o tiktoken)."""
+    tokenizador = _tokenizador()
+    if tokenizador is None:
+        return (len(texto) + 3) // 4
+    return len(tokenizador.encode(texto, disallowed_special=()))
+
+
+_PALAVRA = re.compile(r"\w+", re.UNICODE)
+_FIM_DE_SENTENCA = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+# Palavras muito frequentes não ajudam a medir a relevância de uma sentença
+STOPWORDS = frozenset(
+    "a o e é de da do das dos em no na nos nas um uma uns umas para por com sem que se ao aos à às "
+    "ou como mais menos muito pela pelo pelas pelos sua seu suas seus entre sobre também já não".split()
+)
+
+
+def palavras(texto: str) -> List[str]:
+    """Termos do texto em minúsculas, sem stopwords nem termos de uma letra."""
+    return [p for p in _PALAVRA.findall(texto.casefold()) if len(p) > 1 and p not in STOPWORDS]
+
+
+def _shingles(termos: List[str], k: int = 5) -> Set[Tuple[str, ...]]:
+    if len(termos) < k:
+        return {tuple(termos)} if termos else set()
+    return {tuple(termos[i:i + k]) for i in range(len(termos) - k + 1)}
+
+
+def jaccard(a: Set, b: Set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _trecho_relevante(texto: str, termos_consulta: Set[str], max_tokens: int) -> str:
+    """
+    Escolhe as sentenças do texto que mais compartilham termos com a consulta até `max_tokens`,
+    devolvendo-as na ordem original (sentenças nunca são cortadas no meio).
+    """
+    # Sentenças repetidas dentro da mesma fonte entram uma vez só
+    sentencas = list(dict.fromkeys(s.strip() for s in _FIM_DE_SENTENCA.split(texto) if s.strip()))
+    if contar_tokens(texto) <= max_tokens:
+        return " ".join(sentencas)
+
+    def relevancia(i: int) -> float:
+        termos = set(palavras(sentencas[i]))
+        # Termos em comum, normalizados para não favorecer só as sentenças longas
+        return len(termos & termos_consulta) / math.sqrt(len(termos) + 1)
+
+    escolhidas = []
+    usados = 0
+    for i in sorted(range(len(sentencas)), key=relevancia, reverse=True):
+        tokens = contar_tokens(sentencas[i])
+        if usados + tokens > max_tokens:
+            continue
+        escolhidas.append(i)
+        usados += tokens
+    if not escolhidas and sentencas:
+        # Nenhuma sentença cabe inteira: corta a mais relevante em fronteira de palavra
+        melhor = max(range(len(sentencas)), key=relevancia)
+        return _cortar_em_palavra(sentencas[melhor], max_tokens)
+    return " ".join(sentencas[i] for i in sorted(escolhidas))
+
+
+def _cortar_em_palavra(texto: str, max_tokens: int) -> str:
+    palavras_texto = texto.split()
+    while palavras_texto and contar_tokens(" ".join(palavras_texto)) > max_tokens:
+        # Remove o excesso estimado de uma vez (e ao menos uma palavra) até caber
+        excesso = contar_tokens(" ".join(palavras_texto)) - max_tokens
+        palavras_texto = palavras_texto[:-max(1, excesso // 2)]
+    return " ".join(palavras_texto)
+
+
+def montar_contexto(
+    hits: List[SearchHit],
+    consulta: str,
+    max_tokens: int = 1500,
+    max_tokens_fonte: int = 300,
+    limiar_duplicata: float = 0.8
+) -> Tuple[str, List[SearchHit]]:
+    """
+    Monta o bloco de referencial teórico dentro de um orçamento de tokens:
+    - usa apenas o texto de cada hit (SearchHit.texto), nunca _id/$vector;
+    - descarta passagens quase duplicadas (Jaccard de shingles >= limiar_duplicata);
+    - de cada fonte, mantém as sentenças mais relevantes para a consulta (até max_tokens_fonte).
+    Retorna (contexto, hits_usados), na ordem do ranking.
+    """
+    termos_consulta = set(palavras(consulta))
+    vistos: List[Set[Tuple[str, ...]]] = []
+    usados: List[SearchHit] = []
+    blocos: List[str] = []
+    tokens_total = 0
+
+    for hit in hits:
+        texto = hit.texto.strip()
+        if not texto:
+            continue
+        shingles = _shingles(palavras(texto))
+        if any(jaccard(shingles, anterior) >= limiar_duplicata for anterior in vistos):
+            continue
+
+        cabecalho = f"--- Fonte {len(usados) + 1} ---\n"
+        disponivel = min(max_tokens_fonte, max_tokens - tokens_total - contar_tokens(cabecalho) - 1)
+        if disponivel <= 0:
+            break
+        trecho = _trecho_relevante(texto, termos_consulta, disponivel)
+        if not trecho:
+            continue
+        bloco = f"{cabecalho}{trecho}\n"
+        tokens = contar_tokens(bloco)
+        if tokens_total + tokens > max_tokens:
+            break
+
+        vistos.append(shingles)
+        usados.append(hit)
+        blocos.append(bloco)
+        tokens_total += tokens
+
+    return "".join(blocos), usados
+
+
+# -----------------------------------------------------------
+# IV. RERANKING (Similaridade + BM25) E CORTE ADAPTATIVO
+# -----------------------------------------------------------
+
+def bm25(termos_consulta: List[str], documentos: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Score BM25 de cada documento (lista de termos) para a consulta; o IDF é calculado sobre os próprios documentos."""
+    if not documentos:
+        return []
+    n = len(documentos)
+    media = sum(len(d) for d in documentos) / n or 1.0
+    frequencias = [Counter(d) for d in documentos]
+    scores = []
+    for doc, freq in zip(documentos, frequencias):
+        score = 0.0
+        for termo in set(termos_consulta):
+            tf = freq.get(termo, 0)
+            if not tf:
+                continue
+            df = sum(1 for f in frequencias if termo in f)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(doc) / media))
+        scores.append(score)
+    return scores
+
+
+def reranquear(
+    hits: List[SearchHit],
+    consulta: str,
+    peso_lexico: float = 0.3,
+    score_minimo: float = 0.6,
+    salto_maximo: float = 0.05,
+    min_fontes: int = 1
+) -> List[SearchHit]:
+    """
+    Corta a lista de forma adaptativa pela similaridade vetorial e reordena o que sobrou:
+    - descarta hits com similaridade abaixo de score_minimo;
+    - para no primeiro salto de similaridade entre hits consecutivos maior que salto_maximo;
+    - ordena os mantidos pela combinação da similaridade com o BM25 contra a consulta
+      (normalizado pelo maior da lista), com peso peso_lexico.
+    Sempre mantém ao menos min_fontes hits (os mais similares), se houver.
+    """
+    por_similaridade = sorted(hits, key=lambda hit: hit.score or 0.0, reverse=True)
+    mantidos: List[SearchHit] = []
+    for hit in por_similaridade:
+        score = hit.score or 0.0
+        if len(mantidos) >= min_fontes:
+            if score < score_minimo or (mantidos[-1].score or 0.0) - score > salto_maximo:
+                break
+        mantidos.append(hit)
+    if not mantidos:
+        return []
+
+    lexicos = bm25(palavras(consulta), [palavras(hit.texto) for hit in mantidos])
+    maior = max(lexicos) or 1.0
+    combinados = {
+        hit.id: (1 - peso_lexico) * (hit.score or 0.0) + peso_lexico * lexico / maior
+        for hit, lexico in zip(mantidos, lexicos)
+    }
+    return sorted(mantidos, key=lambda hit: combinados[hit.id], reverse=True)
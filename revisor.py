@@ -1,139 +1,407 @@
-import openai
 import os
 import json
 import hashlib
-from typing import List, Dict, Optional
+import re
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextlib import closing
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Iterator, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 # 🚨 IMPORTAÇÃO DOS MÓDULOS DE LÓGICA
-try:
-    from classificacao import classificar_texto 
-    print("✅ Módulo 'classificacao' importado.")
-    from conexao_banco import AstraDBClient, astra_client
-    print("✅ Módulo 'conexao_banco' importado.")
-except ImportError as e:
-    print(f"❌ ERRO: Verifique se os arquivos classificacao.py e conexao_banco.py estão no diretório. Erro: {e}")
-    # Abortar se as dependências não puderem ser carregadas
-    exit()
+# (Importar não cria clientes nem faz chamadas: tudo é inicializado sob demanda)
+from classificacao import classificar_texto, CATEGORIAS_VALIDAS
+from conexao_banco import AstraDBClient, SearchHit, dimensao_colecao, get_astra_client
+from cache import EmbeddingCache, GenerationCache
+from indice_lexico import COLECAO_PRODUTOS, get_indice_lexico
+from paragrafos import Documento, paragrafos_citados, dividir_em_secoes
+from recuperacao import dividir_em_chunks, fundir_rrf, montar_contexto, contar_tokens, reranquear
+from coalescencia import coalescer, chave_coalescencia
+from limites import limite, chamar, consumir_tokens
+from metricas import metricas, span, com_contexto
+from prazos import REVISAO_PRAZO_S, prazo, prazo_da_operacao, restante, timeout_etapa, verificar_prazo, com_hedge
 
 
 load_dotenv() # Carrega as variáveis do arquivo .env localmente
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Define a chave de ambiente para o cliente OpenAI
-os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
-if not OPENAI_API_KEY:
-    print("❌ ATENÇÃO: OPENAI_API_KEY não está definida.")
+# Backend da busca vetorial: 'astra' (remoto, padrão) ou 'local' (snapshot em memória, ver indice_local.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "astra").lower()
+
+
+@lru_cache(maxsize=None)
+def get_vector_client():
+    """Cliente da busca vetorial (Astra ou índice local), criado na primeira chamada."""
+    if VECTOR_BACKEND == "local":
+        from indice_local import LocalVectorIndex
+        return LocalVectorIndex()
+    return get_astra_client()
+
+# Modo de recuperação: 'simples' (embedding de content[:800]) ou 'chunks' (multivetorial, todo o texto)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "simples").lower()
+MODOS_BUSCA = ("simples", "chunks")
+RETRIEVAL_MAX_WORKERS = int(os.getenv("RETRIEVAL_MAX_WORKERS", "8"))
+
+# Orçamento do referencial teórico no prompt (tokens do modelo de geração)
+CONTEXTO_MAX_TOKENS = int(os.getenv("CONTEXTO_MAX_TOKENS", "1500"))
+CONTEXTO_MAX_TOKENS_FONTE = int(os.getenv("CONTEXTO_MAX_TOKENS_FONTE", "300"))
+CONTEXTO_LIMIAR_DUPLICATA = float(os.getenv("CONTEXTO_LIMIAR_DUPLICATA", "0.8"))
+
+# Reranking antes do prompt: corte adaptativo pela similaridade e peso do BM25 na nova ordem
+RERANK_PESO_LEXICO = float(os.getenv("RERANK_PESO_LEXICO", "0.3"))
+RERANK_SCORE_MINIMO = float(os.getenv("RERANK_SCORE_MINIMO", "0.6"))
+RERANK_SALTO_MAXIMO = float(os.getenv("RERANK_SALTO_MAXIMO", "0.05"))
+
+# Produtos citados pelo nome (ver indice_lexico.py), com as fichas buscadas por _id e fixadas no início do contexto:
+# 'complementar' (junto com a classificação e a busca vetorial), 'substituir' (havendo produto citado, pula a
+# classificação, o embedding e a busca vetorial) ou 'desligado'
+LEXICO_MODO = os.getenv("LEXICO_MODO", "complementar").lower()
+LEXICO_MAX_DOCS = int(os.getenv("LEXICO_MAX_DOCS", "6"))
+
+# Ajuste incremental: 'paragrafos' (só os parágrafos citados na instrução vão ao LLM) ou 'completo'
+AJUSTE_MODO = os.getenv("AJUSTE_MODO", "paragrafos").lower()
+AJUSTE_PARAGRAFOS_VIZINHOS = int(os.getenv("AJUSTE_PARAGRAFOS_VIZINHOS", "1"))
+
+# Documentos longos: revisados por seções, com no máximo SECOES_MAX_CONCORRENCIA seções em paralelo
+DOCUMENTO_LONGO_MIN_CARACTERES = int(os.getenv("DOCUMENTO_LONGO_MIN_CARACTERES", "8000"))
+SECAO_MAX_CARACTERES = int(os.getenv("SECAO_MAX_CARACTERES", "4000"))
+SECAO_MIN_CARACTERES = int(os.getenv("SECAO_MIN_CARACTERES", "1000"))
+SECOES_MAX_CONCORRENCIA = int(os.getenv("SECOES_MAX_CONCORRENCIA", "4"))
+_executor_secoes = ThreadPoolExecutor(max_workers=SECOES_MAX_CONCORRENCIA, thread_name_prefix="secao")
+
+# Prefixos das mensagens de erro retornadas (como texto) pelo pipeline
+PREFIXOS_ERRO = ("Erro na classificação", "Erro fatal na geração do Embedding", "ERRO NA GERAÇÃO DO LLM")
+
+# Pool compartilhado para as buscas concorrentes (uma por chunk)
+_executor_busca = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="busca")
+
+# Timeouts (em segundos) das etapas que rodam em paralelo no início do pipeline
+STAGE_TIMEOUT_CLASSIFICACAO = float(os.getenv("STAGE_TIMEOUT_CLASSIFICACAO", "20"))
+STAGE_TIMEOUT_EMBEDDING = float(os.getenv("STAGE_TIMEOUT_EMBEDDING", "20"))
+
+# Busca vetorial (e por ID): o mesmo papel para a etapa 2
+STAGE_TIMEOUT_BUSCA = float(os.getenv("STAGE_TIMEOUT_BUSCA", "20"))
+# Fração do que resta do prazo da revisão que cada etapa de preparo pode usar (o restante fica para a geração)
+PRAZO_FRACAO_PREPARO = float(os.getenv("PRAZO_FRACAO_PREPARO", "0.5"))
+
+# Timeouts por chamada à OpenAI (também limitados pelo prazo da revisão)
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "120"))
+OPENAI_EMBEDDING_TIMEOUT_S = float(os.getenv("OPENAI_EMBEDDING_TIMEOUT_S", "20"))
+# As novas tentativas do SDK (com backoff próprio, alheio ao prazo) só valem se sobrar ao menos isto de prazo
+OPENAI_RETENTATIVAS_MIN_PRAZO_S = float(os.getenv("OPENAI_RETENTATIVAS_MIN_PRAZO_S", "10"))
+
+def cliente_no_prazo(client):
+    """O cliente da OpenAI (sync ou async), sem as novas tentativas do SDK quando o prazo está curto."""
+    tempo = restante()
+    if tempo is not None and tempo < OPENAI_RETENTATIVAS_MIN_PRAZO_S:
+        return client.with_options(max_retries=0)
+    return client
+
+
+# Pool para as etapas independentes (classificação Gemini e embedding OpenAI)
+_executor_pipeline = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PIPELINE_MAX_WORKERS", "16")), thread_name_prefix="pipeline"
+)
 
 # -----------------------------------------------------------
 # II. CLASSE LLMClient (Para gerar a correção)
 # -----------------------------------------------------------
 
+LLM_MODEL = "gpt-3.5-turbo"
+
+
+class ErroGeracao(str):
+    """
+    Mensagem de erro da geração: continua sendo o texto mostrado ao usuário, mas marcada
+    para não ser tomada por resposta (nem ir para o cache). No streaming, chega como um
+    trecho próprio, possivelmente depois de trechos válidos.
+    """
+
+
+def resposta_com_erro(*trechos: str) -> bool:
+    """
+    Verdadeiro se a resposta do pipeline (inteira ou nos trechos do streaming) falhou: vazia,
+    com algum trecho ErroGeracao ou começando por uma das mensagens de PREFIXOS_ERRO.
+    """
+    texto = "".join(trechos).lstrip()
+    return not texto or any(isinstance(t, ErroGeracao) for t in trechos) or texto.startswith(PREFIXOS_ERRO)
+
+
 class LLMClient:
     """Classe wrapper para o cliente de Chat Completion da OpenAI, simulando 'generate_content'."""
-    def __init__(self, api_key: str, model: str = "gpt-3.5-turbo"):
-        # Inicializa o cliente OpenAI
+    def __init__(self, api_key: str, model: str = LLM_MODEL):
+        # Inicializa o cliente OpenAI (o SDK só é importado aqui: o import é lento)
+        import openai
         self.client = openai.OpenAI(api_key=api_key)
         self.model = model
         print(f"✅ LLMClient inicializado com modelo: {self.model}")
 
     def generate_content(self, prompt: str) -> str:
         """Método que simula a interface generate_content."""
+        import openai
         print("\n--- Chamando OpenAI Chat Completion ---")
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
-        except openai.APIError as e:
-            print(f"❌ ERRO NA GERAÇÃO DO LLM (API Error): {e}")
-            return f"ERRO NA GERAÇÃO DO LLM (API Error): {str(e)}"
-        except Exception as e:
-            print(f"❌ ERRO NA GERAÇÃO DO LLM (Geral): {e}")
-            return f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}"
+        with span("geracao", modelo=self.model) as atributos:
+            try:
+                # Prompts idênticos em andamento (mesmo texto, mesmas fontes) compartilham uma geração
+                return coalescer("geracao", chave_coalescencia(self.model, prompt), self._completar, prompt, atributos)
+            except openai.APIError as e:
+                print(f"❌ ERRO NA GERAÇÃO DO LLM (API Error): {e}")
+                return ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (API Error): {str(e)}")
+            except Exception as e:
+                print(f"❌ ERRO NA GERAÇÃO DO LLM (Geral): {e}")
+                return ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}")
+
+    def _completar(self, prompt: str, atributos: Dict) -> str:
+        """Chamada ao Chat Completion; o uso de tokens vai para o span de quem fez a chamada."""
+        verificar_prazo("geracao")
+        # Cota de tokens: o prompt é reservado antes; a resposta é descontada quando chega
+        response = chamar("openai", lambda: cliente_no_prazo(self.client).chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
+                {"role": "user", "content": prompt}
+            ],
+            timeout=timeout_etapa(OPENAI_TIMEOUT_S)
+        ), tokens=contar_tokens(prompt))
+        if response.usage:
+            atributos["tokens_prompt"] = response.usage.prompt_tokens
+            atributos["tokens_completion"] = response.usage.completion_tokens
+            consumir_tokens("openai", response.usage.completion_tokens)
+        return response.choices[0].message.content
 
-# Inicializa o cliente
-modelo_texto = LLMClient(api_key=OPENAI_API_KEY)
+    def generate_content_stream(self, prompt: str) -> Iterator[str]:
+        """Variante em streaming de generate_content: produz os trechos do texto conforme chegam."""
+        import openai
+        print("\n--- Chamando OpenAI Chat Completion (streaming) ---")
+        with span("geracao", modelo=self.model, streaming=True) as atributos:
+            try:
+                # O slot do provedor fica ocupado enquanto o stream estiver aberto. O finally o libera
+                # também quando quem consome abandona o gerador (close() levanta GeneratorExit no yield)
+                vaga = limite("openai")
+                vaga.adquirir()
+                stream = None
+                try:
+                    stream = chamar("openai", lambda: cliente_no_prazo(self.client).chat.completions.create(
+                        model=self.model,
+                        messages=[
+                            {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        stream=True,
+                        # O último chunk traz o uso de tokens (prompt/completion)
+                        stream_options={"include_usage": True},
+                        timeout=timeout_etapa(OPENAI_TIMEOUT_S)
+                    ), tokens=contar_tokens(prompt), vaga=False)
+                    inicio = time.perf_counter()
+                    for chunk in stream:
+                        if chunk.usage:
+                            atributos["tokens_prompt"] = chunk.usage.prompt_tokens
+                            atributos["tokens_completion"] = chunk.usage.completion_tokens
+                            consumir_tokens("openai", chunk.usage.completion_tokens)
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            if "primeiro_token_s" not in atributos:
+                                atributos["primeiro_token_s"] = round(time.perf_counter() - inicio, 4)
+                                metricas.observar("revisor_primeiro_token_segundos", atributos["primeiro_token_s"], modelo=self.model)
+                            yield chunk.choices[0].delta.content
+                finally:
+                    if stream is not None:
+                        stream.close() # Fecha a conexão HTTP em vez de deixá-la presa ao resto da resposta
+                    vaga.liberar()
+            except openai.APIError as e:
+                print(f"❌ ERRO NA GERAÇÃO DO LLM (API Error): {e}")
+                yield ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (API Error): {str(e)}")
+            except Exception as e:
+                print(f"❌ ERRO NA GERAÇÃO DO LLM (Geral): {e}")
+                yield ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}")
+
+@lru_cache(maxsize=None)
+def get_llm_client() -> LLMClient:
+    """Cliente LLM compartilhado pelo processo (o mesmo cliente OpenAI serve aos embeddings)."""
+    if not OPENAI_API_KEY:
+        print("❌ ATENÇÃO: OPENAI_API_KEY não está definida.")
+    return LLMClient(api_key=OPENAI_API_KEY)
+
+
+def verificar_conexao_openai() -> bool:
+    """
+    Verifica se a chave OpenAI está ativa consultando o modelo de embedding.
+    Não gera tokens (não consome cota), ao contrário de um embedding de teste.
+    """
+    try:
+        get_llm_client().client.models.retrieve(EMBEDDING_MODEL)
+        return True
+    except Exception as e:
+        print(f"❌ ERRO na verificação da chave OpenAI: {str(e)}")
+        return False
 
 
 # -----------------------------------------------------------
 # III. FUNÇÃO get_embedding (Para a busca vetorial)
 # -----------------------------------------------------------
 
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSOES_NATIVAS = 1536
+# Abaixo da nativa, a API devolve o vetor já encurtado (parâmetro dimensions dos modelos text-embedding-3):
+# requisições menores e busca mais barata, contra as coleções-sombra indexadas com essa dimensão
+EMBEDDING_DIMENSOES = int(os.getenv("EMBEDDING_DIMENSOES", str(EMBEDDING_DIMENSOES_NATIVAS)))
+EMBEDDING_REDUZIDO = EMBEDDING_DIMENSOES != EMBEDDING_DIMENSOES_NATIVAS
+# Coleção-sombra = coleção + sufixo (ex.: PRODUTO_512), com os mesmos _id da original
+EMBEDDING_SUFIXO_COLECAO = os.getenv("EMBEDDING_SUFIXO_COLECAO", f"_{EMBEDDING_DIMENSOES}")
+
+# Parâmetros do embeddings.create e identificação de modelo + dimensão no cache e na coalescência
+EMBEDDING_PARAMETROS = {"model": EMBEDDING_MODEL, **({"dimensions": EMBEDDING_DIMENSOES} if EMBEDDING_REDUZIDO else {})}
+EMBEDDING_CHAVE = f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSOES}" if EMBEDDING_REDUZIDO else EMBEDDING_MODEL
+
+
+def colecao_vetorial(colecao: str) -> str:
+    """Coleção consultada na busca vetorial: a própria ou, com dimensão reduzida, a sua coleção-sombra."""
+    return f"{colecao}{EMBEDDING_SUFIXO_COLECAO}" if EMBEDDING_REDUZIDO else colecao
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> EmbeddingCache:
+    """Cache em disco: reenviar o mesmo texto não paga uma nova chamada de embedding."""
+    return EmbeddingCache()
+
 def get_embedding(text: str) -> List[float]:
     """Obtém embedding do texto usando OpenAI com diagnóstico (adaptado do seu doc)."""
-    print("\n--- Chamando OpenAI Embedding ---")
-    try:
-        # Usa o cliente já inicializado para embeddings
-        client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        embedding = response.data[0].embedding
+    with span("embedding", textos=1) as atributos:
+        embedding = get_embedding_cache().get(text, EMBEDDING_CHAVE)
+        if embedding is not None:
+            print(f"✅ Embedding recuperado do cache. Dimensões: {len(embedding)}")
+            atributos["cache_hits"] = 1
+            return embedding
 
-        # --- DIAGNÓSTICO ---
-        print(f"✅ Embedding Gerado. Dimensões: {len(embedding)}. Primeiro valor: {embedding[0]:.6f}")
-        # --- FIM DIAGNÓSTICO ---
+        print("\n--- Chamando OpenAI Embedding ---")
+        try:
+            # Textos idênticos em andamento compartilham a mesma chamada
+            response = coalescer(
+                "embedding", chave_coalescencia(EMBEDDING_CHAVE, text), _criar_embeddings, text, atributos
+            )
+            embedding = response.data[0].embedding
+            get_embedding_cache().set(text, EMBEDDING_CHAVE, embedding)
 
-        return embedding
-    except Exception as e:
-        print(f"❌ ERRO na API OpenAI para Embedding: {str(e)}. Verifique se a chave está ativa.")
-        # Seu fallback de hash foi removido, pois ele falha na busca RAG e queremos testar a conexão real.
-        return []
+            # --- DIAGNÓSTICO ---
+            print(f"✅ Embedding Gerado. Dimensões: {len(embedding)}. Primeiro valor: {embedding[0]:.6f}")
+            # --- FIM DIAGNÓSTICO ---
 
+            return embedding
+        except Exception as e:
+            print(f"❌ ERRO na API OpenAI para Embedding: {str(e)}. Verifique se a chave está ativa.")
+            # Seu fallback de hash foi removido, pois ele falha na busca RAG e queremos testar a conexão real.
+            return []
 
 
-def reescrever_revisor(content: str, colecao_override: Optional[str] = None) -> str:
+def get_embeddings(texts: List[str]) -> List[List[float]]:
     """
-    Função principal que executa o pipeline RAG completo.
-    Atua como um Revisor Técnico, corrigindo imprecisões e enriquecendo o texto.
-    Aceita colecao_override para sobrepor a classificação do Gemini.
+    Obtém os embeddings de vários textos em UMA única requisição à OpenAI.
+    Textos já presentes no cache não são reenviados. Retorna [] em caso de erro.
     """
-    
-    colecao = None
-    
-    if colecao_override and colecao_override != "Automática (Classificação Gemini)":
-        # 1a. Usa a coleção fornecida pelo usuário
-        colecao = colecao_override
-        print(f"\n--- 1. COLEÇÃO DEFINIDA PELO USUÁRIO: {colecao} ---")
-    else:
-        # 1b. Executa a classificação normal do Gemini
-        print("\n--- 1. CLASSIFICAÇÃO AUTOMÁTICA (Gemini) ---")
-        colecao = classificar_texto(content)
-        print(f"Coleção Identificada: {colecao}")
-    
-    if colecao in ["ERRO", "CLASSIFICAÇÃO NÃO RECONHECIDA:", None]:
-        # Retorna a mensagem de erro como string, conforme solicitado.
-        return f"Erro na classificação/seleção da coleção. Classificação falhou com: {colecao if colecao else 'ERRO'}. Não foi possível iniciar a busca RAG."
+    with span("embedding", textos=len(texts)) as atributos:
+        cache = get_embedding_cache()
+        embeddings: List[Optional[List[float]]] = [cache.get(t, EMBEDDING_CHAVE) for t in texts]
+        faltantes = [i for i, e in enumerate(embeddings) if e is None]
+        atributos["cache_hits"] = len(texts) - len(faltantes)
+        if not faltantes:
+            print(f"✅ {len(texts)} embeddings recuperados do cache.")
+            return embeddings
 
-    # 2. EMBEDDING E BUSCA
-    embedding = get_embedding(content[:800])
-    
-    if not embedding or len(embedding) < 1536:
-        return "Erro fatal na geração do Embedding. Verifique sua chave OpenAI ativa. Não foi possível buscar no Astra DB."
-        
-    relevant_docs = astra_client.vector_search(colecao, embedding, limit=10)
-    print(f"2. Busca Vetorial concluída na coleção '{colecao}'. Documentos retornados: {len(relevant_docs)}")
-    
-    # 3. CONSTRÓI CONTEXTO RAG
-    rag_context = ""
-    if relevant_docs:
-        rag_context = "### REFERENCIAL TEÓRICO BUSCADO (RAG) ###\n"
-        for i, doc in enumerate(relevant_docs, 1):
-            doc_content = str(doc)
-            doc_clean = doc_content.replace('{', '').replace('}', '').replace("'", "").replace('"', '')
-            rag_context += f"--- Fonte {i} ---\n{doc_clean[:500]}...\n"
-    else:
-        rag_context = "Referencial teórico não retornou resultados específicos relevantes."
-    
-    # 4. PROMPT DE GERAÇÃO AUMENTADA (Mantendo o prompt anterior, mas removendo a 'instrucao_incremental')
-    final_prompt = f"""
+        print(f"\n--- Chamando OpenAI Embedding (lote de {len(faltantes)} textos) ---")
+        try:
+            entrada = [texts[i] for i in faltantes]
+            response = coalescer(
+                "embedding", chave_coalescencia(EMBEDDING_CHAVE, *entrada), _criar_embeddings, entrada, atributos
+            )
+            # A API devolve os itens com o índice da entrada correspondente
+            for item in response.data:
+                i = faltantes[item.index]
+                embeddings[i] = item.embedding
+                cache.set(texts[i], EMBEDDING_CHAVE, item.embedding)
+
+            print(f"✅ Embeddings Gerados: {len(faltantes)} | Do cache: {len(texts) - len(faltantes)}")
+            return embeddings
+        except Exception as e:
+            print(f"❌ ERRO na API OpenAI para Embedding em lote: {str(e)}. Verifique se a chave está ativa.")
+            return []
+
+
+def _criar_embeddings(entrada, atributos: Dict):
+    """Chamada ao Embedding da OpenAI (texto ou lista de textos), com o cliente já inicializado."""
+    verificar_prazo("embedding")
+    client = get_llm_client().client
+    tokens = contar_tokens(entrada) if isinstance(entrada, str) else sum(contar_tokens(t) for t in entrada)
+    # Idempotente: passando do p95, uma cópia é disparada e vale a primeira resposta
+    response = com_hedge("embedding", chamar, "openai", lambda: cliente_no_prazo(client).embeddings.create(
+        input=entrada,
+        **EMBEDDING_PARAMETROS,
+        timeout=timeout_etapa(OPENAI_EMBEDDING_TIMEOUT_S)
+    ), tokens=tokens)
+    atributos["tokens_prompt"] = response.usage.prompt_tokens
+    return response
+
+
+def buscar_multivetorial(colecao: str, embeddings: List[List[float]], limit: int = 10) -> List[SearchHit]:
+    """
+    Executa uma busca vetorial por embedding, de forma concorrente, e funde os
+    resultados (Reciprocal Rank Fusion) em um único top-k sem duplicatas.
+    """
+    colecao = colecao_vetorial(colecao)
+    if len(embeddings) == 1:
+        return get_vector_client().vector_search(colecao, embeddings[0], limit=limit)
+
+    vector_client = get_vector_client()
+    futuros = [
+        _executor_busca.submit(com_contexto(vector_client.vector_search, colecao, embedding, limit=limit))
+        for embedding in embeddings
+    ]
+    listas = [futuro.result() for futuro in futuros]
+    return fundir_rrf(listas, limit=limit)
+
+
+
+def _buscar_produtos(produtos: Dict[str, List[str]]) -> List[SearchHit]:
+    """Documentos dos produtos citados (até LEXICO_MAX_DOCS), buscados por _id: sem embedding nem ordenação por $vector."""
+    hits = get_vector_client().buscar_por_ids(COLECAO_PRODUTOS, ids_produtos(produtos))
+    print(f"0a. Busca por nome de produto: {len(hits)} documentos.")
+    return hits
+
+
+def ids_produtos(produtos: Dict[str, List[str]]) -> List[str]:
+    return list(dict.fromkeys(doc_id for doc_ids in produtos.values() for doc_id in doc_ids))[:LEXICO_MAX_DOCS]
+
+
+def embeddings_da_consulta(content: str, modo_busca: str) -> List[List[float]]:
+    """Gera os embeddings usados na busca, conforme o modo de recuperação."""
+    if modo_busca == "chunks":
+        # Todo o texto participa da busca: chunks sobrepostos, um único request de embeddings
+        return get_embeddings(dividir_em_chunks(content))
+    return [get_embedding(content[:800])]
+
+
+# Título da subseção que separa o texto revisado da lista de ajustes
+MARCADOR_AJUSTES = "🛠️ Ajustes Técnicos e Correções"
+
+
+def separar_ajustes(texto: str) -> Tuple[str, Optional[str]]:
+    """
+    Separa o texto revisado da subseção de Ajustes Técnicos. Funciona também com
+    texto parcial (streaming): um início de marcador ainda incompleto no fim é ocultado.
+    Retorna (texto_principal, ajustes) — ajustes é None enquanto o marcador não aparece.
+    """
+    if MARCADOR_AJUSTES in texto:
+        principal, ajustes = texto.split(MARCADOR_AJUSTES, 1)
+        return principal.strip(), ajustes.strip()
+    for tamanho in range(min(len(MARCADOR_AJUSTES) - 1, len(texto)), 0, -1):
+        if texto.endswith(MARCADOR_AJUSTES[:tamanho]):
+            return texto[:-tamanho].strip(), None
+    return texto.strip(), None
+
+
+# Template do prompt de revisão. Qualquer mudança nele muda a versão e invalida o cache de gerações.
+PROMPT_REVISAO = """
     Você é um **Revisor Técnico Sênior** com foco na área agrícola, rigoroso, preciso e com a missão de garantir a **veracidade científica absoluta** do texto de entrada.
     Confira se os valores estão idênticos ao banco de dados.
 
@@ -161,12 +429,376 @@ def reescrever_revisor(content: str, colecao_override: Optional[str] = None) ->
     Em seguida, adicione uma subseção chamada "🛠️ Ajustes Técnicos e Correções" listando de forma concisa cada alteração significativa feita (correção ou enriquecimento) e qual fonte foi usada.
     """
 
+# Os parâmetros do contexto também mudam o prompt final: entram na versão
+VERSAO_PROMPT_REVISAO = hashlib.sha256(
+    f"{PROMPT_REVISAO}|{CONTEXTO_MAX_TOKENS}|{CONTEXTO_MAX_TOKENS_FONTE}|{CONTEXTO_LIMIAR_DUPLICATA}".encode("utf-8")
+).hexdigest()[:12]
+
+# Cache da geração final (a etapa mais cara e lenta do pipeline)
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "1") not in ("0", "false", "False")
+@lru_cache(maxsize=None)
+def get_generation_cache() -> GenerationCache:
+    return GenerationCache()
+
+
+@dataclass
+class PreparoRevisao:
+    """Resultado das etapas 1 a 4: prompt final pronto (ou a mensagem de erro) e o que foi usado para montá-lo."""
+    final_prompt: Optional[str] = None
+    colecao: Optional[str] = None
+    relevant_docs: List[SearchHit] = field(default_factory=list)
+    erro: Optional[str] = None
+
+    def chave_cache(self, content: str) -> str:
+        return GenerationCache.chave(
+            content, self.colecao or "", [hit.id for hit in self.relevant_docs], get_llm_client().model, VERSAO_PROMPT_REVISAO
+        )
+
+
+def resposta_cacheavel(texto: str) -> bool:
+    return bool(texto) and not isinstance(texto, ErroGeracao)
+
+
+def reescrever_revisor(
+    content: str,
+    colecao_override: Optional[str] = None,
+    modo_busca: Optional[str] = None,
+    usar_cache: bool = True
+) -> str:
+    """
+    Função principal que executa o pipeline RAG completo.
+    Atua como um Revisor Técnico, corrigindo imprecisões e enriquecendo o texto.
+    Aceita colecao_override para sobrepor a classificação do Gemini.
+    modo_busca ('simples' ou 'chunks') sobrepõe o RETRIEVAL_MODE configurado.
+    usar_cache=False ignora o cache da geração final (sempre chama o LLM).
+    Documentos longos são revisados por seções em paralelo (ver reescrever_documento_longo_stream).
+    """
+    if len(content) > DOCUMENTO_LONGO_MIN_CARACTERES:
+        return "".join(reescrever_documento_longo_stream(content, colecao_override, modo_busca, usar_cache))
+    return _reescrever_texto(content, colecao_override, modo_busca, usar_cache)
+
+
+def _reescrever_texto(content: str, colecao_override: Optional[str], modo_busca: Optional[str], usar_cache: bool) -> str:
+    """Pipeline completo em um único prompt (sem divisão em seções), dentro do prazo de quem chamou ou de REVISAO_PRAZO_S."""
+    with prazo_da_operacao(REVISAO_PRAZO_S):
+        return _reescrever_no_prazo(content, colecao_override, modo_busca, usar_cache)
+
+
+def _reescrever_no_prazo(content: str, colecao_override: Optional[str], modo_busca: Optional[str], usar_cache: bool) -> str:
+    preparo = preparar_revisao(content, colecao_override, modo_busca)
+    if preparo.erro:
+        return preparo.erro
+
+    usar_cache = usar_cache and GENERATION_CACHE_ENABLED
+    chave = preparo.chave_cache(content)
+    if usar_cache:
+        em_cache = get_generation_cache().get(chave)
+        if em_cache is not None:
+            print("✅ Geração final recuperada do cache.")
+            return em_cache
+
     # 5. Geração Final do LLM
-    response_text = modelo_texto.generate_content(final_prompt)
+    response_text = get_llm_client().generate_content(preparo.final_prompt)
+    if usar_cache and resposta_cacheavel(response_text):
+        get_generation_cache().set(chave, response_text)
         
     return response_text
 
 
+def reescrever_revisor_stream(
+    content: str,
+    colecao_override: Optional[str] = None,
+    modo_busca: Optional[str] = None,
+    usar_cache: bool = True
+) -> Iterator[str]:
+    """
+    Mesmo pipeline de reescrever_revisor, mas a geração final é entregue em streaming
+    (trecho a trecho). Erros das etapas anteriores são produzidos como um único trecho.
+    """
+    if len(content) > DOCUMENTO_LONGO_MIN_CARACTERES:
+        yield from reescrever_documento_longo_stream(content, colecao_override, modo_busca, usar_cache)
+        return
+
+    # O prazo vale para o preparo; a geração em streaming entrega o texto aos poucos (só o timeout por chamada)
+    with prazo_da_operacao(REVISAO_PRAZO_S):
+        preparo = preparar_revisao(content, colecao_override, modo_busca)
+    if preparo.erro:
+        yield preparo.erro
+        return
+
+    usar_cache = usar_cache and GENERATION_CACHE_ENABLED
+    chave = preparo.chave_cache(content)
+    if usar_cache:
+        em_cache = get_generation_cache().get(chave)
+        if em_cache is not None:
+            print("✅ Geração final recuperada do cache.")
+            yield em_cache
+            return
+
+    trechos = []
+    falhou = False # O erro pode chegar depois de trechos válidos: o texto juntado não começa por ele
+    # closing: se este gerador for abandonado, o stream (e o slot do provedor) é fechado junto, sem esperar a coleta
+    with closing(get_llm_client().generate_content_stream(preparo.final_prompt)) as stream:
+        for trecho in stream:
+            falhou = falhou or isinstance(trecho, ErroGeracao)
+            trechos.append(trecho)
+            yield trecho
+
+    response_text = "".join(trechos)
+    if usar_cache and not falhou and resposta_cacheavel(response_text):
+        get_generation_cache().set(chave, response_text)
+
+
+def reescrever_documento_longo_stream(
+    content: str,
+    colecao_override: Optional[str] = None,
+    modo_busca: Optional[str] = None,
+    usar_cache: bool = True
+) -> Iterator[str]:
+    """
+    Revisão map-reduce de documentos longos: o texto é dividido em seções (títulos e
+    parágrafos), cada seção passa pelo pipeline completo (classificação, busca e geração
+    próprias) com até SECOES_MAX_CONCORRENCIA seções em paralelo, e as seções revisadas
+    são produzidas em ordem assim que ficam prontas. As listas de Ajustes Técnicos de
+    todas as seções vêm reunidas no final. Seções que falharem ficam com o texto original.
+    Um único prazo (REVISAO_PRAZO_S) vale para o documento inteiro, não um por seção.
+    """
+    secoes = dividir_em_secoes(content, max_caracteres=SECAO_MAX_CARACTERES, min_caracteres=SECAO_MIN_CARACTERES)
+    if len(secoes) <= 1:
+        yield _reescrever_texto(content, colecao_override, modo_busca, usar_cache)
+        return
+
+    print(f"\n--- DOCUMENTO LONGO: {len(secoes)} seções (até {SECOES_MAX_CONCORRENCIA} em paralelo) ---")
+    with span("documento_longo", secoes=len(secoes)) as atributos:
+        # As seções copiam o contexto ao serem submetidas e levam o prazo do documento (o prazo de
+        # cada uma, aberto em _reescrever_texto, fica limitado a ele). O prazo não fica ativo entre os
+        # yields: o gerador roda no contexto de quem o consome
+        with prazo_da_operacao(REVISAO_PRAZO_S) as limite:
+            futuros = [
+                _executor_secoes.submit(com_contexto(_reescrever_texto, secao, colecao_override, modo_busca, usar_cache))
+                for secao in secoes
+            ]
+        yield from costurar_secoes(secoes, _resultados_em_ordem(futuros, limite), atributos)
+
+
+def _resultados_em_ordem(futuros, limite: float) -> Iterator[str]:
+    """Resultados das seções na ordem; as que não terminarem até o instante limite viram erro."""
+    for futuro in futuros:
+        try:
+            yield futuro.result(timeout=max(0.0, limite - time.monotonic()))
+        except FuturesTimeoutError:
+            futuro.cancel() # Seções ainda na fila nem começam
+            yield ErroGeracao("ERRO NA GERAÇÃO DO LLM (Geral): prazo do documento esgotado")
+        except Exception as e:
+            yield ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}")
+
+
+def costurar_secoes(secoes: List[str], resultados: Iterator[str], atributos: Dict) -> Iterator[str]:
+    """
+    Junta as seções revisadas (na ordem, conforme os resultados chegam), mantendo o texto
+    original das que falharam, e termina com as listas de Ajustes Técnicos reunidas.
+    """
+    ajustes: List[str] = []
+    pendentes: List[str] = [] # Seções com falha antes da primeira revisada (podem ser todas)
+    primeiro_erro = None
+    entregues = 0
+    for i, (secao, resultado) in enumerate(zip(secoes, resultados), 1):
+        if resultado.startswith(PREFIXOS_ERRO):
+            print(f"⚠️ Seção {i} mantida sem revisão: {resultado[:120]}")
+            atributos["secoes_com_erro"] = atributos.get("secoes_com_erro", 0) + 1
+            primeiro_erro = primeiro_erro or resultado
+            ajustes.append(f"Seção {i}: mantida sem revisão ({resultado[:120]})")
+            principal = secao
+            if not entregues:
+                pendentes.append(principal)
+                continue
+        else:
+            principal, ajustes_secao = separar_ajustes(resultado)
+            if ajustes_secao:
+                ajustes.append(f"Seção {i}:\n{ajustes_secao}")
+
+        for trecho in pendentes + [principal]:
+            yield trecho if not entregues else "\n\n" + trecho
+            entregues += 1
+        pendentes = []
+
+    if not entregues:
+        # Nenhuma seção foi revisada: o erro é o resultado (como na revisão de texto único)
+        yield primeiro_erro
+        return
+    yield f"\n\n{MARCADOR_AJUSTES}\n\n" + "\n\n".join(ajustes)
+
+
+def preparar_revisao(content: str, colecao_override: Optional[str], modo_busca: Optional[str]) -> PreparoRevisao:
+    """
+    Etapas 1 a 4 do pipeline (classificação, embedding, busca e prompt).
+    Em caso de falha, o PreparoRevisao retornado traz apenas a mensagem em `erro`.
+    """
+    modo_busca = (modo_busca or RETRIEVAL_MODE).lower()
+    
+    colecao = None
+    usar_classificacao = usa_classificacao(colecao_override)
+
+    # 0. PRODUTOS CITADOS PELO NOME EXATO: as fichas deles são buscadas por _id enquanto o resto segue
+    produtos = produtos_citados(content, usar_classificacao, colecao_override)
+    futuro_produtos = None
+    if produtos:
+        with prazo(timeout_etapa(STAGE_TIMEOUT_BUSCA, PRAZO_FRACAO_PREPARO)):
+            futuro_produtos = _executor_busca.submit(com_contexto(_buscar_produtos, produtos))
+    if produtos and LEXICO_MODO == "substituir":
+        # 0b. ATALHO LÉXICO: com as fichas em mãos, não há classificação, embedding nem busca vetorial
+        hits_lexicos = _fichas_dos_produtos(futuro_produtos)
+        if hits_lexicos:
+            return montar_preparo(content, COLECAO_PRODUTOS, [], fixos=hits_lexicos)
+        print("⚠️ Atalho léxico sem documentos. Seguindo com a classificação e a busca vetorial.")
+        futuro_produtos = None
+
+    # Classificação (Gemini) e embedding (OpenAI) não dependem um do outro: rodam em paralelo
+    # Cada etapa tem o seu timeout, limitado a uma fração do que resta do prazo da revisão
+    timeout_embedding = timeout_etapa(STAGE_TIMEOUT_EMBEDDING, PRAZO_FRACAO_PREPARO)
+    futuro_embeddings = _submeter_etapa(timeout_embedding, embeddings_da_consulta, content, modo_busca)
+    
+    if not usar_classificacao:
+        # 1a. Usa a coleção fornecida pelo usuário
+        colecao = colecao_override
+        print(f"\n--- 1. COLEÇÃO DEFINIDA PELO USUÁRIO: {colecao} ---")
+    else:
+        # 1b. Executa a classificação normal do Gemini
+        print("\n--- 1. CLASSIFICAÇÃO AUTOMÁTICA (Gemini) ---")
+        timeout_classificacao = timeout_etapa(STAGE_TIMEOUT_CLASSIFICACAO, PRAZO_FRACAO_PREPARO)
+        futuro_colecao = _submeter_etapa(timeout_classificacao, classificar_texto, content)
+        try:
+            colecao = futuro_colecao.result(timeout=timeout_classificacao)
+        except FuturesTimeoutError:
+            colecao = f"ERRO: classificação excedeu {timeout_classificacao:.1f}s"
+        except Exception as e:
+            colecao = f"ERRO ao classificar: {str(e)}"
+        print(f"Coleção Identificada: {colecao}")
+    
+    erro = erro_colecao(colecao, usar_classificacao)
+    if erro:
+        # O embedding em andamento é descartado (não há como interromper a chamada já feita)
+        futuro_embeddings.cancel()
+        # Retorna a mensagem de erro como string, conforme solicitado.
+        return PreparoRevisao(erro=erro)
+
+    # 2. EMBEDDING E BUSCA VETORIAL
+    try:
+        embeddings = futuro_embeddings.result(timeout=timeout_embedding)
+    except FuturesTimeoutError:
+        print(f"❌ Embedding excedeu o timeout de {timeout_embedding:.1f}s.")
+        embeddings = []
+    except Exception as e:
+        print(f"❌ ERRO na etapa de Embedding: {str(e)}")
+        embeddings = []
+
+    relevant_docs = []
+    vetores_validos = embeddings_validos(embeddings, colecao)
+    if vetores_validos:
+        with prazo(timeout_etapa(STAGE_TIMEOUT_BUSCA, PRAZO_FRACAO_PREPARO)):
+            relevant_docs = buscar_multivetorial(colecao, embeddings, limit=10)
+        print(f"2. Busca Vetorial concluída na coleção '{colecao}'. Documentos retornados: {len(relevant_docs)}")
+    hits_lexicos = _fichas_dos_produtos(futuro_produtos)
+    if not vetores_validos and not hits_lexicos:
+        return PreparoRevisao(erro=ERRO_EMBEDDING)
+
+    return montar_preparo(content, colecao, relevant_docs, fixos=hits_lexicos)
+
+
+def _fichas_dos_produtos(futuro: Optional[Future]) -> List[SearchHit]:
+    """Resultado da busca por _id dos produtos citados ([] se não houve busca ou se ela falhou)."""
+    if futuro is None:
+        return []
+    try:
+        return futuro.result(timeout=timeout_etapa(STAGE_TIMEOUT_BUSCA, PRAZO_FRACAO_PREPARO))
+    except FuturesTimeoutError:
+        print("❌ Busca por nome de produto excedeu o timeout.")
+    except Exception as e:
+        print(f"❌ ERRO na busca por nome de produto: {str(e)}")
+    return []
+
+
+def _submeter_etapa(segundos: float, fn, *args) -> Future:
+    """Submete a etapa ao pool com um prazo próprio: as chamadas dentro dela herdam esse timeout."""
+    with prazo(segundos):
+        return _executor_pipeline.submit(com_contexto(fn, *args))
+
+
+# Mensagem da falha de embedding (sem ela não há busca vetorial)
+ERRO_EMBEDDING = "Erro fatal na geração do Embedding. Verifique sua chave OpenAI ativa. Não foi possível buscar no Astra DB."
+
+
+def usa_classificacao(colecao_override: Optional[str]) -> bool:
+    return not (colecao_override and colecao_override != "Automática (Classificação Gemini)")
+
+
+def produtos_citados(content: str, usar_classificacao: bool, colecao_override: Optional[str]) -> Dict[str, List[str]]:
+    """Produtos do índice léxico citados no texto (vazio se o atalho não se aplica)."""
+    produtos = {}
+    if LEXICO_MODO != "desligado" and (usar_classificacao or colecao_override == COLECAO_PRODUTOS):
+        produtos = get_indice_lexico().encontrar(content)
+    if produtos:
+        print(f"\n--- 0. PRODUTOS CITADOS: {', '.join(produtos)} ---")
+    return produtos
+
+
+def erro_colecao(colecao: Optional[str], usar_classificacao: bool) -> Optional[str]:
+    """Mensagem de erro se a coleção não permite seguir com a busca (None se estiver tudo certo)."""
+    if colecao in ["ERRO", "CLASSIFICAÇÃO NÃO RECONHECIDA:", None] or (usar_classificacao and colecao not in CATEGORIAS_VALIDAS):
+        return f"Erro na classificação/seleção da coleção. Classificação falhou com: {colecao if colecao else 'ERRO'}. Não foi possível iniciar a busca RAG."
+    return None
+
+
+def embeddings_validos(embeddings: List[List[float]], colecao: str) -> bool:
+    """Todos os vetores com a dimensão esperada pela coleção da busca (a configurada nela ou EMBEDDING_DIMENSOES)."""
+    esperada = dimensao_colecao(colecao_vetorial(colecao)) or EMBEDDING_DIMENSOES
+    return bool(embeddings) and all(e and len(e) == esperada for e in embeddings)
+
+
+def montar_preparo(content: str, colecao: str, relevant_docs: List[SearchHit], fixos: List[SearchHit] = ()) -> PreparoRevisao:
+    """
+    Etapas 2c a 4, sem chamadas externas: reranking, contexto RAG e prompt final.
+    Os hits fixos (fichas dos produtos citados) não passam pelo corte do reranking e vêm primeiro no contexto.
+    """
+    # 2c. RERANKING: similaridade + BM25 contra o texto; fontes fracas não chegam ao prompt
+    with span("rerank", candidatos=len(relevant_docs)) as atributos:
+        relevant_docs = reranquear(
+            relevant_docs, content,
+            peso_lexico=RERANK_PESO_LEXICO,
+            score_minimo=RERANK_SCORE_MINIMO,
+            salto_maximo=RERANK_SALTO_MAXIMO
+        )
+        atributos["selecionados"] = len(relevant_docs)
+    print(f"2c. Reranking manteve {len(relevant_docs)} documentos.")
+
+    # As fichas dos produtos citados são correspondências exatas: vêm antes de qualquer resultado semântico
+    ids_fixos = {hit.id for hit in fixos}
+    relevant_docs = list(fixos) + [hit for hit in relevant_docs if hit.id not in ids_fixos]
+    
+    # 3. CONSTRÓI CONTEXTO RAG (sem duplicatas, só as sentenças relevantes, dentro do orçamento de tokens)
+    with span("contexto", candidatos=len(relevant_docs)) as atributos:
+        fontes, usados = montar_contexto(
+            relevant_docs, content,
+            max_tokens=CONTEXTO_MAX_TOKENS,
+            max_tokens_fonte=CONTEXTO_MAX_TOKENS_FONTE,
+            limiar_duplicata=CONTEXTO_LIMIAR_DUPLICATA
+        )
+        if usados:
+            rag_context = "### REFERENCIAL TEÓRICO BUSCADO (RAG) ###\n" + fontes
+        else:
+            rag_context = "Referencial teórico não retornou resultados específicos relevantes."
+        atributos["fontes"] = len(usados)
+        atributos["caracteres"] = len(rag_context)
+        atributos["tokens_contexto"] = contar_tokens(rag_context)
+    # Só as fontes que entraram no prompt identificam a geração (chave do cache)
+    preparo = PreparoRevisao(colecao=colecao, relevant_docs=usados)
+    
+    # 4. PROMPT DE GERAÇÃO AUMENTADA (Mantendo o prompt anterior, mas removendo a 'instrucao_incremental')
+    preparo.final_prompt = PROMPT_REVISAO.format(content=content, rag_context=rag_context)
+
+    return preparo
+
+
 
 
 
@@ -181,16 +813,147 @@ def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
     """
     Aplica uma instrução incremental ao texto já revisado (saída do reescrever_revisor).
     Mantém o formato e adiciona as mudanças solicitadas.
+    Se a instrução cita parágrafos ("aumente o segundo parágrafo"), só eles (e os vizinhos,
+    como contexto) vão ao LLM; o restante do texto volta idêntico.
     """
     if not instrucao_incremental:
         return texto_revisado # Retorna o texto original se não houver instrução
 
+    with prazo_da_operacao(REVISAO_PRAZO_S):
+        return _ajustar_no_prazo(texto_revisado, instrucao_incremental)
+
+
+def _ajustar_no_prazo(texto_revisado: str, instrucao_incremental: str) -> str:
     print("\n--- INICIANDO AJUSTE INCREMENTAL ---")
-    
+    escopo = escopo_ajuste(texto_revisado, instrucao_incremental)
+    if escopo is not None:
+        documento, alvos = escopo
+        with span("ajuste_incremental", caracteres_entrada=len(texto_revisado), paragrafos_alvo=len(alvos)):
+            resposta = get_llm_client().generate_content(prompt_ajuste_paragrafos(documento, alvos, instrucao_incremental))
+            ajustado = aplicar_ajuste_paragrafos(documento, alvos, resposta)
+        if ajustado is not None:
+            print(f"✅ Ajuste Incremental concluído (parágrafos {', '.join(str(i + 1) for i in alvos)}).")
+            return ajustado
+        print("⚠️ Resposta do ajuste por parágrafo fora do formato. Ajustando o texto completo.")
+
+    final_prompt = prompt_ajuste(texto_revisado, instrucao_incremental)
+
+    with span("ajuste_incremental", caracteres_entrada=len(texto_revisado)):
+        try:
+            # Usa o cliente LLM para gerar o conteúdo
+            response_text = get_llm_client().generate_content(final_prompt)
+            print("✅ Ajuste Incremental concluído.")
+            return response_text
+        except Exception as e:
+            print(f"❌ ERRO na Geração do Ajuste Incremental: {str(e)}")
+            return texto_revisado # Fallback para o texto original se falhar
+
+
+def ajuste_incremental_stream(texto_revisado: str, instrucao_incremental: str) -> Iterator[str]:
+    """Variante em streaming de ajuste_incremental: produz o texto ajustado trecho a trecho."""
+    if not instrucao_incremental:
+        yield texto_revisado
+        return
+
+    print("\n--- INICIANDO AJUSTE INCREMENTAL (streaming) ---")
+    escopo = escopo_ajuste(texto_revisado, instrucao_incremental)
+    if escopo is not None:
+        documento, alvos = escopo
+        with span("ajuste_incremental", caracteres_entrada=len(texto_revisado), paragrafos_alvo=len(alvos), streaming=True):
+            # A resposta marcada ([[P2]] ...) só pode ser encaixada completa (ela é curta). Nada sai antes
+            # disso: se ela vier fora do formato, o ajuste completo recomeça do zero
+            trechos = list(get_llm_client().generate_content_stream(
+                prompt_ajuste_paragrafos(documento, alvos, instrucao_incremental)
+            ))
+            ajustado = None if resposta_com_erro(*trechos) else aplicar_ajuste_paragrafos(documento, alvos, "".join(trechos))
+        if ajustado is not None:
+            yield ajustado
+            print(f"✅ Ajuste Incremental concluído (parágrafos {', '.join(str(i + 1) for i in alvos)}).")
+            return
+        print("⚠️ Resposta do ajuste por parágrafo fora do formato. Ajustando o texto completo.")
+
+    with span("ajuste_incremental", caracteres_entrada=len(texto_revisado), streaming=True):
+        yield from get_llm_client().generate_content_stream(prompt_ajuste(texto_revisado, instrucao_incremental))
+    print("✅ Ajuste Incremental concluído.")
+
+
+def escopo_ajuste(texto_revisado: str, instrucao_incremental: str) -> Optional[Tuple[Documento, List[int]]]:
+    """(documento, parágrafos citados) quando o ajuste pode ficar restrito a parágrafos; None para o ajuste completo."""
+    if AJUSTE_MODO != "paragrafos":
+        return None
+    # Como no ajuste completo, a seção de Ajustes Técnicos fica de fora
+    texto_principal, _ = separar_ajustes(texto_revisado)
+    documento = Documento(texto_principal)
+    alvos = paragrafos_citados(instrucao_incremental, len(documento))
+    if alvos is None or len(documento) < 2:
+        return None
+    return documento, alvos
+
+
+def prompt_ajuste_paragrafos(documento: Documento, alvos: List[int], instrucao_incremental: str) -> str:
+    """Prompt com os parágrafos a editar (marcados [[Pn]]) e os vizinhos apenas como contexto."""
+    vizinhos = sorted({
+        j for i in alvos for j in range(i - AJUSTE_PARAGRAFOS_VIZINHOS, i + AJUSTE_PARAGRAFOS_VIZINHOS + 1)
+        if 0 <= j < len(documento) and j not in alvos
+    })
+    contexto = "\n\n".join(f"(Parágrafo {j + 1}) {documento.paragrafos[j]}" for j in vizinhos) or "(sem parágrafos vizinhos)"
+    editar = "\n\n".join(f"[[P{i + 1}]]\n{documento.paragrafos[i]}" for i in alvos)
+
+    final_prompt = f"""
+    Você é um **Editor Sênior** com a única missão de aplicar uma mudança incremental de forma fluida.
+
+    O documento tem {len(documento)} parágrafos. Edite **APENAS** os parágrafos marcados abaixo para atender à INSTRUÇÃO INCREMENTAL, **mantendo o tom técnico**.
+    Os parágrafos vizinhos servem só de contexto (para manter a coesão) e **NÃO** devem ser devolvidos.
+    Não é para mencionar a instrução incremental na saída.
+
+    ---
+    ### PARÁGRAFOS VIZINHOS (SOMENTE CONTEXTO) ###
+    {contexto}
+
+    ---
+    ### PARÁGRAFOS A SEREM AJUSTADOS ###
+    {editar}
+
+    ---
+    ### INSTRUÇÃO INCREMENTAL A SER ACRESCENTADA ###
+    {instrucao_incremental}
+
+    ---
+
+    Retorne **SOMENTE** os parágrafos ajustados, cada um precedido da sua marcação em uma linha própria ({", ".join(f"[[P{i + 1}]]" for i in alvos)}), sem nenhum outro texto.
+    """
+    return final_prompt
+
+
+# Resposta sem marcação maior que isso (em vezes o parágrafo original) não é tratada como o parágrafo ajustado
+AJUSTE_SEM_MARCACAO_MAX_PROPORCAO = 3
+
+_MARCACAO_PARAGRAFO = re.compile(r"^\s*\[\[P(\d+)\]\]\s*$", re.MULTILINE)
+
+
+def aplicar_ajuste_paragrafos(documento: Documento, alvos: List[int], resposta: str) -> Optional[str]:
+    """Encaixa os parágrafos devolvidos pelo LLM no documento; None se a resposta não trouxer todos os marcados."""
+    if resposta_com_erro(resposta):
+        return None
+    partes = _MARCACAO_PARAGRAFO.split(resposta)
+    novos = {int(numero) - 1: texto.strip() for numero, texto in zip(partes[1::2], partes[2::2])}
+    if not novos and len(alvos) == 1:
+        # Um único parágrafo devolvido sem a marcação: só é aceito se parecer mesmo um parágrafo
+        # (o LLM às vezes devolve o documento inteiro, com a seção de Ajustes Técnicos)
+        original = documento.paragrafos[alvos[0]].strip()
+        if len(resposta.strip()) > AJUSTE_SEM_MARCACAO_MAX_PROPORCAO * max(len(original), 1):
+            return None
+        novos = {alvos[0]: resposta.strip()}
+    if set(novos) != set(alvos) or not all(novos.values()) or any(MARCADOR_AJUSTES in texto for texto in novos.values()):
+        return None
+    return documento.juntar(novos)
+
+
+def prompt_ajuste(texto_revisado: str, instrucao_incremental: str) -> str:
+    """Monta o prompt do ajuste incremental a partir do texto revisado."""
     # 1. TENTA ISOLAR APENAS O TEXTO PRINCIPAL DA SAÍDA RAG
     # Isso é crucial para evitar que o LLM inclua as seções de metadados (Ajustes Técnicos) na resposta
-    partes = texto_revisado.split("🛠️ Ajustes Técnicos e Correções")
-    texto_principal_rag = partes[0].strip()
+    texto_principal_rag, _ = separar_ajustes(texto_revisado)
     
     # PROMPT DE AJUSTE INCREMENTAL REFINADO
     final_prompt = f"""
@@ -213,15 +976,7 @@ def ajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
     
     Retorne **SOMENTE O TEXTO FINAL RESULTANTE**, completamente editado e pronto.
     """
-
-    try:
-        # Usa o cliente LLM para gerar o conteúdo
-        response_text = modelo_texto.generate_content(final_prompt)
-        print("✅ Ajuste Incremental concluído.")
-        return response_text
-    except Exception as e:
-        print(f"❌ ERRO na Geração do Ajuste Incremental: {str(e)}")
-        return texto_revisado # Fallback para o texto original se falhar
+    return final_prompt
 # -----------------------------------------------------------
 # V. TESTE PRINCIPAL (main) - EXATAMENTE COMO SOLICITADO
 # -----------------------------------------------------------
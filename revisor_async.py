@@ -0,0 +1,410 @@
+import asyncio
+import importlib
+import weakref
+from typing import Dict, List, Optional
+
+# API assíncrona do pipeline: as mesmas etapas de revisor.py, com as chamadas aos provedores
+# (Gemini, OpenAI, Astra DB) feitas por corrotinas. Um único processo (um event loop)
+# mantém muitas revisões em andamento sem uma thread por revisão.
+from classificacao import aclassificar_texto, get_model
+from conexao_banco import SearchHit, aget_async_astra_client
+from indice_lexico import COLECAO_PRODUTOS, get_indice_lexico
+from recuperacao import dividir_em_chunks, fundir_rrf, contar_tokens
+from coalescencia import acoalescer, chave_coalescencia
+from limites import achamar, consumir_tokens
+from metricas import span
+from prazos import REVISAO_PRAZO_S, prazo, prazo_da_operacao, timeout_etapa, verificar_prazo, acom_hedge
+from revisor import (
+    OPENAI_API_KEY, VECTOR_BACKEND, RETRIEVAL_MODE, LEXICO_MODO, LLM_MODEL, EMBEDDING_CHAVE, EMBEDDING_PARAMETROS,
+    DOCUMENTO_LONGO_MIN_CARACTERES, SECAO_MAX_CARACTERES, SECAO_MIN_CARACTERES, SECOES_MAX_CONCORRENCIA,
+    STAGE_TIMEOUT_CLASSIFICACAO, STAGE_TIMEOUT_EMBEDDING, STAGE_TIMEOUT_BUSCA, PRAZO_FRACAO_PREPARO,
+    OPENAI_TIMEOUT_S, OPENAI_EMBEDDING_TIMEOUT_S, GENERATION_CACHE_ENABLED, ERRO_EMBEDDING,
+    ErroGeracao, PreparoRevisao, colecao_vetorial, get_vector_client, get_embedding_cache, get_generation_cache,
+    usa_classificacao, produtos_citados, erro_colecao, embeddings_validos, ids_produtos,
+    cliente_no_prazo, montar_preparo, resposta_cacheavel, costurar_secoes, escopo_ajuste,
+    prompt_ajuste_paragrafos, aplicar_ajuste_paragrafos, prompt_ajuste
+)
+from paragrafos import dividir_em_secoes
+
+# -----------------------------------------------------------
+# I. CLASSE AsyncLLMClient (Geração via openai.AsyncOpenAI)
+# -----------------------------------------------------------
+
+class AsyncLLMClient:
+    """Contraparte assíncrona do LLMClient (mesmo modelo, mesmas mensagens de erro)."""
+    def __init__(self, api_key: str, model: str = LLM_MODEL):
+        import openai
+        self.client = openai.AsyncOpenAI(api_key=api_key)
+        # Os recursos do SDK são importados no primeiro acesso: já ficam carregados aqui
+        self.client.chat.completions, self.client.embeddings
+        self.model = model
+        print(f"✅ AsyncLLMClient inicializado com modelo: {self.model}")
+
+    async def generate_content(self, prompt: str) -> str:
+        import openai
+        print("\n--- Chamando OpenAI Chat Completion (async) ---")
+        with span("geracao", modelo=self.model) as atributos:
+            try:
+                return await acoalescer("geracao", chave_coalescencia(self.model, prompt), self._completar, prompt, atributos)
+            except openai.APIError as e:
+                print(f"❌ ERRO NA GERAÇÃO DO LLM (API Error): {e}")
+                return ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (API Error): {str(e)}")
+            except Exception as e:
+                print(f"❌ ERRO NA GERAÇÃO DO LLM (Geral): {e}")
+                return ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (Geral): {str(e)}")
+
+    async def _completar(self, prompt: str, atributos: Dict) -> str:
+        verificar_prazo("geracao")
+        response = await achamar("openai", lambda: cliente_no_prazo(self.client).chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Você é um agente de revisão técnica altamente preciso."},
+                {"role": "user", "content": prompt}
+            ],
+            timeout=timeout_etapa(OPENAI_TIMEOUT_S)
+        ), tokens=await asyncio.to_thread(contar_tokens, prompt))
+        if response.usage:
+            atributos["tokens_prompt"] = response.usage.prompt_tokens
+            atributos["tokens_completion"] = response.usage.completion_tokens
+            consumir_tokens("openai", response.usage.completion_tokens)
+        return response.choices[0].message.content
+
+
+# O cliente HTTP do SDK pertence ao event loop em que foi criado: um cliente por loop
+_clientes_llm: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncLLMClient]" = weakref.WeakKeyDictionary()
+
+
+async def aget_async_llm_client() -> AsyncLLMClient:
+    """
+    Cliente LLM assíncrono do event loop atual (também usado nos embeddings).
+    Criá-lo (import do SDK, contexto SSL) bloqueia: a criação roda em uma thread.
+    """
+    loop = asyncio.get_running_loop()
+    cliente = _clientes_llm.get(loop)
+    if cliente is None:
+        if not OPENAI_API_KEY:
+            print("❌ ATENÇÃO: OPENAI_API_KEY não está definida.")
+        novo = await asyncio.to_thread(AsyncLLMClient, api_key=OPENAI_API_KEY)
+        # Outra corrotina pode ter criado o cliente enquanto esta esperava a thread
+        cliente = _clientes_llm.setdefault(loop, novo)
+    return cliente
+
+
+def _carregar_dependencias() -> None:
+    importlib.import_module("openai") # Importar o SDK leva centenas de ms
+    get_model()
+    contar_tokens("") # Carrega o encoding do tiktoken
+    get_embedding_cache()
+    get_generation_cache()
+    get_indice_lexico().encontrar("")
+    get_vector_client()
+
+
+async def apreaquecer() -> None:
+    """
+    Carrega, em uma thread, o que é lento na primeira vez (SDKs, tokenizador, caches SQLite,
+    índice léxico) para que o primeiro pedido não bloqueie o event loop. Chamado na partida do servidor.
+    """
+    await asyncio.to_thread(_carregar_dependencias)
+    await aget_async_llm_client()
+    await _acliente_vetorial()
+    print("✅ Dependências do pipeline carregadas.")
+
+
+# -----------------------------------------------------------
+# II. EMBEDDINGS E BUSCA VETORIAL
+# -----------------------------------------------------------
+
+async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+    """Variante assíncrona de get_embeddings: um único request para os textos fora do cache; [] em caso de erro."""
+    with span("embedding", textos=len(texts)) as atributos:
+        # O cache é SQLite (E/S de disco): leitura e gravação rodam fora do event loop
+        embeddings = await asyncio.to_thread(_embeddings_em_cache, texts)
+        faltantes = [i for i, e in enumerate(embeddings) if e is None]
+        atributos["cache_hits"] = len(texts) - len(faltantes)
+        if not faltantes:
+            print(f"✅ {len(texts)} embeddings recuperados do cache.")
+            return embeddings
+
+        print(f"\n--- Chamando OpenAI Embedding (async, {len(faltantes)} textos) ---")
+        try:
+            entrada = [texts[i] for i in faltantes]
+            response = await acoalescer(
+                "embedding", chave_coalescencia(EMBEDDING_CHAVE, *entrada), _acriar_embeddings, entrada, atributos
+            )
+            for item in response.data:
+                embeddings[faltantes[item.index]] = item.embedding
+            await asyncio.to_thread(_guardar_embeddings, [texts[i] for i in faltantes], [embeddings[i] for i in faltantes])
+
+            print(f"✅ Embeddings Gerados: {len(faltantes)} | Do cache: {len(texts) - len(faltantes)}")
+            return embeddings
+        except Exception as e:
+            print(f"❌ ERRO na API OpenAI para Embedding: {str(e)}. Verifique se a chave está ativa.")
+            return []
+
+
+def _embeddings_em_cache(texts: List[str]) -> List[Optional[List[float]]]:
+    cache = get_embedding_cache()
+    return [cache.get(t, EMBEDDING_CHAVE) for t in texts]
+
+
+def _guardar_embeddings(texts: List[str], embeddings: List[List[float]]) -> None:
+    cache = get_embedding_cache()
+    for text, embedding in zip(texts, embeddings):
+        cache.set(text, EMBEDDING_CHAVE, embedding)
+
+
+def _contar_tokens_lote(texts: List[str]) -> int:
+    return sum(contar_tokens(t) for t in texts)
+
+
+async def _acriar_embeddings(entrada: List[str], atributos: Dict):
+    verificar_prazo("embedding")
+    client = (await aget_async_llm_client()).client
+    tokens = await asyncio.to_thread(_contar_tokens_lote, entrada)
+    response = await acom_hedge(
+        "embedding", achamar, "openai",
+        lambda: cliente_no_prazo(client).embeddings.create(
+            input=entrada, **EMBEDDING_PARAMETROS, timeout=timeout_etapa(OPENAI_EMBEDDING_TIMEOUT_S)
+        ),
+        tokens=tokens
+    )
+    atributos["tokens_prompt"] = response.usage.prompt_tokens
+    return response
+
+
+async def aget_embedding(text: str) -> List[float]:
+    """Variante assíncrona de get_embedding ([] em caso de erro)."""
+    embeddings = await aget_embeddings([text])
+    return embeddings[0] if embeddings else []
+
+
+async def aembeddings_da_consulta(content: str, modo_busca: str) -> List[List[float]]:
+    if modo_busca == "chunks":
+        return await aget_embeddings(dividir_em_chunks(content))
+    return await aget_embeddings([content[:800]])
+
+
+async def _acliente_vetorial():
+    """Astra assíncrono; None no backend local (busca em memória, sem rede, mas feita em uma thread:
+    carregar o snapshot e multiplicar a matriz bloqueariam o event loop)."""
+    return None if VECTOR_BACKEND == "local" else await aget_async_astra_client()
+
+
+async def abuscar_multivetorial(colecao: str, embeddings: List[List[float]], limit: int = 10) -> List[SearchHit]:
+    """Variante assíncrona de buscar_multivetorial: as buscas (uma por embedding) rodam juntas e são fundidas por RRF."""
+    colecao = colecao_vetorial(colecao)
+    cliente = await _acliente_vetorial()
+    if cliente is None:
+        listas = await asyncio.to_thread(
+            lambda: [get_vector_client().vector_search(colecao, embedding, limit=limit) for embedding in embeddings]
+        )
+    else:
+        listas = await asyncio.gather(*(cliente.vector_search(colecao, embedding, limit=limit) for embedding in embeddings))
+    if len(listas) == 1:
+        return listas[0]
+    return fundir_rrf(listas, limit=limit)
+
+
+async def _abuscar_produtos(produtos: Dict[str, List[str]]) -> List[SearchHit]:
+    """Variante assíncrona de _buscar_produtos (por _id; falhas resultam em lista vazia)."""
+    try:
+        cliente = await _acliente_vetorial()
+        ids = ids_produtos(produtos)
+        if cliente is None:
+            hits = await asyncio.to_thread(lambda: get_vector_client().buscar_por_ids(COLECAO_PRODUTOS, ids))
+        else:
+            hits = await cliente.buscar_por_ids(COLECAO_PRODUTOS, ids)
+    except Exception as e:
+        print(f"❌ ERRO na busca por nome de produto: {str(e)}")
+        return []
+    print(f"0a. Busca por nome de produto: {len(hits)} documentos.")
+    return hits
+
+
+# -----------------------------------------------------------
+# III. FUNÇÃO areescrever_revisor (Pipeline RAG completo)
+# -----------------------------------------------------------
+
+async def areescrever_revisor(
+    content: str,
+    colecao_override: Optional[str] = None,
+    modo_busca: Optional[str] = None,
+    usar_cache: bool = True
+) -> str:
+    """
+    Variante assíncrona de reescrever_revisor (mesmos parâmetros e mesmo resultado).
+    Documentos longos são revisados por seções, com até SECOES_MAX_CONCORRENCIA em andamento.
+    """
+    if len(content) > DOCUMENTO_LONGO_MIN_CARACTERES:
+        return await _areescrever_documento_longo(content, colecao_override, modo_busca, usar_cache)
+    return await _areescrever_texto(content, colecao_override, modo_busca, usar_cache)
+
+
+async def _areescrever_texto(content: str, colecao_override: Optional[str], modo_busca: Optional[str], usar_cache: bool) -> str:
+    with prazo_da_operacao(REVISAO_PRAZO_S):
+        return await _areescrever_no_prazo(content, colecao_override, modo_busca, usar_cache)
+
+
+async def _areescrever_no_prazo(content: str, colecao_override: Optional[str], modo_busca: Optional[str], usar_cache: bool) -> str:
+    preparo = await apreparar_revisao(content, colecao_override, modo_busca)
+    if preparo.erro:
+        return preparo.erro
+
+    usar_cache = usar_cache and GENERATION_CACHE_ENABLED
+    chave = preparo.chave_cache(content)
+    if usar_cache:
+        em_cache = await asyncio.to_thread(lambda: get_generation_cache().get(chave))
+        if em_cache is not None:
+            print("✅ Geração final recuperada do cache.")
+            return em_cache
+
+    # 5. Geração Final do LLM
+    cliente = await aget_async_llm_client()
+    response_text = await cliente.generate_content(preparo.final_prompt)
+    if usar_cache and resposta_cacheavel(response_text):
+        await asyncio.to_thread(lambda: get_generation_cache().set(chave, response_text))
+
+    return response_text
+
+
+async def _areescrever_documento_longo(
+    content: str,
+    colecao_override: Optional[str],
+    modo_busca: Optional[str],
+    usar_cache: bool
+) -> str:
+    """Mesma revisão por seções de reescrever_documento_longo_stream (um prazo para o documento inteiro), entregue de uma vez."""
+    secoes = dividir_em_secoes(content, max_caracteres=SECAO_MAX_CARACTERES, min_caracteres=SECAO_MIN_CARACTERES)
+    if len(secoes) <= 1:
+        return await _areescrever_texto(content, colecao_override, modo_busca, usar_cache)
+
+    print(f"\n--- DOCUMENTO LONGO: {len(secoes)} seções (até {SECOES_MAX_CONCORRENCIA} em paralelo, async) ---")
+    semaforo = asyncio.Semaphore(SECOES_MAX_CONCORRENCIA)
+
+    async def revisar(secao: str) -> str:
+        async with semaforo:
+            verificar_prazo("documento_longo") # Seção que esperou a vez depois do fim do prazo nem começa
+            return await _areescrever_texto(secao, colecao_override, modo_busca, usar_cache)
+
+    # As tarefas copiam o contexto ao serem criadas: o prazo de cada seção fica limitado ao do documento
+    with span("documento_longo", secoes=len(secoes)) as atributos, prazo_da_operacao(REVISAO_PRAZO_S):
+        resultados = await asyncio.gather(*(revisar(secao) for secao in secoes), return_exceptions=True)
+        resultados = [
+            r if isinstance(r, str) else ErroGeracao(f"ERRO NA GERAÇÃO DO LLM (Geral): {str(r)}")
+            for r in resultados
+        ]
+        return "".join(costurar_secoes(secoes, iter(resultados), atributos))
+
+
+async def apreparar_revisao(content: str, colecao_override: Optional[str], modo_busca: Optional[str]) -> PreparoRevisao:
+    """Variante assíncrona de preparar_revisao: classificação e embedding rodam como tarefas concorrentes."""
+    modo_busca = (modo_busca or RETRIEVAL_MODE).lower()
+
+    colecao = None
+    usar_classificacao = usa_classificacao(colecao_override)
+
+    # 0. PRODUTOS CITADOS PELO NOME EXATO (a primeira busca carrega o índice do disco: fora do event loop)
+    produtos = await asyncio.to_thread(produtos_citados, content, usar_classificacao, colecao_override)
+    tarefa_produtos = None
+    if produtos:
+        with prazo(timeout_etapa(STAGE_TIMEOUT_BUSCA, PRAZO_FRACAO_PREPARO)):
+            tarefa_produtos = asyncio.create_task(_abuscar_produtos(produtos))
+    if produtos and LEXICO_MODO == "substituir":
+        # 0b. ATALHO LÉXICO: com as fichas em mãos, não há classificação, embedding nem busca vetorial
+        hits_lexicos = await tarefa_produtos
+        if hits_lexicos:
+            return await asyncio.to_thread(montar_preparo, content, COLECAO_PRODUTOS, [], fixos=hits_lexicos)
+        print("⚠️ Atalho léxico sem documentos. Seguindo com a classificação e a busca vetorial.")
+        tarefa_produtos = None
+
+    # Cada etapa tem o seu timeout, limitado a uma fração do que resta do prazo da revisão;
+    # a tarefa copia o contexto ao ser criada e leva esse prazo mais curto
+    timeout_embedding = timeout_etapa(STAGE_TIMEOUT_EMBEDDING, PRAZO_FRACAO_PREPARO)
+    with prazo(timeout_embedding):
+        tarefa_embeddings = asyncio.create_task(aembeddings_da_consulta(content, modo_busca))
+
+    if not usar_classificacao:
+        colecao = colecao_override
+        print(f"\n--- 1. COLEÇÃO DEFINIDA PELO USUÁRIO: {colecao} ---")
+    else:
+        print("\n--- 1. CLASSIFICAÇÃO AUTOMÁTICA (Gemini, async) ---")
+        timeout_classificacao = timeout_etapa(STAGE_TIMEOUT_CLASSIFICACAO, PRAZO_FRACAO_PREPARO)
+        try:
+            with prazo(timeout_classificacao):
+                colecao = await asyncio.wait_for(aclassificar_texto(content), timeout=timeout_classificacao)
+        except asyncio.TimeoutError:
+            colecao = f"ERRO: classificação excedeu {timeout_classificacao:.1f}s"
+        except Exception as e:
+            colecao = f"ERRO ao classificar: {str(e)}"
+        print(f"Coleção Identificada: {colecao}")
+
+    erro = erro_colecao(colecao, usar_classificacao)
+    if erro:
+        # Ao contrário da thread, as tarefas do embedding e das fichas podem ser interrompidas de fato
+        tarefa_embeddings.cancel()
+        if tarefa_produtos is not None:
+            tarefa_produtos.cancel()
+        return PreparoRevisao(erro=erro)
+
+    # 2. EMBEDDING E BUSCA VETORIAL
+    try:
+        embeddings = await asyncio.wait_for(tarefa_embeddings, timeout=timeout_embedding)
+    except asyncio.TimeoutError:
+        print(f"❌ Embedding excedeu o timeout de {timeout_embedding:.1f}s.")
+        embeddings = []
+    except Exception as e:
+        print(f"❌ ERRO na etapa de Embedding: {str(e)}")
+        embeddings = []
+
+    relevant_docs = []
+    vetores_validos = embeddings_validos(embeddings, colecao)
+    if vetores_validos:
+        with prazo(timeout_etapa(STAGE_TIMEOUT_BUSCA, PRAZO_FRACAO_PREPARO)):
+            relevant_docs = await abuscar_multivetorial(colecao, embeddings, limit=10)
+        print(f"2. Busca Vetorial concluída na coleção '{colecao}'. Documentos retornados: {len(relevant_docs)}")
+    hits_lexicos = await tarefa_produtos if tarefa_produtos is not None else []
+    if not vetores_validos and not hits_lexicos:
+        return PreparoRevisao(erro=ERRO_EMBEDDING)
+
+    # Reranking e contexto (BM25 e tiktoken, CPU puro) fora do event loop
+    return await asyncio.to_thread(montar_preparo, content, colecao, relevant_docs, fixos=hits_lexicos)
+
+
+# -----------------------------------------------------------
+# IV. FUNÇÃO aajuste_incremental (Ajustes pós-revisão)
+# -----------------------------------------------------------
+
+async def aajuste_incremental(texto_revisado: str, instrucao_incremental: str) -> str:
+    """Variante assíncrona de ajuste_incremental (com o mesmo escopo por parágrafos)."""
+    if not instrucao_incremental:
+        return texto_revisado
+
+    with prazo_da_operacao(REVISAO_PRAZO_S):
+        return await _aajustar_no_prazo(texto_revisado, instrucao_incremental)
+
+
+async def _aajustar_no_prazo(texto_revisado: str, instrucao_incremental: str) -> str:
+    print("\n--- INICIANDO AJUSTE INCREMENTAL (async) ---")
+    cliente = await aget_async_llm_client()
+    escopo = escopo_ajuste(texto_revisado, instrucao_incremental)
+    if escopo is not None:
+        documento, alvos = escopo
+        with span("ajuste_incremental", caracteres_entrada=len(texto_revisado), paragrafos_alvo=len(alvos)):
+            resposta = await cliente.generate_content(
+                prompt_ajuste_paragrafos(documento, alvos, instrucao_incremental)
+            )
+            ajustado = aplicar_ajuste_paragrafos(documento, alvos, resposta)
+        if ajustado is not None:
+            print(f"✅ Ajuste Incremental concluído (parágrafos {', '.join(str(i + 1) for i in alvos)}).")
+            return ajustado
+        print("⚠️ Resposta do ajuste por parágrafo fora do formato. Ajustando o texto completo.")
+
+    with span("ajuste_incremental", caracteres_entrada=len(texto_revisado)):
+        try:
+            response_text = await cliente.generate_content(prompt_ajuste(texto_revisado, instrucao_incremental))
+            print("✅ Ajuste Incremental concluído.")
+            return response_text
+        except Exception as e:
+            print(f"❌ ERRO na Geração do Ajuste Incremental: {str(e)}")
+            return texto_revisado
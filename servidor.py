@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+import tornado.web
+
+from classificacao import CATEGORIAS_VALIDAS
+from limites import estado_limites
+from metricas import metricas, iniciar_trace
+from prazos import PrazoEsgotado, prazo, restante
+from revisor import MODOS_BUSCA, VECTOR_BACKEND, resposta_com_erro, separar_ajustes
+from revisor_async import areescrever_revisor, aajuste_incremental, apreaquecer
+
+# -----------------------------------------------------------
+# I. CONFIGURAÇÕES DO SERVIDOR
+# -----------------------------------------------------------
+load_dotenv() # Carrega as variáveis do arquivo .env localmente
+
+SERVIDOR_PORTA = int(os.getenv("SERVIDOR_PORTA", "8000"))
+# Revisões/ajustes executados ao mesmo tempo (cada um é uma corrotina: uma geração lenta ocupa só um worker)
+SERVIDOR_WORKERS = int(os.getenv("SERVIDOR_WORKERS", "32"))
+# Pedidos aguardando um worker; com a fila cheia, novos pedidos recebem 429
+SERVIDOR_FILA_MAX = int(os.getenv("SERVIDOR_FILA_MAX", "128"))
+# Tempo máximo na fila: quem esperou mais que isso recebe 503 sem chegar aos provedores
+SERVIDOR_ESPERA_MAX_S = float(os.getenv("SERVIDOR_ESPERA_MAX_S", "30"))
+# Tempo máximo de execução de um pedido (a resposta é 504; o trabalho é cancelado)
+SERVIDOR_TIMEOUT_S = float(os.getenv("SERVIDOR_TIMEOUT_S", "300"))
+SERVIDOR_MAX_CARACTERES = int(os.getenv("SERVIDOR_MAX_CARACTERES", "200000"))
+
+
+class ServidorOcupado(Exception):
+    """O pedido não pôde ser atendido agora (fila cheia, espera excedida ou servidor encerrando)."""
+    def __init__(self, status: int, motivo: str, retry_after: Optional[int] = None):
+        super().__init__(motivo)
+        self.status = status
+        self.motivo = motivo
+        self.retry_after = retry_after
+
+
+# -----------------------------------------------------------
+# II. CLASSE FilaTrabalho (Fila limitada + pool de workers)
+# -----------------------------------------------------------
+
+OPERACOES = {
+    "revisao": lambda p: areescrever_revisor(
+        p["texto"], colecao_override=p.get("colecao"), modo_busca=p.get("modo_busca"), usar_cache=p.get("usar_cache", True)
+    ),
+    "ajuste": lambda p: aajuste_incremental(p["texto"], p["instrucao"]),
+}
+
+
+@dataclass
+class Trabalho:
+    operacao: str
+    parametros: Dict[str, Any]
+    futuro: asyncio.Future
+    enfileirado_em: float = field(default_factory=time.monotonic)
+
+
+class FilaTrabalho:
+    """
+    Fila limitada consumida por `workers` corrotinas. Quem chega com a fila cheia é
+    recusado na hora (backpressure) em vez de acumular memória e latência.
+    """
+    def __init__(self, workers: int = SERVIDOR_WORKERS, tamanho: int = SERVIDOR_FILA_MAX):
+        self.workers = workers
+        self.fila: "asyncio.Queue[Trabalho]" = asyncio.Queue(maxsize=tamanho)
+        self.em_execucao = 0
+        self.encerrando = False
+        self._tarefas = []
+
+    def iniciar(self) -> None:
+        self._tarefas = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def executar(self, operacao: str, parametros: Dict[str, Any]) -> Dict[str, Any]:
+        """Enfileira o pedido e espera o resultado (ServidorOcupado se não houver espaço)."""
+        if self.encerrando:
+            raise ServidorOcupado(503, "servidor encerrando")
+        trabalho = Trabalho(operacao, parametros, asyncio.get_running_loop().create_future())
+        try:
+            self.fila.put_nowait(trabalho)
+        except asyncio.QueueFull:
+            raise ServidorOcupado(429, "fila cheia", retry_after=max(1, int(SERVIDOR_ESPERA_MAX_S / 4)))
+        try:
+            return await asyncio.wait_for(asyncio.shield(trabalho.futuro), timeout=SERVIDOR_ESPERA_MAX_S + SERVIDOR_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            trabalho.futuro.cancel()
+            raise ServidorOcupado(504, "tempo de execução excedido")
+
+    async def _worker(self) -> None:
+        while True:
+            trabalho = await self.fila.get()
+            try:
+                if trabalho.futuro.done():
+                    continue # O cliente já desistiu
+                espera = time.monotonic() - trabalho.enfileirado_em
+                metricas.observar("revisor_servidor_espera_fila_segundos", espera, operacao=trabalho.operacao)
+                if espera > SERVIDOR_ESPERA_MAX_S:
+                    trabalho.futuro.set_exception(ServidorOcupado(503, "espera na fila excedida", retry_after=1))
+                    continue
+                self.em_execucao += 1
+                try:
+                    resultado = await asyncio.wait_for(self._executar(trabalho), timeout=SERVIDOR_TIMEOUT_S)
+                    if not trabalho.futuro.done():
+                        trabalho.futuro.set_result(resultado)
+                except asyncio.TimeoutError:
+                    if not trabalho.futuro.done():
+                        trabalho.futuro.set_exception(ServidorOcupado(504, "tempo de execução excedido"))
+                except Exception as e:
+                    if not trabalho.futuro.done():
+                        trabalho.futuro.set_exception(e)
+                finally:
+                    self.em_execucao -= 1
+            finally:
+                self.fila.task_done()
+
+    @staticmethod
+    async def _executar(trabalho: Trabalho) -> Dict[str, Any]:
+        # O prazo segue para as etapas (o pipeline adota o do servidor em vez de abrir o de REVISAO_PRAZO_S):
+        # elas encurtam os timeouts em vez de continuar depois do 504
+        with iniciar_trace(trabalho.operacao) as trace, prazo(SERVIDOR_TIMEOUT_S):
+            texto = await OPERACOES[trabalho.operacao](trabalho.parametros)
+            if resposta_com_erro(texto) and restante() == 0.0:
+                # A falha veio do prazo esgotado (a etapa devolveu o erro como texto): é um 504, não um 502
+                raise PrazoEsgotado(f"prazo do servidor esgotado durante '{trabalho.operacao}'")
+        return {"texto": texto, "trace": trace.para_lista()}
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "em_execucao": self.em_execucao,
+            "na_fila": self.fila.qsize(),
+            "fila_max": self.fila.maxsize,
+            "encerrando": self.encerrando,
+        }
+
+    async def encerrar(self, timeout: float) -> None:
+        """Para de aceitar pedidos e espera (até `timeout`) os que já estão na fila."""
+        self.encerrando = True
+        try:
+            await asyncio.wait_for(self.fila.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self.fila.qsize()} pedidos ainda na fila ao encerrar.")
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+
+
+# -----------------------------------------------------------
+# III. ENDPOINTS (JSON)
+# -----------------------------------------------------------
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, fila: FilaTrabalho):
+        self.fila = fila
+
+    def set_default_headers(self) -> None:
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+
+    def responder(self, status: int, corpo: Dict[str, Any]) -> None:
+        self.set_status(status)
+        self.finish(json.dumps(corpo, ensure_ascii=False))
+
+    def ler_json(self, *obrigatorios: str) -> Optional[Dict[str, Any]]:
+        """Corpo do pedido; responde 400 (e retorna None) se não for JSON ou faltar algum campo."""
+        try:
+            corpo = json.loads(self.request.body or b"{}")
+        except json.JSONDecodeError:
+            self.responder(400, {"erro": "corpo não é um JSON válido"})
+            return None
+        if not isinstance(corpo, dict):
+            self.responder(400, {"erro": "o corpo deve ser um objeto JSON"})
+            return None
+        faltando = [campo for campo in obrigatorios if not isinstance(corpo.get(campo), str) or not corpo[campo].strip()]
+        if faltando:
+            self.responder(400, {"erro": f"campos obrigatórios ausentes: {', '.join(faltando)}"})
+            return None
+        if len(corpo["texto"]) > SERVIDOR_MAX_CARACTERES:
+            self.responder(413, {"erro": f"texto maior que {SERVIDOR_MAX_CARACTERES} caracteres"})
+            return None
+        return corpo
+
+    async def executar(self, operacao: str, parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        inicio = time.perf_counter()
+        try:
+            resultado = await self.fila.executar(operacao, parametros)
+        except ServidorOcupado as e:
+            metricas.incrementar("revisor_servidor_recusados_total", operacao=operacao, status=str(e.status))
+            if e.retry_after:
+                self.set_header("Retry-After", str(e.retry_after))
+            self.responder(e.status, {"erro": e.motivo})
+            return None
+        except Exception as e:
+            print(f"❌ ERRO no pedido de {operacao}: {str(e)}")
+            metricas.incrementar("revisor_servidor_recusados_total", operacao=operacao, status="500")
+            self.responder(500, {"erro": str(e)})
+            return None
+        finally:
+            metricas.observar("revisor_servidor_duracao_segundos", time.perf_counter() - inicio, operacao=operacao)
+        return resultado
+
+
+class RevisaoHandler(BaseHandler):
+    """POST /revisao {"texto", "colecao"?, "modo_busca"?, "usar_cache"?}"""
+    async def post(self) -> None:
+        corpo = self.ler_json("texto")
+        if corpo is None:
+            return
+        erro = self.validar_opcoes(corpo)
+        if erro:
+            self.responder(400, {"erro": erro})
+            return
+        resultado = await self.executar("revisao", corpo)
+        if resultado is None:
+            return
+        if resposta_com_erro(resultado["texto"]):
+            # O pipeline devolve os erros como texto: aqui eles viram status HTTP
+            self.responder(502, {"erro": resultado["texto"], "trace": resultado["trace"]})
+            return
+        principal, ajustes = separar_ajustes(resultado["texto"])
+        self.responder(200, {"texto": principal, "ajustes_tecnicos": ajustes, "trace": resultado["trace"]})
+
+    @staticmethod
+    def validar_opcoes(corpo: Dict[str, Any]) -> Optional[str]:
+        """Mensagem de erro se alguma opção for inválida (a coleção vai para o caminho da URL do Astra DB)."""
+        colecao = corpo.get("colecao")
+        if colecao is not None and colecao not in CATEGORIAS_VALIDAS:
+            return f"colecao inválida: use uma de {', '.join(CATEGORIAS_VALIDAS)} (ou omita para a classificação automática)"
+        modo_busca = corpo.get("modo_busca")
+        if modo_busca is not None and (not isinstance(modo_busca, str) or modo_busca.lower() not in MODOS_BUSCA):
+            return f"modo_busca inválido: use um de {', '.join(MODOS_BUSCA)}"
+        if not isinstance(corpo.get("usar_cache", True), bool):
+            return "usar_cache deve ser true ou false"
+        return None
+
+
+class AjusteHandler(BaseHandler):
+    """POST /ajuste {"texto", "instrucao"}"""
+    async def post(self) -> None:
+        corpo = self.ler_json("texto", "instrucao")
+        if corpo is None:
+            return
+        resultado = await self.executar("ajuste", corpo)
+        if resultado is None:
+            return
+        if resposta_com_erro(resultado["texto"]):
+            self.responder(502, {"erro": resultado["texto"], "trace": resultado["trace"]})
+            return
+        self.responder(200, {"texto": resultado["texto"], "trace": resultado["trace"]})
+
+
+class HealthHandler(BaseHandler):
+    """GET /health: o processo está de pé (liveness). Não chama nenhum provedor."""
+    def get(self) -> None:
+        self.responder(200, {"status": "ok"})
+
+
+class ReadyHandler(BaseHandler):
+    """
+    GET /ready: pode receber pedidos (readiness). Confere só a configuração e a fila,
+    sem chamadas pagas: uma chave inválida aparece nos pedidos, não aqui.
+    """
+    def get(self) -> None:
+        pendencias = []
+        if not os.getenv("OPENAI_API_KEY"):
+            pendencias.append("OPENAI_API_KEY ausente")
+        if not os.getenv("GEMINI_API_KEY"):
+            pendencias.append("GEMINI_API_KEY ausente")
+        if VECTOR_BACKEND != "local" and not os.getenv("ASTRA_DB_API_ENDPOINT"):
+            pendencias.append("ASTRA_DB_API_ENDPOINT ausente")
+        estado = self.fila.estado()
+        if estado["encerrando"]:
+            pendencias.append("servidor encerrando")
+        elif estado["na_fila"] >= estado["fila_max"]:
+            pendencias.append("fila cheia")
+        self.responder(503 if pendencias else 200, {"pronto": not pendencias, "pendencias": pendencias, **estado})
+
+
+class MetricsHandler(BaseHandler):
+    """GET /metrics: métricas do processo no formato do Prometheus (com o estado da fila e dos limites)."""
+    def get(self) -> None:
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        estado = self.fila.estado()
+        linhas = [metricas.exportar_prometheus()]
+        for nome in ("em_execucao", "na_fila"):
+            linhas.append(f"# TYPE revisor_servidor_{nome} gauge\nrevisor_servidor_{nome} {estado[nome]}\n")
+        # Concorrência atual de cada provedor (reduzida pelo AIMD após 429)
+        linhas.append("# TYPE revisor_limite_concorrencia gauge\n")
+        for provedor, limites in estado_limites().items():
+            linhas.append(f'revisor_limite_concorrencia{{provedor="{provedor}"}} {limites["maximo"]}\n')
+        self.finish("".join(linhas))
+
+
+def criar_app(fila: FilaTrabalho) -> tornado.web.Application:
+    argumentos = {"fila": fila}
+    return tornado.web.Application([
+        (r"/revisao", RevisaoHandler, argumentos),
+        (r"/ajuste", AjusteHandler, argumentos),
+        (r"/health", HealthHandler, argumentos),
+        (r"/ready", ReadyHandler, argumentos),
+        (r"/metrics", MetricsHandler, argumentos),
+    ])
+
+
+# -----------------------------------------------------------
+# IV. EXECUÇÃO (main)
+# -----------------------------------------------------------
+
+async def servir(porta: int, workers: int, fila_max: int) -> None:
+    await apreaquecer()
+    fila = FilaTrabalho(workers=workers, tamanho=fila_max)
+    fila.iniciar()
+    servidor = criar_app(fila).listen(porta)
+    print(f"✅ Servidor de revisão em http://0.0.0.0:{porta} ({workers} workers, fila de {fila_max})")
+
+    parar = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sinal in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sinal, parar.set)
+    await parar.wait()
+
+    print("\n--- Encerrando: aguardando os pedidos em andamento ---")
+    servidor.stop()
+    await fila.encerrar(timeout=SERVIDOR_TIMEOUT_S)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP/JSON do revisor (revisão RAG e ajuste incremental).")
+    parser.add_argument("--porta", type=int, default=SERVIDOR_PORTA)
+    parser.add_argument("--workers", type=int, default=SERVIDOR_WORKERS, help="Pedidos executados ao mesmo tempo")
+    parser.add_argument("--fila", type=int, default=SERVIDOR_FILA_MAX, help="Pedidos aguardando um worker (além disso: 429)")
+    args = parser.parse_args()
+    asyncio.run(servir(args.porta, args.workers, args.fila))
+
+if __name__ == "__main__":
+    main()
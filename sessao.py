@@ -0,0 +1,134 @@
+import hashlib
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# -----------------------------------------------------------
+# I. NÓ DA SESSÃO (Uma etapa: revisão RAG ou ajuste incremental)
+# -----------------------------------------------------------
+
+TIPO_REVISAO = "revisao"
+TIPO_AJUSTE = "ajuste"
+
+
+def chave_etapa(tipo: str, *entradas: str, pai: Optional[str] = None) -> str:
+    """Identifica uma etapa pelas suas entradas (e pelo nó de origem, no caso dos ajustes)."""
+    conteudo = "\x00".join([tipo, pai or "", *entradas])
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class NoRevisao:
+    """Resultado de uma etapa, com as entradas que o produziram e o nó de onde partiu."""
+    id: str
+    tipo: str
+    chave: str
+    entradas: Dict[str, Any]
+    texto: str
+    ajustes_tecnicos: str
+    colecao: str
+    pai: Optional[str] = None
+    trace: List[Dict[str, Any]] = field(default_factory=list)
+    criado_em: float = field(default_factory=time.time)
+
+    @property
+    def rotulo(self) -> str:
+        if self.tipo == TIPO_REVISAO:
+            return f"#{self.id} Revisão RAG ({self.colecao})"
+        instrucao = self.entradas.get("instrucao", "")
+        return f"#{self.id} Ajuste: {instrucao[:40]}{'...' if len(instrucao) > 40 else ''}"
+
+
+# -----------------------------------------------------------
+# II. CLASSE SessaoRevisao (Histórico em árvore, memoização, desfazer)
+# -----------------------------------------------------------
+
+class SessaoRevisao:
+    """
+    Histórico da sessão como uma árvore: cada revisão RAG é uma raiz e cada ajuste
+    incremental é filho do nó ao qual foi aplicado. Uma etapa com as mesmas entradas
+    (e o mesmo nó de origem) é reaproveitada em vez de executada de novo.
+    """
+    def __init__(self):
+        self.nos: Dict[str, NoRevisao] = {}
+        self.atual: Optional[str] = None
+        self._por_chave: Dict[str, str] = {}
+        self._ids = itertools.count(1)
+
+    def buscar(self, chave: str) -> Optional[NoRevisao]:
+        """Nó já calculado para estas entradas, se houver."""
+        no_id = self._por_chave.get(chave)
+        return self.nos.get(no_id) if no_id else None
+
+    def registrar(
+        self,
+        tipo: str,
+        chave: str,
+        entradas: Dict[str, Any],
+        texto: str,
+        ajustes_tecnicos: str,
+        colecao: str,
+        pai: Optional[str] = None,
+        trace: Optional[List[Dict[str, Any]]] = None
+    ) -> NoRevisao:
+        """Acrescenta o nó (substituindo o anterior com a mesma chave) e o torna o atual."""
+        no = NoRevisao(
+            id=str(next(self._ids)), tipo=tipo, chave=chave, entradas=entradas, texto=texto,
+            ajustes_tecnicos=ajustes_tecnicos, colecao=colecao, pai=pai, trace=trace or []
+        )
+        self.nos[no.id] = no
+        self._por_chave[chave] = no.id
+        self.atual = no.id
+        return no
+
+    def ir_para(self, no_id: str) -> NoRevisao:
+        """Volta a um nó qualquer: o próximo ajuste abre um novo ramo a partir dele."""
+        self.atual = no_id
+        return self.nos[no_id]
+
+    def desfazer(self) -> Optional[NoRevisao]:
+        """Volta ao nó de origem do atual (None se o atual for uma revisão RAG)."""
+        no = self.no_atual
+        if no is None or no.pai is None:
+            return None
+        return self.ir_para(no.pai)
+
+    @property
+    def no_atual(self) -> Optional[NoRevisao]:
+        return self.nos.get(self.atual) if self.atual else None
+
+    def raiz(self, no_id: str) -> NoRevisao:
+        no = self.nos[no_id]
+        while no.pai is not None:
+            no = self.nos[no.pai]
+        return no
+
+    def caminho(self, no_id: Optional[str] = None) -> List[NoRevisao]:
+        """Da revisão RAG até o nó (o atual, por padrão): as etapas que produziram o texto."""
+        no = self.nos.get(no_id or self.atual or "")
+        caminho = []
+        while no is not None:
+            caminho.append(no)
+            no = self.nos.get(no.pai) if no.pai else None
+        return list(reversed(caminho))
+
+    def filhos(self, no_id: str) -> List[NoRevisao]:
+        return [no for no in self.nos.values() if no.pai == no_id]
+
+    def arvore(self) -> List[NoRevisao]:
+        """Todos os nós em ordem de exibição (cada nó seguido dos seus descendentes)."""
+        ordem: List[NoRevisao] = []
+
+        def visitar(no: NoRevisao) -> None:
+            ordem.append(no)
+            for filho in self.filhos(no.id):
+                visitar(filho)
+
+        for no in self.nos.values():
+            if no.pai is None:
+                visitar(no)
+        return ordem
+
+    def profundidade(self, no_id: str) -> int:
+        return len(self.caminho(no_id)) - 1
@@ -0,0 +1,35 @@
+import pytest
+
+from paragrafos import paragrafos_citados
+
+
+@pytest.mark.parametrize("instrucao, esperado", [
+    ("aumente o segundo parágrafo", [1]),
+    ("parágrafos 2 a 4", [1, 2, 3]),
+    ("do primeiro ao terceiro parágrafo", [0, 1, 2]),
+    ("2º e 3º parágrafos", [1, 2]),
+    ("último parágrafo", [11]),
+    ("parágrafo 2 e 3 exemplos", [1]),
+    ("reescreva o décimo parágrafo", [9]),
+    ("reescreva o décimo primeiro parágrafo", [10]),
+])
+def test_paragrafos_citados(instrucao, esperado):
+    assert paragrafos_citados(instrucao, 12) == esperado
+
+
+@pytest.mark.parametrize("instrucao", [
+    "não altere o segundo parágrafo; resuma o resto",
+    "exceto o primeiro parágrafo, deixe tudo mais formal",
+    "deixe tudo mais formal, menos o terceiro parágrafo",
+    "sem alterar o primeiro parágrafo, corrija a pontuação",
+    "use o tom do primeiro parágrafo em todo o texto",
+    "mantenha o segundo parágrafo e encurte os demais",
+    "vigésimo primeiro parágrafo",
+    "mude o tom para formal",
+])
+def test_ajuste_completo_quando_o_alcance_nao_e_so_o_paragrafo_citado(instrucao):
+    assert paragrafos_citados(instrucao, 30) is None
+
+
+def test_paragrafo_inexistente():
+    assert paragrafos_citados("reescreva o décimo primeiro parágrafo", 5) is None
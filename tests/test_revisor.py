@@ -0,0 +1,146 @@
+import asyncio
+import json
+from contextlib import closing
+from types import SimpleNamespace
+
+import pytest
+
+import revisor
+import revisor_async
+from conexao_banco import SearchHit
+from indice_lexico import IndiceLexico
+from limites import limite
+
+FICHA = SearchHit(id="ficha-orondis", campos={"produto": "ORONDIS", "texto": "Ficha técnica do ORONDIS: dose de 250 mL/ha."})
+TEXTO = "O ORONDIS® controla o míldio da videira quando aplicado de forma preventiva."
+
+
+class ClienteFalso:
+    """Busca vetorial com três hits próximos (0.80/0.79/0.77); a ficha do produto só vem pelo _id."""
+    def __init__(self):
+        self.buscas_por_id = []
+
+    def vector_search(self, collection, vector, limit=6, **kwargs):
+        return [
+            SearchHit(id=f"v{i}", campos={"texto": f"Documento {i} sobre doenças fúngicas número {i} em culturas."}, score=score)
+            for i, score in enumerate([0.80, 0.79, 0.77])
+        ]
+
+    def buscar_por_ids(self, collection, ids, projection=None):
+        self.buscas_por_id.append(list(ids))
+        return [FICHA] if FICHA.id in ids else []
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    indice = IndiceLexico(diretorio=str(tmp_path))
+    (tmp_path / "PRODUTO.json").write_text(json.dumps({"orondis": [FICHA.id]}), encoding="utf-8")
+    cliente = ClienteFalso()
+    embeddings = [[0.0] * revisor.EMBEDDING_DIMENSOES]
+
+    async def aembeddings(content, modo_busca):
+        return embeddings
+
+    async def aclassificar(texto):
+        return "CULTURA"
+
+    async def acliente():
+        return None
+
+    for modulo in (revisor, revisor_async):
+        monkeypatch.setattr(modulo, "get_vector_client", lambda: cliente)
+    monkeypatch.setattr(revisor, "get_indice_lexico", lambda: indice)
+    monkeypatch.setattr(revisor, "classificar_texto", lambda texto: "CULTURA")
+    monkeypatch.setattr(revisor, "embeddings_da_consulta", lambda content, modo_busca: embeddings)
+    monkeypatch.setattr(revisor_async, "aclassificar_texto", aclassificar)
+    monkeypatch.setattr(revisor_async, "aembeddings_da_consulta", aembeddings)
+    monkeypatch.setattr(revisor_async, "_acliente_vetorial", acliente)
+    return cliente
+
+
+def test_ficha_do_produto_citado_chega_ao_prompt(pipeline):
+    preparo = revisor.preparar_revisao(TEXTO, None, "simples")
+
+    assert preparo.erro is None
+    assert preparo.colecao == "CULTURA"
+    assert preparo.relevant_docs[0].id == FICHA.id
+    assert "dose de 250 mL/ha" in preparo.final_prompt
+    assert pipeline.buscas_por_id == [[FICHA.id]]
+
+
+def test_ficha_do_produto_citado_chega_ao_prompt_async(pipeline):
+    preparo = asyncio.run(revisor_async.apreparar_revisao(TEXTO, None, "simples"))
+
+    assert preparo.erro is None
+    assert preparo.relevant_docs[0].id == FICHA.id
+    assert "dose de 250 mL/ha" in preparo.final_prompt
+
+
+def test_modo_substituir_pula_classificacao_e_embedding(pipeline, monkeypatch):
+    def nao_chamar(*args):
+        raise AssertionError("etapa não deveria rodar no atalho léxico")
+
+    monkeypatch.setattr(revisor, "LEXICO_MODO", "substituir")
+    monkeypatch.setattr(revisor, "classificar_texto", nao_chamar)
+    monkeypatch.setattr(revisor, "embeddings_da_consulta", nao_chamar)
+
+    preparo = revisor.preparar_revisao(TEXTO, None, "simples")
+
+    assert preparo.colecao == "PRODUTO"
+    assert [hit.id for hit in preparo.relevant_docs] == [FICHA.id]
+    assert "dose de 250 mL/ha" in preparo.final_prompt
+
+
+def test_resposta_sem_marcacao_com_o_documento_inteiro_nao_e_encaixada():
+    documento = revisor.Documento("Primeiro parágrafo.\n\nSegundo parágrafo curto.\n\nTerceiro parágrafo.")
+    resposta_documento = (
+        "Primeiro parágrafo.\n\nSegundo parágrafo reescrito.\n\nTerceiro parágrafo.\n\n"
+        f"{revisor.MARCADOR_AJUSTES}\n\n- Ajuste de tom."
+    )
+
+    assert revisor.aplicar_ajuste_paragrafos(documento, [1], resposta_documento) is None
+    assert revisor.aplicar_ajuste_paragrafos(documento, [1], "Segundo parágrafo " * 10) is None
+    assert revisor.aplicar_ajuste_paragrafos(documento, [1], "Segundo parágrafo, mais formal.") == (
+        "Primeiro parágrafo.\n\nSegundo parágrafo, mais formal.\n\nTerceiro parágrafo."
+    )
+
+
+class StreamFalso:
+    """Stream do Chat Completion com um trecho por palavra; registra se foi fechado."""
+    def __init__(self, palavras):
+        self.palavras = palavras
+        self.fechado = False
+
+    def __iter__(self):
+        for palavra in self.palavras:
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=palavra))])
+
+    def close(self):
+        self.fechado = True
+
+
+def test_stream_abandonado_libera_o_slot_do_provedor(monkeypatch):
+    stream = StreamFalso(["Texto ", "revisado ", "em ", "trechos."])
+    cliente = revisor.LLMClient.__new__(revisor.LLMClient)
+    cliente.model = revisor.LLM_MODEL
+    cliente.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: stream)))
+    monkeypatch.setattr(revisor, "get_llm_client", lambda: cliente)
+    em_uso = limite("openai").em_uso
+
+    trechos = cliente.generate_content_stream("prompt")
+    assert next(trechos) == "Texto "
+    assert limite("openai").em_uso == em_uso + 1
+    trechos.close()
+
+    assert limite("openai").em_uso == em_uso
+    assert stream.fechado
+
+    # Abandonado por quem consome o pipeline: o closing fecha também o stream do provedor
+    stream.fechado = False
+    preparo = revisor.PreparoRevisao(colecao="CULTURA", final_prompt="prompt")
+    monkeypatch.setattr(revisor, "preparar_revisao", lambda *args: preparo)
+    with closing(revisor.reescrever_revisor_stream("Texto curto.", usar_cache=False)) as revisao:
+        assert next(revisao) == "Texto "
+
+    assert limite("openai").em_uso == em_uso
+    assert stream.fechado
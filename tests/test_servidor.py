@@ -0,0 +1,44 @@
+import asyncio
+import json
+
+import tornado.httpclient
+import tornado.httpserver
+import tornado.testing
+
+import revisor_async
+import servidor
+from prazos import restante
+from revisor import ErroGeracao
+
+
+def test_prazo_do_servidor_mais_curto_que_o_da_revisao_responde_504(monkeypatch):
+    monkeypatch.setattr(servidor, "SERVIDOR_TIMEOUT_S", 0.3)
+    monkeypatch.setattr(revisor_async, "REVISAO_PRAZO_S", 60.0)
+    prazos_vistos = []
+
+    async def revisar_ate_o_prazo(content, colecao_override, modo_busca, usar_cache):
+        prazos_vistos.append(restante())
+        await asyncio.sleep(min(1.0, restante()))
+        return ErroGeracao("ERRO NA GERAÇÃO DO LLM (Geral): prazo esgotado")
+
+    monkeypatch.setattr(revisor_async, "_areescrever_no_prazo", revisar_ate_o_prazo)
+
+    async def chamar():
+        fila = servidor.FilaTrabalho(workers=1, tamanho=4)
+        fila.iniciar()
+        socket, porta = tornado.testing.bind_unused_port()
+        http = tornado.httpserver.HTTPServer(servidor.criar_app(fila))
+        http.add_sockets([socket])
+        try:
+            return await tornado.httpclient.AsyncHTTPClient().fetch(
+                f"http://127.0.0.1:{porta}/revisao", method="POST",
+                body=json.dumps({"texto": "Texto curto para revisar."}), raise_error=False,
+            )
+        finally:
+            http.stop()
+            await fila.encerrar(timeout=1)
+
+    resposta = asyncio.run(chamar())
+
+    assert resposta.code == 504
+    assert prazos_vistos and prazos_vistos[0] <= 0.3